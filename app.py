@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, render_template, send_file
+from flask import Flask, Response, request, jsonify, render_template
 from flask_cors import CORS
 import libtorrent as lt
 import threading
@@ -7,69 +7,124 @@ import os
 import tempfile
 import json
 from datetime import datetime
-import hashlib
 import shutil
+import atexit
+import concurrent.futures
+import signal
+import sys
 import urllib.parse
 import mimetypes
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import ClosingIterator
 import zipfile
-import io
+from zip_stream import ZipStream, COMPRESSION_MODES, archive_compression, get_manifest
+from file_index import FileIndex, SORT_FIELDS, decode_cursor
+from inotify_watch import DirectoryWatcher
+from bandwidth import BandwidthScheduler, BandwidthError
+from event_stream import EventBroker
+from file_response import send_download, content_disposition, requested_ranges
+from file_selection import (SelectionError, RuleStore, DEFAULT_FILE_PRIORITY, parse_rules, select_files,
+                            file_entries, file_tree)
+from metadata_cache import MetadataCache, hash_keys, is_info_hash
+from json_encoding import JSONProvider, FragmentCache, encoded_object, encoded_array
+from piece_stream import PieceWaiter, FileStream, StreamError, METADATA_TIMEOUT
+from resume_store import ResumeStore
+from torrent_record import TorrentRecord
+from torrent_queue import (QueueScheduler, QueueError, DEFAULT_PRIORITY, PRIORITIES,
+                           LIMIT_SETTINGS, validate_limits)
+from session_profiles import (PROFILES, DEFAULT_PROFILE, ProfileError, build_settings,
+                              load_config, save_config, select_profile)
 
 app = Flask(__name__)
+app.json = JSONProvider(app)
 CORS(app)
 
-# Global session and torrents storage
-session = lt.session()
+# Global torrents storage
 torrents = {}
 download_dir = os.path.join(os.getcwd(), 'downloads')
 
 # Create downloads directory if it doesn't exist
 os.makedirs(download_dir, exist_ok=True)
 
-# Configure session with optimized settings for cloud deployment
-session.listen_on(6881, 6891)
+# Persistent state (fast-resume data) lives on the /app/data volume in Docker
+data_dir = os.environ.get('DATA_DIR', os.path.join(os.getcwd(), 'data'))
 
-# Apply high-performance settings for better speeds
-settings = lt.session_settings()
+# In-memory index of the downloads directory used by the file browser,
+# kept current by inotify where available. The watcher starts before the
+# first scan; changes it sees while a scan runs are re-applied once the
+# scan's result is in place, so none is lost between the two.
+file_index = FileIndex(download_dir)
+DirectoryWatcher(file_index).start()
+file_index.start()
+# Encoded JSON of file entries for the files API, by path
+file_fragments = FragmentCache()
 
-# Connection settings
-settings.connections_limit = 500
-settings.connections_limit_per_torrent = 100
-settings.max_failcount = 3
-settings.max_peer_recv_buffer_size = 1024 * 1024  # 1MB
-settings.max_peer_send_buffer_size = 1024 * 1024  # 1MB
+# Seconds between libtorrent status sweeps feeding the torrents API
+status_update_interval = float(os.environ.get('STATUS_UPDATE_INTERVAL', 1))
 
-# Upload/Download rate limits (0 = unlimited, adjust as needed)
-settings.download_rate_limit = 0  # Unlimited download
-settings.upload_rate_limit = 0    # Unlimited upload (be careful with this)
+# Seconds between re-evaluations of the bandwidth schedule and shares
+bandwidth_update_interval = 10
 
-# DHT and peer exchange settings
-settings.enable_dht = True
-settings.enable_lsd = True  # Local Service Discovery
-settings.enable_upnp = False  # Disable UPnP on cloud servers
-settings.enable_natpmp = False  # Disable NAT-PMP on cloud servers
+# Seconds between saves of changed torrents' fast-resume data
+resume_save_interval = float(os.environ.get('RESUME_SAVE_INTERVAL', 300))
 
-# Choking algorithm (for better performance)
-settings.choking_algorithm = lt.choking_algorithm_t.rate_based_choker
+# Most torrents accepted by one bulk add request, and how long it waits for them
+bulk_add_limit = 1000
+bulk_add_timeout = 60
 
-# Disk cache settings
-settings.cache_size = 512  # 512 MB cache
-settings.cache_expiry = 60
+# Seconds a metadata-only fetch of a magnet may take before it's given up
+metadata_fetch_timeout = 600
 
-# Tracker settings
-settings.tracker_completion_timeout = 30
-settings.tracker_receive_timeout = 10
-settings.stop_tracker_timeout = 5
-settings.announce_to_all_trackers = True
-settings.announce_to_all_tiers = True
+# Removed torrents remembered for /api/torrents?since= deltas
+removed_history = 1000
 
-# Apply settings
-session.set_settings(settings)
+# Peer connections allowed per torrent (a torrent setting in libtorrent 2.x)
+connections_per_torrent = 100
 
-# Add DHT router nodes for better peer discovery
-session.add_dht_router("router.bittorrent.com", 6881)
-session.add_dht_router("dht.transmissionbt.com", 6881)
-session.add_dht_router("router.utorrent.com", 6881)
+# Threads used to deflate ZIP downloads in parallel
+zip_workers = int(os.environ.get('ZIP_WORKERS', os.cpu_count() or 1))
+
+# /api/events and /api/stream clients hold a server thread for as long as
+# they are open; past this many at once they are answered 503, so short
+# requests such as status polls always find a free thread
+open_stream_limit = int(os.environ.get('OPEN_STREAM_LIMIT', max(int(os.environ.get('WEB_THREADS', 32)) // 2, 1)))
+open_streams = threading.BoundedSemaphore(open_stream_limit)
+
+# Internal nginx location serving the downloads directory; when set, file
+# downloads are handed to nginx with X-Accel-Redirect
+x_accel_redirect = os.environ.get('X_ACCEL_REDIRECT')
+
+# Configure the session from a settings_pack profile (SESSION_PROFILE or the
+# session config file, which may also override individual settings)
+session_config_path = os.environ.get('SESSION_CONFIG', os.path.join(data_dir, 'session.json'))
+session_config = load_config(session_config_path)
+session_profile = select_profile(session_config)
+try:
+    session_settings = build_settings(session_profile, session_config.get('settings'))
+except ProfileError as e:
+    print(f"{e}; using the {DEFAULT_PROFILE} profile")
+    session_profile = DEFAULT_PROFILE
+    session_settings = build_settings(DEFAULT_PROFILE)
+
+# Global session
+session = lt.session(session_settings)
+print(f"libtorrent session using the '{session_profile}' profile")
+
+def set_session_profile(profile, overrides=None):
+    """Switch the running session to another profile and remember it in the config file"""
+    global session_profile
+    settings = build_settings(profile, overrides)
+    # Settings overridden before but not now go back to libtorrent's default
+    defaults = lt.default_settings()
+    for name in session_config.get('settings') or {}:
+        if name not in settings:
+            settings[name] = defaults[name]
+    session.apply_settings(settings)
+    
+    session_profile = profile
+    session_config['profile'] = profile
+    session_config['settings'] = overrides or {}
+    save_config(session_config_path, session_config)
 
 def get_storage_info():
     """Get storage information for the downloads directory"""
@@ -77,15 +132,8 @@ def get_storage_info():
         # Get disk usage statistics
         total, used, free = shutil.disk_usage(download_dir)
         
-        # Calculate downloaded content size
-        downloaded_size = 0
-        for root, dirs, files in os.walk(download_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                try:
-                    downloaded_size += os.path.getsize(file_path)
-                except (OSError, IOError):
-                    continue
+        # Downloaded content size comes from the file index, not a disk walk
+        downloaded_size = file_index.downloaded_size()
         
         return {
             'total_storage': total,
@@ -115,140 +163,957 @@ def get_storage_info():
 class TorrentManager:
     def __init__(self):
         self.active_torrents = {}
+        self.lock = threading.RLock()
+        self._alert_thread = None
+        self._running = False
+        # Held for the whole final save; later shutdown() calls return once it's done
+        self._shutdown_lock = threading.Lock()
+        self._shut_down = False
+        # Live updates for /api/events: the last views sent to subscribers and
+        # the torrents that may have changed since
+        self.events = EventBroker()
+        self._published = {}
+        self._dirty = set()
+        self._storage = None
+        # Version counter for conditional and ?since= polling of /api/torrents;
+        # it starts from the clock so versions from a previous run are too old
+        self.version = int(time.time() * 1000)
+        self._changed_at = {}  # torrent id -> version of its last change
+        self._removed_at = {}  # torrent id -> version it was removed in
+        self._history_floor = self.version  # oldest version ?since= can answer
+        self._fragments = {True: FragmentCache(), False: FragmentCache()}  # encoded views, by include_files
+        # Fast-resume data, saved in batches once every requested save has answered
+        self.resume_store = ResumeStore(os.path.join(data_dir, 'resume'))
+        self._outstanding_saves = 0
+        self._saves_done = threading.Event()
+        self._saves_done.set()
+        self._next_resume_save = time.monotonic() + resume_save_interval
+        # Priorities and order of the download queue
+        self.queue = QueueScheduler(os.path.join(data_dir, 'queue.json'))
+        # File rules of magnets, applied when their metadata arrives
+        self.file_rules = RuleStore(os.path.join(data_dir, 'file_rules.json'))
+        # Time-of-day, label and torrent rate limits
+        self.bandwidth = BandwidthScheduler(os.path.join(data_dir, 'bandwidth.json'))
+        self._next_bandwidth_update = 0
+        # Bulk adds waiting for their add_torrent_alert, by torrent id
+        self._pending_adds = {}
+        # Torrent ids are info-hashes; these find a torrent from an alert's
+        # handle, or from any of its v1/v2 hashes, without a scan
+        self._by_handle = {}
+        self._by_hash = {}
+        # /api/stream readers wait here for pieces; open streams by torrent id
+        self.pieces = PieceWaiter()
+        self._streams = {}
+        # Metadata of magnets seen before, and the metadata-only fetches in
+        # progress (torrent id -> (handle, monotonic time to give up))
+        self.metadata_cache = MetadataCache(os.path.join(data_dir, 'metadata'))
+        self._fetches = {}
+        # Folders of finished torrents waiting to be indexed by the alert thread
+        self._finished_paths = []
+    
+    def _build_params(self, torrent_data, is_magnet):
+        """Build add_torrent_params for a magnet link or .torrent file contents"""
+        if is_magnet:
+            # Handle magnet link; one seen before starts with its cached metadata
+            params = lt.parse_magnet_uri(torrent_data)
+            params.ti = self.metadata_cache.get(self._params_id(params))
+        else:
+            # Handle .torrent file
+            params = lt.add_torrent_params()
+            params.ti = lt.torrent_info(torrent_data)
+        params.save_path = download_dir
+        params.storage_mode = lt.storage_mode_t.storage_mode_sparse
+        return params
+    
+    @staticmethod
+    def _hash_id(info_hashes):
+        """Torrent id for an info_hash_t: the v1 info-hash in hex, or the v2 one for v2-only torrents
+        
+        A hybrid magnet only learns its v2 hash with the metadata, so
+        preferring v1 keeps the id stable for the torrent's lifetime.
+        """
+        if info_hashes.has_v1():
+            return str(info_hashes.v1)
+        return str(info_hashes.v2)
+    
+    @classmethod
+    def _params_id(cls, params):
+        """Torrent id of add_torrent_params"""
+        if params.ti is not None:
+            return cls._hash_id(params.ti.info_hashes())
+        return cls._hash_id(params.info_hashes)
     
-    def add_torrent(self, torrent_data, is_magnet=False):
+    def add_torrent(self, torrent_data, is_magnet=False, priority=DEFAULT_PRIORITY,
+                    file_priorities=None, file_rules=None):
+        """Add a torrent, optionally downloading only some of its files
+        
+        file_priorities and file_rules are as for set_file_priorities; a
+        magnet's file list isn't known yet, so it only takes rules.
+        """
+        if priority not in PRIORITIES:
+            return None, False, f"Priority must be one of: {', '.join(PRIORITIES)}"
+        pending_rules = None
+        reserved = None
         try:
-            if is_magnet:
-                # Handle magnet link
-                params = {
-                    'save_path': download_dir,
-                    'storage_mode': lt.storage_mode_t.storage_mode_sparse,
-                }
-                handle = lt.add_magnet_uri(session, torrent_data, params)
-            else:
-                # Handle .torrent file
-                info = lt.torrent_info(torrent_data)
-                params = {
-                    'ti': info,
-                    'save_path': download_dir,
-                    'storage_mode': lt.storage_mode_t.storage_mode_sparse,
-                }
-                handle = session.add_torrent(params)
+            rules = parse_rules(file_rules)
+            params = self._build_params(torrent_data, is_magnet)
+            key = self._params_id(params)
+            with self.lock:
+                # session.add_torrent would return the torrent already there, whose
+                # priority and files must stay as they are; libtorrent matches v2
+                # torrents by their truncated hash too
+                existing = self._find_by_hash(key) or self._find_by_hash(key[:40])
+                if existing:
+                    return existing, False, "Torrent already added"
+                if key in self._pending_adds:
+                    return None, False, "Torrent is being added by another request"
+                # Until it's registered, so a concurrent add or fetch sees it coming
+                self._pending_adds[key] = reserved = concurrent.futures.Future()
+            if params.ti is not None:
+                if file_priorities is not None or rules:
+                    # Set before adding, so skipped files are never allocated
+                    files = params.ti.files()
+                    params.file_priorities = select_files(files, [DEFAULT_FILE_PRIORITY] * files.num_files(),
+                                                          file_priorities, rules)
+            elif file_priorities is not None:
+                return None, False, "File priorities need the torrent's file list; use file rules for magnet links"
+            elif rules:
+                # Stored first, so the metadata can't arrive before its rules
+                pending_rules = key
+                with self.lock:
+                    self.file_rules.set(pending_rules, rules)
+            
+            self._cancel_fetch(key)
+            handle = session.add_torrent(params)
+            handle.set_max_connections(connections_per_torrent)
             
             # Generate unique ID for this torrent
-            torrent_id = hashlib.md5(str(handle.info_hash()).encode()).hexdigest()[:8]
+            torrent_id = self._register(handle, datetime.now())
+            if pending_rules:
+                # In case the metadata arrived before the torrent was registered
+                self._apply_waiting_rules(torrent_id, handle)
+            self.set_priority(torrent_id, priority)
             
-            self.active_torrents[torrent_id] = {
-                'handle': handle,
-                'added_time': datetime.now(),
-                'name': '',
-                'size': 0,
-                'progress': 0,
-                'download_rate': 0,
-                'upload_rate': 0,
-                'status': 'downloading',
-                'peers': 0,
-                'seeds': 0
-            }
+            # Persist it right away so a restart doesn't lose it
+            self._request_resume_save([handle])
             
             return torrent_id, True, "Torrent added successfully"
         except Exception as e:
+            if pending_rules:
+                self.file_rules.pop(pending_rules)
             return None, False, str(e)
+        finally:
+            if reserved:
+                with self.lock:
+                    if self._pending_adds.get(key) is reserved:
+                        del self._pending_adds[key]
     
-    def get_torrent_status(self, torrent_id=None):
-        if torrent_id:
-            if torrent_id in self.active_torrents:
-                return self._get_single_torrent_status(torrent_id)
-            return None
-        else:
-            return {tid: self._get_single_torrent_status(tid) for tid in self.active_torrents}
-    
-    def _get_single_torrent_status(self, torrent_id):
-        torrent_data = self.active_torrents[torrent_id]
-        handle = torrent_data['handle']
-        status = handle.status()
-        
-        # Update torrent information
-        if handle.has_metadata():
-            torrent_data['name'] = handle.name()
-            torrent_data['size'] = status.total_wanted
-        
-        torrent_data['progress'] = status.progress * 100
-        torrent_data['download_rate'] = status.download_rate / 1024  # KB/s
-        torrent_data['upload_rate'] = status.upload_rate / 1024  # KB/s
-        torrent_data['peers'] = status.num_peers
-        torrent_data['seeds'] = status.num_seeds
-        
-        # Determine status
-        if status.is_seeding:
-            torrent_data['status'] = 'seeding'
-        elif status.is_finished:
-            torrent_data['status'] = 'completed'
-        elif status.paused:
-            torrent_data['status'] = 'paused'
-        else:
-            torrent_data['status'] = 'downloading'
+    def add_torrents(self, items, timeout=None):
+        """Add many torrents at once with async_add_torrent
         
-        # Get download info for completed torrents
-        download_files = []
-        if status.is_finished and handle.has_metadata():
+        items is a list of (torrent_data, is_magnet, priority). Every item is
+        parsed first so invalid ones and info-hashes already in the session
+        or earlier in the batch are answered without touching the session;
+        the rest are added asynchronously and their results collected from
+        the add_torrent_alerts. Returns one result dict per item, in order.
+        """
+        results = [None] * len(items)
+        pending = {}  # info-hash key -> (future, indexes of the items adding it)
+        
+        for index, (torrent_data, is_magnet, priority) in enumerate(items):
+            if priority not in PRIORITIES:
+                results[index] = {'status': 'error', 'message': f"Priority must be one of: {', '.join(PRIORITIES)}"}
+                continue
             try:
-                torrent_info = handle.get_torrent_info()
-                save_path = handle.save_path()
-                
-                if torrent_info.num_files() == 1:
-                    # Single file torrent
-                    file_path = torrent_info.files().file_path(0)
-                    full_path = os.path.join(save_path, file_path)
-                    if os.path.exists(full_path):
-                        download_files.append({
-                            'name': os.path.basename(file_path),
-                            'path': file_path,
-                            'size': torrent_info.files().file_size(0)
-                        })
+                params = self._build_params(torrent_data, is_magnet)
+            except Exception as e:
+                results[index] = {'status': 'error', 'message': str(e)}
+                continue
+            
+            key = self._params_id(params)
+            if key in pending:
+                pending[key][1].append(index)
+                continue
+            # libtorrent matches v2 torrents by their truncated hash too
+            existing = self._find_by_hash(key) or self._find_by_hash(key[:40])
+            if existing:
+                results[index] = {'status': 'duplicate', 'torrent_id': existing, 'info_hash': key,
+                                  'message': 'Torrent already added'}
+                continue
+            
+            future = concurrent.futures.Future()
+            with self.lock:
+                if key in self._pending_adds:
+                    results[index] = {'status': 'duplicate', 'info_hash': key,
+                                      'message': 'Torrent is being added by another request'}
+                    continue
+                # Under the lock, so no fetch of the same torrent can start in between
+                self._cancel_fetch(key)
+                self._pending_adds[key] = future
+            pending[key] = (future, [index], priority)
+            session.async_add_torrent(params)
+        
+        done, _ = concurrent.futures.wait([entry[0] for entry in pending.values()],
+                                          timeout=timeout or bulk_add_timeout)
+        
+        added = []
+        for key, (future, indexes, priority) in pending.items():
+            with self.lock:
+                self._pending_adds.pop(key, None)
+            if future not in done:
+                result = {'status': 'error', 'info_hash': key, 'message': 'Timed out waiting for the session'}
+            else:
+                torrent_id, error = future.result()
+                if error:
+                    result = {'status': 'error', 'info_hash': key, 'message': error}
                 else:
-                    # Multi-file torrent
-                    for i in range(torrent_info.num_files()):
-                        file_path = torrent_info.files().file_path(i)
-                        full_path = os.path.join(save_path, file_path)
-                        if os.path.exists(full_path):
-                            download_files.append({
-                                'name': os.path.basename(file_path),
-                                'path': file_path,
-                                'size': torrent_info.files().file_size(i)
-                            })
+                    result = {'status': 'added', 'torrent_id': torrent_id, 'info_hash': key,
+                              'message': 'Torrent added successfully'}
+                    added.append((torrent_id, priority))
+            results[indexes[0]] = result
+            for index in indexes[1:]:
+                results[index] = dict(result, status='duplicate', message='Duplicate of an earlier item')
+        
+        # Queue order, queue file and resume data are updated once for the whole batch
+        handles = []
+        with self.lock:
+            for torrent_id, priority in added:
+                record = self.active_torrents.get(torrent_id)
+                if record:
+                    record.handle.set_max_connections(connections_per_torrent)
+                    self.queue.set_priority(torrent_id, priority)
+                    record.priority = priority
+                    self._dirty.add(torrent_id)
+                    handles.append(record.handle)
+            entries = self._queue_entries()
+        if handles:
+            self.queue.apply(entries)
+            self._request_resume_save(handles)
+        return results
+    
+    def _find_by_hash(self, info_hash):
+        """Return the id of the torrent with this v1 or v2 info-hash (hex), if it's in the session"""
+        return self._by_hash.get(info_hash.lower())
+    
+    def _index_hashes(self, torrent_id, info_hashes):
+        """Index a torrent under its v1 hash and its full and truncated v2 hash"""
+        record = self.active_torrents[torrent_id]
+        keys = set(record.info_hashes)
+        if info_hashes.has_v1():
+            keys.add(str(info_hashes.v1))
+        if info_hashes.has_v2():
+            keys.add(str(info_hashes.v2))
+            keys.add(str(info_hashes.v2)[:40])
+        record.info_hashes = tuple(keys)
+        for key in keys:
+            self._by_hash[key] = torrent_id
+    
+    def _register(self, handle, added_time):
+        """Start tracking a torrent handle that is in the session"""
+        info_hashes = handle.info_hashes()
+        torrent_id = self._hash_id(info_hashes)
+        with self.lock:
+            if torrent_id in self.active_torrents:
+                return torrent_id
+            self.active_torrents[torrent_id] = TorrentRecord(torrent_id, handle, added_time,
+                                                             self.queue.priority(torrent_id),
+                                                             self.bandwidth.label(torrent_id))
+            self._by_handle[handle] = torrent_id
+            self._index_hashes(torrent_id, info_hashes)
+            # Seed the snapshot; later changes arrive through state updates
+            self._apply_status(torrent_id, handle.status())
+            self._publish_changes()
+        return torrent_id
+    
+    def _torrent_id(self, handle):
+        """Id of the torrent behind a handle (from an alert), or None if it isn't tracked"""
+        return self._by_handle.get(handle)
+    
+    def restore(self):
+        """Re-add every torrent saved in the resume store
+        
+        Torrents are added asynchronously from their fast-resume data, so
+        files already verified in the previous run aren't hashed again;
+        each is registered when its add_torrent_alert arrives.
+        """
+        count = 0
+        # Adding in the saved queue order restores the queue positions
+        renamed = False
+        for key, params in self.queue.restore_order(self.resume_store.load()):
+            torrent_id = self._params_id(params)
+            if key != torrent_id:
+                # Saved under an older id scheme; store it under its id from now on
+                self.resume_store.remove(key)
+                self.resume_store.stage(torrent_id, params)
+                self.queue.rename(key, torrent_id)
+                renamed = True
+            if not params.save_path:
+                params.save_path = download_dir
+            session.async_add_torrent(params)
+            count += 1
+        if renamed:
+            self.resume_store.flush()
+        if count:
+            print(f"Restoring {count} torrents from {self.resume_store.directory}")
+        return count
+    
+    def _request_resume_save(self, handles):
+        """Ask libtorrent for resume data; the batch is written when all have answered"""
+        handles = [handle for handle in handles if handle.is_valid()]
+        if not handles:
+            return
+        with self.lock:
+            self._outstanding_saves += len(handles)
+            self._saves_done.clear()
+        for handle in handles:
+            handle.save_resume_data(lt.save_resume_flags_t.save_info_dict)
+    
+    def _resume_save_finished(self):
+        with self.lock:
+            self._outstanding_saves -= 1
+            if self._outstanding_saves > 0:
+                return
+            self._outstanding_saves = 0
+        self._flush_resume_data()
+        self._saves_done.set()
+    
+    def _flush_resume_data(self):
+        try:
+            self.resume_store.flush()
+            self.queue.save(self._queue_entries())
+        except OSError as e:
+            print(f"Error writing resume data: {e}")
+    
+    def _periodic_resume_save(self):
+        """Write whatever the last round staged, then ask for the next round
+        
+        A batch is normally written when its last save answers, so one lost
+        alert would hold every later batch back until shutdown. Saves still
+        outstanding a whole interval later are given up on.
+        """
+        with self.lock:
+            self._outstanding_saves = 0
+            self._saves_done.set()
+        self._flush_resume_data()
+        self.save_resume_data()
+    
+    def save_resume_data(self, all_torrents=False):
+        """Save resume data for torrents that changed (or all of them)"""
+        with self.lock:
+            handles = [record.handle for record in self.active_torrents.values()]
+        if not all_torrents:
+            handles = [handle for handle in handles if handle.need_save_resume_data()]
+        self._request_resume_save(handles)
+    
+    def shutdown(self, timeout=30):
+        """Pause the session and write final resume data for every torrent
+        
+        Safe to call more than once and from any thread (the server's stop
+        signal and the atexit hook both call it); only the first call saves.
+        """
+        with self._shutdown_lock:
+            if self._shut_down:
+                return
+            self._shut_down = True
+            
+            # Stop the alert thread first so nothing is inside libtorrent when
+            # the interpreter tears the session down; alerts are drained here
+            self._running = False
+            if self._alert_thread:
+                self._alert_thread.join(status_update_interval + 5)
+            
+            session.pause()
+            self.save_resume_data(all_torrents=True)
+            deadline = time.monotonic() + timeout
+            while not self._saves_done.is_set() and time.monotonic() < deadline:
+                if session.wait_for_alert(100):
+                    self._handle_alerts(session.pop_alerts())
+            if not self._saves_done.is_set():
+                print("Timed out waiting for resume data")
+            self.resume_store.flush()
+    
+    def start(self):
+        """Start the background thread that keeps torrent status current"""
+        if self._alert_thread:
+            return
+        self._running = True
+        self._alert_thread = threading.Thread(target=self._alert_loop, name='torrent-alerts', daemon=True)
+        self._alert_thread.start()
+    
+    def _alert_loop(self):
+        """Request one status sweep per interval and drain the session's alerts
+        
+        post_torrent_updates() makes libtorrent post a single
+        state_update_alert carrying only the torrents whose status changed
+        since the last sweep, so the cost doesn't grow with the number of
+        API clients polling.
+        """
+        while self._running:
+            try:
+                session.post_torrent_updates()
+                deadline = time.monotonic() + status_update_interval
+                while self._running:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    if session.wait_for_alert(int(remaining * 1000)):
+                        self._handle_alerts(session.pop_alerts())
+                        self._publish_changes()
+                        self._index_finished()
+                self._publish_storage()
+                if self._fetches:
+                    self._expire_fetches()
+                if time.monotonic() >= self._next_bandwidth_update:
+                    self.apply_bandwidth()
+                if time.monotonic() >= self._next_resume_save:
+                    self._next_resume_save = time.monotonic() + resume_save_interval
+                    self._periodic_resume_save()
             except Exception as e:
-                print(f"Error getting download files for torrent {torrent_id}: {e}")
+                print(f"Error processing torrent alerts: {e}")
+                time.sleep(status_update_interval)
+    
+    def _handle_alerts(self, alerts):
+        """Handle a batch of alerts; one that fails doesn't cost the others, resume data saves included"""
+        for alert in alerts:
+            try:
+                self._handle_alert(alert)
+            except Exception as e:
+                print(f"Error handling {type(alert).__name__}: {e}")
+    
+    def _handle_alert(self, alert):
+        if isinstance(alert, lt.state_update_alert):
+            with self.lock:
+                for status in alert.status:
+                    torrent_id = self._torrent_id(status.handle)
+                    if torrent_id in self.active_torrents:
+                        self._apply_status(torrent_id, status)
+        elif isinstance(alert, lt.torrent_finished_alert):
+            torrent_id = self._torrent_id(alert.handle)
+            with self.lock:
+                if torrent_id in self.active_torrents:
+                    self._apply_status(torrent_id, alert.handle.status())
+                    self._cache_download_files(torrent_id)
+        elif isinstance(alert, lt.storage_moved_alert):
+            torrent_id = self._torrent_id(alert.handle)
+            with self.lock:
+                if torrent_id in self.active_torrents:
+                    self.active_torrents[torrent_id].download_files = None
+                    self._dirty.add(torrent_id)
+            self._request_resume_save([alert.handle])
+        elif isinstance(alert, lt.add_torrent_alert):
+            # Torrents restored from resume data and bulk adds are added asynchronously
+            with self.lock:
+                key = self._params_id(alert.params)
+                future = self._pending_adds.pop(key, None)
+                fetch = self._fetches.get(key)
+                if future is None and fetch and fetch[0] == alert.handle:
+                    # Metadata-only fetches aren't torrents of the app
+                    return
+            if alert.error.value():
+                if future:
+                    future.set_result((None, alert.error.message()))
+                else:
+                    print(f"Error restoring torrent {alert.params.name}: {alert.error.message()}")
+            else:
+                # The status keeps the added time recorded in the resume data
+                added_time = alert.handle.status().added_time
+                torrent_id = self._register(alert.handle, datetime.fromtimestamp(added_time) if added_time else datetime.now())
+                if future:
+                    future.set_result((torrent_id, None))
+        elif isinstance(alert, lt.metadata_received_alert):
+            self._cache_metadata(alert.handle)
+            # A hybrid torrent's v2 hash is only known with the metadata
+            with self.lock:
+                torrent_id = self._torrent_id(alert.handle)
+                if torrent_id in self.active_torrents:
+                    self._index_hashes(torrent_id, alert.handle.info_hashes())
+                fetch_id = next((key for key, (handle, _) in self._fetches.items() if handle == alert.handle), None)
+            if fetch_id:
+                # A metadata-only fetch is done
+                self._cancel_fetch(fetch_id)
+                return
+            if torrent_id:
+                self._apply_waiting_rules(torrent_id, alert.handle)
+            self.pieces.notify()
+            # Save again now that the resume data can include the info dict
+            self._request_resume_save([alert.handle])
+        elif isinstance(alert, lt.read_piece_alert):
+            self.pieces.piece_read(alert)
+        elif isinstance(alert, lt.save_resume_data_alert):
+            # Skip torrents removed while their save was in flight
+            torrent_id = self._torrent_id(alert.handle)
+            if torrent_id in self.active_torrents:
+                self.resume_store.stage(torrent_id, alert.params)
+            self._resume_save_finished()
+        elif isinstance(alert, lt.save_resume_data_failed_alert):
+            print(f"Error saving resume data: {alert.message()}")
+            self._resume_save_finished()
+    
+    def _cache_metadata(self, handle):
+        """Keep a torrent's metadata so adding its magnet again is instant"""
+        try:
+            self.metadata_cache.store(handle.torrent_file(), [tracker['url'] for tracker in handle.trackers()])
+        except (OSError, RuntimeError) as e:
+            print(f"Error caching torrent metadata: {e}")
+    
+    def fetch_metadata(self, magnet_link):
+        """Start fetching a magnet's metadata without downloading it; returns get_metadata()
+        
+        The magnet is added in upload mode and outside the queue, so it
+        connects to peers right away but requests no pieces and creates no
+        files. When the metadata arrives it goes to the cache and the
+        torrent is removed again.
+        """
+        params = lt.parse_magnet_uri(magnet_link)
+        torrent_id = self._params_id(params)
+        metadata = self.get_metadata(torrent_id)
+        if metadata:
+            return metadata
+        
+        params.save_path = download_dir
+        params.flags |= lt.torrent_flags.upload_mode
+        params.flags &= ~(lt.torrent_flags.auto_managed | lt.torrent_flags.paused)
+        with self.lock:
+            if torrent_id in self._pending_adds:
+                # A bulk add of this torrent is in flight; adding it here would
+                # return that torrent's handle and take it over
+                return {'status': 'fetching', 'info_hash': torrent_id}
+            if torrent_id not in self._fetches:
+                self._fetches[torrent_id] = (session.add_torrent(params), time.monotonic() + metadata_fetch_timeout)
+        return self.get_metadata(torrent_id)
+    
+    def get_metadata(self, info_hash):
+        """Name, size and files of a torrent by info-hash, once its metadata is known
+        
+        Returns a dict with status 'ready' and the files (as in get_files,
+        with the default priority), or status 'fetching' while a fetch or
+        download is still looking for it; None for unknown torrents.
+        """
+        info_hash = info_hash.lower()
+        if not is_info_hash(info_hash):
+            return None
+        torrent_info = self.metadata_cache.get(info_hash)
+        torrent_id = self._find_by_hash(info_hash)
+        record = self.active_torrents.get(torrent_id)
+        if torrent_info is None and record:
+            torrent_info = record.handle.torrent_file()
+        if torrent_info is None:
+            if record or info_hash in self._fetches or info_hash in self._pending_adds:
+                return {'status': 'fetching', 'info_hash': info_hash}
+            return None
         
+        files = torrent_info.files()
+        entries = file_entries(files, [DEFAULT_FILE_PRIORITY] * files.num_files(), [0] * files.num_files())
         return {
-            'id': torrent_id,
-            'name': torrent_data['name'] or f"Torrent {torrent_id}",
-            'size': torrent_data['size'],
-            'progress': round(torrent_data['progress'], 2),
-            'download_rate': round(torrent_data['download_rate'], 2),
-            'upload_rate': round(torrent_data['upload_rate'], 2),
-            'status': torrent_data['status'],
-            'peers': torrent_data['peers'],
-            'seeds': torrent_data['seeds'],
-            'added_time': torrent_data['added_time'].strftime('%Y-%m-%d %H:%M:%S'),
-            'download_files': download_files
+            'status': 'ready',
+            'info_hash': info_hash,
+            'info_hashes': hash_keys(torrent_info.info_hashes()),
+            'torrent_id': torrent_id if record else None,
+            'name': torrent_info.name(),
+            'size': torrent_info.total_size(),
+            'files': entries,
+            'tree': file_tree(entries),
         }
     
+    def _cancel_fetch(self, torrent_id):
+        """Remove a metadata-only fetch from the session, if there is one"""
+        with self.lock:
+            fetch = self._fetches.pop(torrent_id, None)
+        if fetch:
+            session.remove_torrent(fetch[0])
+    
+    def _expire_fetches(self):
+        """Give up fetches that took too long, and end any whose metadata arrived unnoticed"""
+        now = time.monotonic()
+        with self.lock:
+            done = [key for key, (handle, expires) in self._fetches.items()
+                    if now >= expires or not handle.is_valid() or handle.torrent_file() is not None]
+        for key in done:
+            self._cancel_fetch(key)
+    
+    def subscribe(self):
+        """Register an /api/events client, starting it from the last published state"""
+        with self.lock:
+            initial = [('snapshot', {'torrents': dict(self._published), 'storage': self._storage})]
+            return self.events.subscribe(*initial)
+    
+    def _publish_changes(self):
+        """Send the fields that changed on dirty torrents, plus added and removed ones"""
+        with self.lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, set()
+            changed = {}
+            removed = []
+            for torrent_id in dirty:
+                if torrent_id not in self.active_torrents:
+                    if self._published.pop(torrent_id, None) is not None:
+                        removed.append(torrent_id)
+                        for fragments in self._fragments.values():
+                            fragments.discard(torrent_id)
+                    continue
+                view = self._get_single_torrent_status(torrent_id)
+                previous = self._published.get(torrent_id)
+                self._published[torrent_id] = view
+                if previous is None:
+                    changed[torrent_id] = view
+                else:
+                    fields = {key: value for key, value in view.items() if previous.get(key) != value}
+                    if fields:
+                        changed[torrent_id] = fields
+            if changed or removed:
+                self._record_version(changed, removed)
+                self.events.publish('torrents', {'changed': changed, 'removed': removed})
+    
+    def _record_version(self, changed, removed):
+        self.version += 1
+        for torrent_id in changed:
+            self._changed_at[torrent_id] = self.version
+            # Ids are info-hashes, so a removed torrent can come back
+            self._removed_at.pop(torrent_id, None)
+        for torrent_id in removed:
+            self._changed_at.pop(torrent_id, None)
+            self._removed_at[torrent_id] = self.version
+        
+        # Forget the oldest removals; clients further behind get a full list
+        while len(self._removed_at) > removed_history:
+            torrent_id = next(iter(self._removed_at))
+            self._history_floor = self._removed_at.pop(torrent_id)
+    
+    def current_version(self):
+        """The torrents API version, once any pending changes are published"""
+        with self.lock:
+            self._publish_changes()
+            return self.version
+    
+    def etag(self, version, include_files):
+        return f"{version}-files" if include_files else str(version)
+    
+    def get_changes(self, since=None, include_files=False):
+        """Return (version, torrents, removed ids, full) for the torrents API
+        
+        With since, only torrents changed after that version are returned
+        along with the ids removed since; full is True when since is too old
+        (or from a previous run) and every torrent is returned instead.
+        torrents is Encoded JSON, built from each view's cached encoding.
+        """
+        with self.lock:
+            self._publish_changes()
+            full = since is None or since < self._history_floor or since > self.version
+            if full:
+                torrent_ids = list(self._published)
+                removed = []
+            else:
+                torrent_ids = [tid for tid, version in self._changed_at.items() if version > since]
+                removed = [tid for tid, version in self._removed_at.items() if version > since]
+            
+            fragments = self._fragments[include_files]
+            view = None if include_files else _without_files
+            torrents = encoded_object(fragments.member(torrent_id, self._published[torrent_id], view)
+                                      for torrent_id in torrent_ids)
+            return self.version, torrents, removed, full
+    
+    def _publish_storage(self):
+        if not self.events.subscriber_count():
+            return
+        storage = get_storage_info()
+        if storage != self._storage:
+            self._storage = storage
+            self.events.publish('storage', storage)
+    
+    def get_torrent_status(self, torrent_id=None, include_files=True):
+        with self.lock:
+            if torrent_id:
+                if torrent_id in self.active_torrents:
+                    return self._get_single_torrent_status(torrent_id, include_files)
+                return None
+            else:
+                return {tid: self._get_single_torrent_status(tid, include_files) for tid in self.active_torrents}
+    
+    def _apply_status(self, torrent_id, status):
+        """Update the torrent's record from a libtorrent torrent_status"""
+        record = self.active_torrents[torrent_id]
+        if record.update(status):
+            self._dirty.add(torrent_id)
+        
+        # Pick up the finished files in the file index once; inotify already
+        # has them when it watches the downloads, otherwise they are indexed
+        # by the alert thread outside the manager lock
+        if record.is_finished and record.has_metadata and not record.indexed:
+            if not file_index.watched:
+                self._finished_paths.append(record.name)
+            record.indexed = True
+    
+    def _index_finished(self):
+        """Index the files of torrents that finished since the last call"""
+        with self.lock:
+            paths, self._finished_paths = self._finished_paths, []
+        for path in paths:
+            file_index.update_tree(path)
+    
+    def _cache_download_files(self, torrent_id):
+        """List a finished torrent's files that are on disk and store them on its record"""
+        record = self.active_torrents[torrent_id]
+        handle = record.handle
+        download_files = []
+        try:
+            torrent_info = handle.get_torrent_info()
+            save_path = handle.save_path()
+            files = torrent_info.files()
+            
+            for i in range(torrent_info.num_files()):
+                file_path = files.file_path(i)
+                full_path = os.path.join(save_path, file_path)
+                if os.path.exists(full_path):
+                    download_files.append({
+                        'name': os.path.basename(file_path),
+                        'path': file_path,
+                        'size': files.file_size(i)
+                    })
+        except Exception as e:
+            print(f"Error getting download files for torrent {torrent_id}: {e}")
+            return []
+        
+        record.download_files = download_files
+        self._dirty.add(torrent_id)
+        return download_files
+    
+    def invalidate_download_files(self, rel_path):
+        """Drop cached file lists that include rel_path or anything below it"""
+        prefix = rel_path.rstrip('/') + '/'
+        with self.lock:
+            for torrent_id, record in self.active_torrents.items():
+                cached = record.download_files
+                if cached and any(f['path'] == rel_path or f['path'].startswith(prefix) for f in cached):
+                    record.download_files = None
+                    self._dirty.add(torrent_id)
+    
+    def _get_single_torrent_status(self, torrent_id, include_files=True):
+        """Build the API view of a torrent from the last status snapshot"""
+        record = self.active_torrents[torrent_id]
+        
+        # File lists of finished torrents are built once and reused until
+        # a delete or storage move invalidates them
+        if include_files and record.files_pending:
+            self._cache_download_files(torrent_id)
+        
+        return record.to_dict(include_files)
+    
     def pause_torrent(self, torrent_id):
-        if torrent_id in self.active_torrents:
-            self.active_torrents[torrent_id]['handle'].pause()
+        record = self.active_torrents.get(torrent_id)
+        if record:
+            # Take it out of the queue, or the scheduler would start it again
+            record.handle.unset_flags(lt.torrent_flags.auto_managed)
+            record.handle.pause()
             return True
         return False
     
     def resume_torrent(self, torrent_id):
-        if torrent_id in self.active_torrents:
-            self.active_torrents[torrent_id]['handle'].resume()
+        record = self.active_torrents.get(torrent_id)
+        if record:
+            # Back into the queue; it starts when a slot is free
+            record.handle.set_flags(lt.torrent_flags.auto_managed)
+            record.handle.resume()
             return True
         return False
     
+    def get_files(self, torrent_id):
+        """A torrent's files with their priorities and progress, as a list and as a folder tree
+        
+        Returns None for unknown torrents. Before a magnet's metadata
+        arrives the lists are empty and rules shows its pending file rules.
+        """
+        record = self.active_torrents.get(torrent_id)
+        if not record:
+            return None
+        handle = record.handle
+        torrent_info = handle.torrent_file()
+        if torrent_info is None:
+            return {'has_metadata': False, 'files': [], 'tree': [], 'rules': self.file_rules.get(torrent_id)}
+        entries = file_entries(torrent_info.files(), handle.get_file_priorities(),
+                               handle.file_progress(lt.torrent_handle.piece_granularity))
+        return {'has_metadata': True, 'files': entries, 'tree': file_tree(entries), 'rules': None}
+    
+    def set_file_priorities(self, torrent_id, priorities=None, file_rules=None):
+        """Choose which files of a torrent download
+        
+        priorities is a list with a priority per file or a dict of file
+        index to priority (0-7, or skip/low/normal/high); file_rules select
+        files by glob, extension and size (see file_selection.parse_rules).
+        A torrent without metadata keeps the rules until it arrives.
+        Raises SelectionError for invalid input.
+        """
+        rules = parse_rules(file_rules)
+        record = self.active_torrents.get(torrent_id)
+        if not record:
+            return False
+        handle = record.handle
+        if handle.torrent_file() is None:
+            if priorities is not None:
+                raise SelectionError("The torrent's file list isn't known until its metadata arrives; use file rules")
+            if rules:
+                with self.lock:
+                    self.file_rules.set(torrent_id, rules)
+                # The metadata may have arrived since the check, after its
+                # alert looked for rules
+                if self._apply_waiting_rules(torrent_id, handle):
+                    self._request_resume_save([handle])
+            return True
+        self._select_files(handle, priorities, rules)
+        self._request_resume_save([handle])
+        return True
+    
+    def _apply_waiting_rules(self, torrent_id, handle):
+        """Apply the file rules waiting for a torrent's metadata once it's there; returns True if it is"""
+        if handle.torrent_file() is None:
+            return False
+        with self.lock:
+            rules = self.file_rules.pop(torrent_id)
+        if rules:
+            self._select_files(handle, rules=rules)
+        return True
+    
+    @staticmethod
+    def _select_files(handle, priorities=None, rules=None):
+        """Apply priorities and rules to a torrent with metadata, in one prioritize_files call"""
+        files = handle.torrent_file().files()
+        handle.prioritize_files(select_files(files, handle.get_file_priorities(), priorities, rules))
+    
+    def open_stream(self, torrent_id, file_index):
+        """Start streaming a file of a torrent: sequential download, and the torrent running
+        
+        A magnet's stream waits up to METADATA_TIMEOUT for the metadata.
+        Raises StreamError if the torrent or file doesn't exist.
+        """
+        record = self.active_torrents.get(torrent_id)
+        if not record:
+            raise StreamError('Torrent not found', 404)
+        handle = record.handle
+        if not self.pieces.wait_for(lambda: not handle.is_valid() or handle.torrent_file() is not None,
+                                    METADATA_TIMEOUT):
+            raise StreamError('Timed out waiting for the torrent metadata', 504)
+        if not handle.is_valid():
+            raise StreamError('Torrent not found', 404)
+        files = handle.torrent_file().files()
+        if not 0 <= file_index < files.num_files() or files.file_flags(file_index) & lt.file_storage.flag_pad_file:
+            raise StreamError('File not found', 404)
+        
+        stream = FileStream(handle, file_index, self.pieces, handle.save_path())
+        with self.lock:
+            self._streams[torrent_id] = self._streams.get(torrent_id, 0) + 1
+        handle.set_flags(lt.torrent_flags.sequential_download)
+        if handle.file_priority(file_index) == 0:
+            handle.file_priority(file_index, 4)
+        if handle.status().paused:
+            # Someone is watching: start it first in the queue
+            handle.queue_position_top()
+            handle.set_flags(lt.torrent_flags.auto_managed)
+            handle.resume()
+        return stream
+    
+    def close_stream(self, torrent_id):
+        """Back to rarest-first download once the torrent's last stream ends"""
+        with self.lock:
+            count = self._streams.pop(torrent_id, 0) - 1
+            if count > 0:
+                self._streams[torrent_id] = count
+                return
+            record = self.active_torrents.get(torrent_id)
+        if record:
+            record.handle.unset_flags(lt.torrent_flags.sequential_download)
+    
+    def apply_bandwidth(self):
+        """Apply the rate limits in force to the session and the torrents"""
+        with self.lock:
+            self._next_bandwidth_update = time.monotonic() + bandwidth_update_interval
+            entries = [(torrent_id, record.handle, record.status) for torrent_id, record in self.active_torrents.items()]
+            return self.bandwidth.apply(session, entries)
+    
+    def update_bandwidth(self, schedule=None, default=None, labels=None):
+        """Change the schedule, default limits or label limits and apply them now"""
+        with self.lock:
+            self.bandwidth.update(schedule, default, labels)
+            self.bandwidth.save()
+        self.apply_bandwidth()
+    
+    def set_label(self, torrent_id, label):
+        """Put a torrent under a bandwidth label (None for no label)"""
+        with self.lock:
+            record = self.active_torrents.get(torrent_id)
+            if not record:
+                return False
+            self.bandwidth.set_label(torrent_id, label)
+            self.bandwidth.save()
+            record.label = self.bandwidth.label(torrent_id)
+            self._dirty.add(torrent_id)
+        self.apply_bandwidth()
+        return True
+    
+    def set_torrent_limits(self, torrent_id, limits):
+        """Set a torrent's own download/upload limits in KB/s"""
+        with self.lock:
+            if torrent_id not in self.active_torrents:
+                return False
+            self.bandwidth.set_torrent_limits(torrent_id, limits)
+            self.bandwidth.save()
+        self.apply_bandwidth()
+        return True
+    
+    def _queue_entries(self):
+        with self.lock:
+            return [(torrent_id, record.handle) for torrent_id, record in self.active_torrents.items()]
+    
+    def set_priority(self, torrent_id, priority):
+        """Change a torrent's priority band and reorder the queue"""
+        with self.lock:
+            if torrent_id not in self.active_torrents:
+                return False
+            self.queue.set_priority(torrent_id, priority)
+            self.active_torrents[torrent_id].priority = priority
+            self._dirty.add(torrent_id)
+            entries = self._queue_entries()
+        self.queue.apply(entries)
+        self.queue.save(entries)
+        return True
+    
+    def move_in_queue(self, torrent_id, action):
+        """Move a torrent top/up/down/bottom within its priority band"""
+        with self.lock:
+            if torrent_id not in self.active_torrents:
+                return False
+            handle = self.active_torrents[torrent_id].handle
+            entries = self._queue_entries()
+        self.queue.move(handle, action, entries)
+        self.queue.save(entries)
+        return True
+    
+    def get_queue(self):
+        """Torrents waiting in or running from the download queue, in queue order"""
+        with self.lock:
+            queued = []
+            for torrent_id, record in self.active_torrents.items():
+                position = record.handle.queue_position()
+                if position >= 0:
+                    queued.append((position, {
+                        'id': torrent_id,
+                        'name': record.name,
+                        'priority': record.priority,
+                        'queue_position': position,
+                        'status': record.status,
+                    }))
+        return [entry for _, entry in sorted(queued, key=lambda item: item[0])]
+    
     def remove_torrent(self, torrent_id, delete_files=False):
-        if torrent_id in self.active_torrents:
-            handle = self.active_torrents[torrent_id]['handle']
+        # Take the record out first so a concurrent request can't remove it twice
+        with self.lock:
+            record = self.active_torrents.pop(torrent_id, None)
+            if record:
+                # Drop the lookups while the handle still hashes to the torrent
+                self._by_handle.pop(record.handle, None)
+                for info_hash in record.info_hashes:
+                    self._by_hash.pop(info_hash, None)
+        if record:
+            handle = record.handle
             
             # Get file path before removing torrent
             if delete_files and handle.has_metadata():
@@ -266,11 +1131,13 @@ class TorrentManager:
                         file_path = os.path.join(save_path, torrent_info.files().file_path(0))
                         if os.path.exists(file_path):
                             os.remove(file_path)
+                        file_index.remove_file(torrent_info.files().file_path(0))
                     else:
                         # Multi-file torrent - remove the entire folder
                         folder_path = os.path.join(save_path, torrent_info.name())
                         if os.path.exists(folder_path):
                             shutil.rmtree(folder_path)
+                        file_index.remove_tree(torrent_info.name())
                             
                 except Exception as e:
                     print(f"Error deleting files for torrent {torrent_id}: {e}")
@@ -278,46 +1145,34 @@ class TorrentManager:
                 # Just remove from session without deleting files
                 session.remove_torrent(handle)
             
-            del self.active_torrents[torrent_id]
+            self.resume_store.remove(torrent_id)
+            self.resume_store.flush()
+            self.queue.forget(torrent_id)
+            self.file_rules.pop(torrent_id)
+            with self.lock:
+                self.bandwidth.forget(torrent_id)
+                self.bandwidth.save()
+                self._dirty.add(torrent_id)
+                self._publish_changes()
+            self.queue.save(self._queue_entries())
             return True
         return False
 
+def _without_files(view):
+    return {key: value for key, value in view.items() if key != 'download_files'}
+
+def _encoded_files(files):
+    """Encode a list of file index entries, reusing the JSON of unchanged ones"""
+    return encoded_array(file_fragments.encode(entry['path'], entry) for entry in files)
+
+def _json_field(form, name):
+    """A JSON-encoded form field, or None when it's missing"""
+    value = form.get(name)
+    return json.loads(value) if value else None
+
 def get_downloaded_files():
     """Get a list of all downloaded files and folders"""
-    files_list = []
-    
-    try:
-        for root, dirs, files in os.walk(download_dir):
-            # Get relative path from downloads directory
-            rel_path = os.path.relpath(root, download_dir)
-            if rel_path == '.':
-                rel_path = ''
-            
-            for file in files:
-                file_path = os.path.join(root, file)
-                file_size = os.path.getsize(file_path)
-                file_modified = datetime.fromtimestamp(os.path.getmtime(file_path))
-                
-                # Get file extension and determine type
-                _, ext = os.path.splitext(file)
-                mime_type, _ = mimetypes.guess_type(file)
-                
-                file_info = {
-                    'name': file,
-                    'path': os.path.join(rel_path, file).replace('\\', '/') if rel_path else file,
-                    'size': file_size,
-                    'size_mb': round(file_size / (1024 * 1024), 2),
-                    'modified': file_modified.strftime('%Y-%m-%d %H:%M:%S'),
-                    'extension': ext.lower(),
-                    'mime_type': mime_type or 'application/octet-stream',
-                    'folder': rel_path.replace('\\', '/') if rel_path else 'root'
-                }
-                files_list.append(file_info)
-                
-    except Exception as e:
-        print(f"Error scanning downloads directory: {e}")
-    
-    return files_list
+    return file_index.list_files()
 
 def is_safe_path(path):
     """Check if the path is safe and doesn't contain directory traversal attempts"""
@@ -334,6 +1189,9 @@ def is_safe_path(path):
 
 # Initialize torrent manager
 torrent_manager = TorrentManager()
+torrent_manager.restore()
+torrent_manager.start()
+atexit.register(torrent_manager.shutdown)
 
 # Routes
 @app.route('/')
@@ -353,7 +1211,11 @@ def add_torrent():
             file = request.files['torrent_file']
             if file and file.filename and file.filename.endswith('.torrent'):
                 torrent_data = file.read()
-                torrent_id, success, message = torrent_manager.add_torrent(torrent_data, is_magnet=False)
+                priority = request.form.get('priority', DEFAULT_PRIORITY)
+                torrent_id, success, message = torrent_manager.add_torrent(
+                    torrent_data, is_magnet=False, priority=priority,
+                    file_priorities=_json_field(request.form, 'file_priorities'),
+                    file_rules=_json_field(request.form, 'file_rules'))
             else:
                 return jsonify({'success': False, 'message': 'Invalid file format or no file selected'})
         elif request.is_json:
@@ -361,7 +1223,10 @@ def add_torrent():
             data = request.get_json()
             if 'magnet_link' in data:
                 magnet_link = data['magnet_link']
-                torrent_id, success, message = torrent_manager.add_torrent(magnet_link, is_magnet=True)
+                priority = data.get('priority', DEFAULT_PRIORITY)
+                torrent_id, success, message = torrent_manager.add_torrent(
+                    magnet_link, is_magnet=True, priority=priority,
+                    file_priorities=data.get('file_priorities'), file_rules=data.get('file_rules'))
             else:
                 return jsonify({'success': False, 'message': 'No magnet link provided'})
         else:
@@ -369,24 +1234,149 @@ def add_torrent():
         
         if success:
             return jsonify({'success': True, 'torrent_id': torrent_id, 'message': message})
+        elif torrent_id:
+            # Already in the session
+            return jsonify({'success': False, 'duplicate': True, 'torrent_id': torrent_id, 'message': message})
         else:
             return jsonify({'success': False, 'message': message})
     
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/api/add_torrents/bulk', methods=['POST'])
+def add_torrents_bulk():
+    """Add many magnets / .torrent files in one request
+    
+    Accepts a JSON array (or {"torrents": [...]}) of magnet links or
+    {"magnet_link": ..., "priority": ...} objects, or a multipart form with
+    any number of torrent_files and magnet_link fields (magnet_links may
+    hold several, one per line). Returns a result per item, in order.
+    """
+    try:
+        items = []
+        if request.is_json:
+            data = request.get_json(silent=True)
+            default_priority = DEFAULT_PRIORITY
+            if isinstance(data, dict):
+                default_priority = data.get('priority', DEFAULT_PRIORITY)
+                data = data.get('torrents')
+            if not isinstance(data, list):
+                return jsonify({'success': False, 'message': 'Expected a JSON array of torrents'}), 400
+            for entry in data:
+                if isinstance(entry, dict):
+                    items.append((entry.get('magnet_link') or '', True, entry.get('priority', default_priority)))
+                else:
+                    items.append((str(entry), True, default_priority))
+        else:
+            priority = request.form.get('priority', DEFAULT_PRIORITY)
+            for file in request.files.getlist('torrent_files') + request.files.getlist('torrent_file'):
+                items.append((file.read(), False, priority))
+            magnets = request.form.getlist('magnet_link')
+            for block in request.form.getlist('magnet_links'):
+                magnets.extend(line.strip() for line in block.splitlines() if line.strip())
+            items.extend((magnet, True, priority) for magnet in magnets)
+        
+        if not items:
+            return jsonify({'success': False, 'message': 'No torrent data provided'}), 400
+        if len(items) > bulk_add_limit:
+            return jsonify({'success': False, 'message': f'At most {bulk_add_limit} torrents per request'}), 400
+        
+        results = torrent_manager.add_torrents(items)
+        counts = {status: sum(1 for r in results if r['status'] == status) for status in ('added', 'duplicate', 'error')}
+        return jsonify({'success': True, 'results': results, **counts})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/metadata', methods=['POST'])
+def fetch_metadata():
+    """Fetch a magnet's name and file list without downloading it
+    
+    Answers 200 with the files when the metadata is already known (cached
+    or in the session) and 202 while it's being fetched; poll
+    /api/metadata/<info_hash> for the result.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        magnet_link = data.get('magnet_link')
+        if not magnet_link:
+            return jsonify({'success': False, 'message': 'No magnet link provided'}), 400
+        metadata = torrent_manager.fetch_metadata(magnet_link)
+        return jsonify({'success': True, **metadata}), 200 if metadata['status'] == 'ready' else 202
+    except RuntimeError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/metadata/<info_hash>', methods=['GET'])
+def get_metadata(info_hash):
+    """Result of a metadata fetch: 200 with the files, 202 while fetching"""
+    try:
+        metadata = torrent_manager.get_metadata(info_hash)
+        if metadata is None:
+            return jsonify({'success': False, 'message': 'Torrent not found'}), 404
+        return jsonify({'success': True, **metadata}), 200 if metadata['status'] == 'ready' else 202
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/api/torrents', methods=['GET'])
 def get_torrents():
+    """List torrents, answering 304 when nothing changed or only the changes with ?since="""
     try:
-        torrents = torrent_manager.get_torrent_status()
-        return jsonify({'success': True, 'torrents': torrents})
+        include_files = request.args.get('files') == '1'
+        since = request.args.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                return jsonify({'success': False, 'message': 'since must be a version number'}), 400
+        
+        # Compare the ETag before building anything: most polls end here
+        etag = torrent_manager.etag(torrent_manager.current_version(), include_files)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        
+        version, torrents, removed, full = torrent_manager.get_changes(since, include_files)
+        etag = torrent_manager.etag(version, include_files)
+        result = {'success': True, 'torrents': torrents, 'version': version}
+        if since is not None:
+            result['removed'] = removed
+            result['full'] = full
+        response = jsonify(result)
+        response.set_etag(etag)
+        return response
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+def too_many_streams():
+    response = jsonify({'success': False, 'message': 'Too many open streams, try again later'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '10'
+    return response
+
+@app.route('/api/events', methods=['GET'])
+def torrent_events():
+    """Push torrent and storage changes as Server-Sent Events"""
+    if not open_streams.acquire(blocking=False):
+        return too_many_streams()
+    subscriber = torrent_manager.subscribe()
+    
+    def close():
+        torrent_manager.events.unsubscribe(subscriber)
+        open_streams.release()
+    
+    # Closed by the server when the client goes away, even before the first event
+    return Response(ClosingIterator(subscriber.stream(), close), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
 @app.route('/api/torrent/<torrent_id>', methods=['GET'])
 def get_torrent(torrent_id):
     try:
-        torrent = torrent_manager.get_torrent_status(torrent_id)
+        include_files = request.args.get('files') != '0'
+        torrent = torrent_manager.get_torrent_status(torrent_id, include_files=include_files)
         if torrent:
             return jsonify({'success': True, 'torrent': torrent})
         else:
@@ -431,6 +1421,137 @@ def remove_torrent(torrent_id):
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/api/torrent/<torrent_id>/files', methods=['GET'])
+def get_torrent_files(torrent_id):
+    """List a torrent's files with sizes, priorities and progress, as soon as its metadata is known"""
+    try:
+        files = torrent_manager.get_files(torrent_id)
+        if files is None:
+            return jsonify({'success': False, 'message': 'Torrent not found'}), 404
+        return jsonify({'success': True, **files})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/torrent/<torrent_id>/files', methods=['POST'])
+def set_torrent_files(torrent_id):
+    """Set file priorities ({"priorities": [...] or {index: priority}}) and/or file rules ({"rules": {...}})"""
+    try:
+        data = request.get_json(silent=True) or {}
+        success = torrent_manager.set_file_priorities(torrent_id, data.get('priorities'), data.get('rules'))
+        if success:
+            return jsonify({'success': True, **torrent_manager.get_files(torrent_id)})
+        else:
+            return jsonify({'success': False, 'message': 'Torrent not found'}), 404
+    except SelectionError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/torrent/<torrent_id>/priority', methods=['POST'])
+def set_torrent_priority(torrent_id):
+    """Set a torrent's queue priority (high, normal or low)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        success = torrent_manager.set_priority(torrent_id, data.get('priority'))
+        if success:
+            return jsonify({'success': True, 'message': f"Priority set to {data['priority']}"})
+        else:
+            return jsonify({'success': False, 'message': 'Torrent not found'}), 404
+    except QueueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/torrent/<torrent_id>/label', methods=['POST'])
+def set_torrent_label(torrent_id):
+    """Put a torrent under a bandwidth label ({"label": "tv"}, null for none)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        success = torrent_manager.set_label(torrent_id, data.get('label'))
+        if success:
+            return jsonify({'success': True, 'label': data.get('label') or None})
+        else:
+            return jsonify({'success': False, 'message': 'Torrent not found'}), 404
+    except BandwidthError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/torrent/<torrent_id>/limits', methods=['POST'])
+def set_torrent_limits(torrent_id):
+    """Set a torrent's download/upload limits in KB/s ({"download": 500, "upload": 0}; 0 is unlimited)"""
+    try:
+        data = request.get_json(silent=True)
+        success = torrent_manager.set_torrent_limits(torrent_id, data if data is not None else {})
+        if success:
+            return jsonify({'success': True, 'limits': torrent_manager.bandwidth.torrents.get(torrent_id, {})})
+        else:
+            return jsonify({'success': False, 'message': 'Torrent not found'}), 404
+    except BandwidthError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/torrent/<torrent_id>/queue', methods=['POST'])
+def move_torrent_in_queue(torrent_id):
+    """Move a torrent top, up, down or bottom within its priority band"""
+    try:
+        data = request.get_json(silent=True) or {}
+        success = torrent_manager.move_in_queue(torrent_id, data.get('action'))
+        if success:
+            return jsonify({'success': True, 'queue': torrent_manager.get_queue()})
+        else:
+            return jsonify({'success': False, 'message': 'Torrent not found'}), 404
+    except QueueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/queue', methods=['GET'])
+def get_queue():
+    """Get the download queue in order and the active torrent limits"""
+    try:
+        settings = session.get_settings()
+        limits = {name: settings[name] for name in LIMIT_SETTINGS}
+        return jsonify({'success': True, 'queue': torrent_manager.get_queue(), 'limits': limits})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/queue/limits', methods=['POST'])
+def set_queue_limits():
+    """Change the active download/seed/checking limits of the running session"""
+    try:
+        limits = validate_limits(request.get_json(silent=True))
+        # Stored as overrides of the active profile so they survive restarts
+        overrides = dict(session_config.get('settings') or {})
+        overrides.update(limits)
+        set_session_profile(session_profile, overrides)
+        return jsonify({'success': True, 'limits': limits})
+    except QueueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/bandwidth', methods=['GET'])
+def get_bandwidth():
+    """Get the bandwidth schedule, the limits in force and the label and torrent limits"""
+    try:
+        return jsonify({'success': True, **torrent_manager.bandwidth.to_dict()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/bandwidth', methods=['POST'])
+def update_bandwidth():
+    """Change the schedule, default limits and/or label limits of the running session"""
+    try:
+        data = request.get_json(silent=True) or {}
+        torrent_manager.update_bandwidth(data.get('schedule'), data.get('default'), data.get('labels'))
+        return jsonify({'success': True, **torrent_manager.bandwidth.to_dict()})
+    except BandwidthError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/api/storage', methods=['GET'])
 def get_storage():
     try:
@@ -439,18 +1560,93 @@ def get_storage():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/api/session/profile', methods=['GET'])
+def get_session_profile():
+    """Get the active session profile and the ones available"""
+    return jsonify({
+        'success': True,
+        'profile': session_profile,
+        'overrides': session_config.get('settings') or {},
+        'profiles': {name: profile['description'] for name, profile in PROFILES.items()},
+    })
+
+@app.route('/api/session/profile', methods=['POST'])
+def update_session_profile():
+    """Switch the running session to another profile, with optional setting overrides"""
+    try:
+        data = request.get_json(silent=True) or {}
+        profile = data.get('profile', session_profile)
+        overrides = data.get('settings') or {}
+        if not isinstance(overrides, dict):
+            return jsonify({'success': False, 'message': 'settings must be an object'}), 400
+        
+        set_session_profile(profile, overrides)
+        return jsonify({'success': True, 'profile': profile, 'overrides': overrides,
+                        'message': f"Session switched to the '{profile}' profile"})
+    except ProfileError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/api/files', methods=['GET'])
 def get_files():
-    """Get list of all downloaded files"""
+    """Get downloaded files, optionally one sorted/filtered page at a time
+    
+    Query parameters: limit, cursor (from the previous page's next_cursor),
+    sort (name, size or modified, prefix with '-' for descending), folder,
+    ext (comma separated) and q (name search). Without any of them the whole
+    list is returned as before.
+    """
     try:
-        files = get_downloaded_files()
-        return jsonify({'success': True, 'files': files})
+        if not request.args:
+            files = get_downloaded_files()
+            return jsonify({'success': True, 'files': _encoded_files(files), 'total': len(files)})
+        
+        sort = request.args.get('sort', 'name')
+        descending = sort.startswith('-')
+        sort = sort.lstrip('-')
+        if sort not in SORT_FIELDS:
+            return jsonify({'success': False, 'message': f'Invalid sort field: {sort}'}), 400
+        
+        limit = request.args.get('limit')
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                limit = 0
+            if limit <= 0:
+                return jsonify({'success': False, 'message': 'limit must be a positive number'}), 400
+        
+        extensions = None
+        if request.args.get('ext'):
+            extensions = {('.' + ext.strip().lstrip('.')).lower() for ext in request.args['ext'].split(',') if ext.strip()}
+        
+        filters = {'folder': request.args.get('folder'), 'extensions': extensions, 'query': request.args.get('q')}
+        try:
+            cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+            files, next_cursor = file_index.query_files(
+                sort=sort,
+                descending=descending,
+                limit=limit,
+                cursor=cursor,
+                **filters
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        return jsonify({
+            'success': True,
+            'files': _encoded_files(files),
+            'next_cursor': next_cursor,
+            # Files matching the filters, across all pages
+            'total': file_index.file_count(**filters)
+        })
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
 @app.route('/api/download/<path:filename>')
 def download_file(filename):
-    """Download a specific file"""
+    """Download a specific file, with Range and conditional request support"""
     try:
         # Security check: ensure the path is safe
         if not is_safe_path(filename):
@@ -465,16 +1661,63 @@ def download_file(filename):
         # Get filename for download
         download_name = os.path.basename(filename)
         
-        return send_file(
-            file_path,
-            as_attachment=True,
-            download_name=download_name,
-            mimetype='application/octet-stream'
-        )
+        accel_path = None
+        if x_accel_redirect:
+            accel_path = x_accel_redirect.rstrip('/') + '/' + urllib.parse.quote(filename)
+        return send_download(file_path, download_name, accel_redirect=accel_path)
         
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/stream/<torrent_id>/<int:file_index>')
+def stream_file(torrent_id, file_index):
+    """Stream a file of a torrent while it downloads, serving each range as its pieces arrive"""
+    # Counted from the start, since a magnet's stream may first wait for its metadata
+    if not open_streams.acquire(blocking=False):
+        return too_many_streams()
+    opened = False
+    body = None
+    try:
+        stream = torrent_manager.open_stream(torrent_id, file_index)
+        opened = True
+        mimetype = mimetypes.guess_type(stream.name)[0] or 'application/octet-stream'
+        if stream.complete():
+            return send_download(stream.path, stream.name, mimetype, as_attachment=False)
+        
+        headers = {
+            'Accept-Ranges': 'bytes',
+            'Content-Disposition': content_disposition(stream.name, as_attachment=False),
+            'Cache-Control': 'no-store',
+        }
+        ranges = requested_ranges(stream.size)
+        if ranges == []:
+            headers['Content-Range'] = f'bytes */{stream.size}'
+            return Response(status=416, headers=headers)
+        
+        status = 200
+        start, stop = 0, stream.size
+        if ranges:
+            # Players ask for one range at a time; several are coalesced into one
+            start, stop = ranges[0][0], ranges[-1][1]
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{stop - 1}/{stream.size}'
+        headers['Content-Length'] = str(stop - start)
+        # Closed by the server when the response ends or the client goes away
+        body = ClosingIterator(stream.generate(start, stop),
+                               [lambda: torrent_manager.close_stream(torrent_id), open_streams.release])
+        return Response(body, status=status, headers=headers, mimetype=mimetype, direct_passthrough=True)
+        
+    except StreamError as e:
+        return jsonify({'success': False, 'message': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+    finally:
+        # Everything but a streamed body is done with the stream here
+        if body is None:
+            if opened:
+                torrent_manager.close_stream(torrent_id)
+            open_streams.release()
+
 @app.route('/api/file/info/<path:filename>')
 def get_file_info(filename):
     """Get detailed information about a specific file"""
@@ -518,31 +1761,7 @@ def get_file_info(filename):
 def get_folders():
     """Get list of all download folders"""
     try:
-        folders = []
-        for item in os.listdir(download_dir):
-            item_path = os.path.join(download_dir, item)
-            if os.path.isdir(item_path):
-                # Count files in folder
-                file_count = 0
-                total_size = 0
-                for root, dirs, files in os.walk(item_path):
-                    file_count += len(files)
-                    for file in files:
-                        try:
-                            total_size += os.path.getsize(os.path.join(root, file))
-                        except (OSError, IOError):
-                            continue
-                
-                folder_info = {
-                    'name': item,
-                    'path': item,
-                    'file_count': file_count,
-                    'size': total_size,
-                    'size_mb': round(total_size / (1024 * 1024), 2),
-                    'size_gb': round(total_size / (1024 * 1024 * 1024), 2),
-                    'modified': datetime.fromtimestamp(os.path.getmtime(item_path)).strftime('%Y-%m-%d %H:%M:%S')
-                }
-                folders.append(folder_info)
+        folders = file_index.list_folders()
         
         return jsonify({'success': True, 'folders': folders})
     except Exception as e:
@@ -568,6 +1787,8 @@ def delete_file(filename):
         
         # Delete the file
         os.remove(file_path)
+        file_index.remove_file(filename)
+        torrent_manager.invalidate_download_files(filename)
         
         return jsonify({'success': True, 'message': f'File {os.path.basename(filename)} deleted successfully'})
         
@@ -594,12 +1815,70 @@ def delete_folder(foldername):
         
         # Delete the folder and all its contents
         shutil.rmtree(folder_path)
+        file_index.remove_tree(foldername)
+        torrent_manager.invalidate_download_files(foldername)
         
         return jsonify({'success': True, 'message': f'Folder {foldername} deleted successfully'})
         
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def zip_response(zip_stream, zip_filename):
+    """Build a streamed ZIP download response
+    
+    The uncompressed total is sent up front in X-Uncompressed-Size so clients
+    can work out the savings from the bytes received; the exact figure is
+    written to the archive comment and logged once the stream completes.
+    """
+    def generate():
+        yield from zip_stream.generate()
+        print(f"ZIP {zip_filename}: {zip_stream.summary()}")
+    
+    return Response(
+        generate(),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': content_disposition(zip_filename),
+            'X-Uncompressed-Size': str(zip_stream.total_size),
+            'X-Compression': zip_stream.compression,
+            'Access-Control-Expose-Headers': 'X-Uncompressed-Size, X-Compression',
+        }
+    )
+
+def manifest_response(manifest, zip_filename):
+    """Serve a stored-only archive with Content-Length and Range support"""
+    headers = {
+        'Content-Disposition': content_disposition(zip_filename),
+        'Accept-Ranges': 'bytes',
+        'ETag': f'"{manifest.etag}"',
+        'X-Uncompressed-Size': str(sum(m.size for m in manifest.members)),
+        'X-Compression': 'store',
+        'Access-Control-Expose-Headers': 'X-Uncompressed-Size, X-Compression, Content-Range',
+    }
+    
+    start, stop = 0, manifest.size
+    status = 200
+    
+    # Only honour the range if the client's copy is still the same archive
+    if_range = request.headers.get('If-Range')
+    ranges = requested_ranges(manifest.size) if not if_range or if_range.strip('"') == manifest.etag else None
+    if ranges == []:
+        headers['Content-Range'] = f'bytes */{manifest.size}'
+        return Response(status=416, headers=headers)
+    if ranges:
+        # Download managers resume with one range; several are coalesced into one
+        start, stop = ranges[0][0], ranges[-1][1]
+        status = 206
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{manifest.size}'
+    
+    headers['Content-Length'] = str(stop - start)
+    return Response(
+        manifest.iter_range(start, stop),
+        status=status,
+        mimetype='application/zip',
+        headers=headers
+    )
+
 @app.route('/api/folder/download/<path:foldername>')
 def download_folder_as_zip(foldername):
     """Download a folder as a ZIP file"""
@@ -618,35 +1897,44 @@ def download_folder_as_zip(foldername):
         if not os.path.exists(folder_path) or not os.path.isdir(folder_path):
             return jsonify({'success': False, 'message': 'Folder not found'}), 404
         
-        # Create ZIP file in memory
-        memory_file = io.BytesIO()
-        
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as zipf:
-            # Walk through the folder and add all files
-            file_count = 0
-            for root, dirs, files in os.walk(folder_path):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    # Get relative path within the folder
-                    arcname = os.path.relpath(file_path, folder_path)
-                    try:
-                        zipf.write(file_path, arcname)
-                        file_count += 1
-                    except Exception as e:
-                        print(f"Warning: Could not add file {file_path} to ZIP: {e}")
-        
-        memory_file.seek(0)
+        compression = request.args.get('compression', 'auto').lower()
+        if compression not in COMPRESSION_MODES:
+            return jsonify({'success': False, 'message': f'Invalid compression mode: {compression}'}), 400
+        
+        # Walk in sorted order so the same folder always gives the same layout
+        files = []
+        for root, dirs, filenames in os.walk(folder_path):
+            dirs.sort()
+            for file in sorted(filenames):
+                file_path = os.path.join(root, file)
+                try:
+                    files.append((file_path, os.path.getsize(file_path)))
+                except OSError as e:
+                    print(f"Warning: Could not add file {file_path} to ZIP: {e}")
+        
+        # Queue the folder's files; the archive itself is built while streaming.
+        # Folders of mostly compressed media are stored whole in auto mode
+        zip_stream = ZipStream(compresslevel=6, compression=archive_compression(files, compression),
+                               workers=zip_workers)
+        for file_path, _ in files:
+            # Get relative path within the folder
+            arcname = os.path.relpath(file_path, folder_path)
+            try:
+                zip_stream.add_file(file_path, arcname)
+            except OSError as e:
+                print(f"Warning: Could not add file {file_path} to ZIP: {e}")
         
         # Set the filename for download (sanitize the name)
         safe_folder_name = "".join(c for c in foldername if c.isalnum() or c in (' ', '-', '_')).strip()
         zip_filename = f"{safe_folder_name}.zip"
         
-        return send_file(
-            memory_file,
-            as_attachment=True,
-            download_name=zip_filename,
-            mimetype='application/zip'
-        )
+        # Archives with only stored members have a fixed layout, so they can be
+        # sent with a Content-Length and resumed with Range requests
+        if zip_stream.members and all(m.compress_type == zipfile.ZIP_STORED for m in zip_stream.members):
+            manifest = get_manifest(folder_path, zip_stream.members)
+            return manifest_response(manifest, zip_filename)
+        
+        return zip_response(zip_stream, zip_filename)
         
     except Exception as e:
         print(f"Error in download_folder_as_zip: {e}")
@@ -671,40 +1959,33 @@ def download_selected_files():
             if not is_safe_path(file_path):
                 return jsonify({'success': False, 'message': f'Invalid file path: {file_path}'}), 400
         
-        # Create ZIP file in memory
-        memory_file = io.BytesIO()
-        
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as zipf:
-            file_count = 0
-            for file_path in file_paths:
-                full_path = os.path.join(download_dir, file_path)
-                if os.path.exists(full_path) and os.path.isfile(full_path):
-                    # Use just the filename for the archive to avoid deep folder structures
-                    arcname = os.path.basename(file_path)
-                    # If there are duplicate filenames, add folder prefix
-                    if any(os.path.basename(fp) == arcname for fp in file_paths if fp != file_path):
-                        arcname = file_path.replace('/', '_').replace('\\', '_')
-                    try:
-                        zipf.write(full_path, arcname)
-                        file_count += 1
-                    except Exception as e:
-                        print(f"Warning: Could not add file {full_path} to ZIP: {e}")
-        
-        if file_count == 0:
-            return jsonify({'success': False, 'message': 'No valid files found to zip'}), 400
+        compression = request.args.get('compression', 'auto').lower()
+        if compression not in COMPRESSION_MODES:
+            return jsonify({'success': False, 'message': f'Invalid compression mode: {compression}'}), 400
         
-        memory_file.seek(0)
+        # Queue the files; the archive itself is built while streaming
+        zip_stream = ZipStream(compresslevel=6, compression=compression, workers=zip_workers)
+        for file_path in file_paths:
+            full_path = os.path.join(download_dir, file_path)
+            if os.path.exists(full_path) and os.path.isfile(full_path):
+                # Use just the filename for the archive to avoid deep folder structures
+                arcname = os.path.basename(file_path)
+                # If there are duplicate filenames, add folder prefix
+                if any(os.path.basename(fp) == arcname for fp in file_paths if fp != file_path):
+                    arcname = file_path.replace('/', '_').replace('\\', '_')
+                try:
+                    zip_stream.add_file(full_path, arcname)
+                except OSError as e:
+                    print(f"Warning: Could not add file {full_path} to ZIP: {e}")
+        
+        if not zip_stream.members:
+            return jsonify({'success': False, 'message': 'No valid files found to zip'}), 400
         
         # Generate filename based on timestamp
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         zip_filename = f"selected_files_{timestamp}.zip"
         
-        return send_file(
-            memory_file,
-            as_attachment=True,
-            download_name=zip_filename,
-            mimetype='application/zip'
-        )
+        return zip_response(zip_stream, zip_filename)
         
     except Exception as e:
         print(f"Error in download_selected_files: {e}")
@@ -713,4 +1994,11 @@ def download_selected_files():
         return jsonify({'success': False, 'message': f'Failed to create ZIP file: {str(e)}'}), 500
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=80)
+    # Development server; production runs under gunicorn (see gunicorn.conf.py).
+    # The reloader is off because it imports the app in a second process,
+    # which would start a second libtorrent session.
+    # Docker stops the container with SIGTERM; exit normally so the
+    # resume data is saved by the atexit hook
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', use_reloader=False, threaded=True,
+            host='0.0.0.0', port=int(os.environ.get('PORT', 80)))
@@ -0,0 +1,254 @@
+"""
+Bandwidth scheduling: time-of-day limits, per-torrent and per-label limits.
+
+All limits are in KB/s, 0 meaning unlimited. A schedule is a list of rules,
+each with a time window (start/end as HH:MM, an end before the start
+runs over midnight, and optionally the days it applies on); the first
+rule matching the current time is active and default applies otherwise.
+A rule limits libtorrent's peer classes: download/upload go on the global
+class, which holds every internet peer, and lan_download/lan_upload on
+the local class of peers on the local network. While any torrent is
+downloading, seed_upload caps the upload of seeding torrents together,
+so seeding doesn't saturate the uplink that downloads need for their own
+requests and acknowledgements.
+
+libtorrent can't put a torrent in a peer class through its Python API,
+so label, torrent and seeding limits are torrent limits: a label's limit
+is shared evenly by its running torrents, and each torrent gets the
+lowest of its own limit, its label share and its seeding share. The
+scheduler only calls into libtorrent for limits that changed. The rules,
+labels and limits are saved to a JSON file.
+"""
+
+from datetime import datetime
+
+import libtorrent as lt
+
+from session_profiles import load_config, save_config
+
+DAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+RULE_LIMITS = ('download', 'upload', 'lan_download', 'lan_upload', 'seed_upload')
+TORRENT_LIMITS = ('download', 'upload')
+
+# Peer classes limited by each pair of rule fields
+PEER_CLASSES = {
+    'global': (lt.session.global_peer_class_id, 'download', 'upload'),
+    'local': (lt.session.local_peer_class_id, 'lan_download', 'lan_upload'),
+}
+
+# Torrent states (TorrentRecord.status) that use bandwidth
+DOWNLOADING = ('downloading',)
+SEEDING = ('seeding', 'completed')
+
+
+class BandwidthError(ValueError):
+    """Raised for invalid limits, schedules or labels"""
+
+
+def validate_limits(limits, fields):
+    """Check a dict of KB/s limits; null means unlimited"""
+    if not isinstance(limits, dict):
+        raise BandwidthError('Limits must be an object')
+    unknown = [name for name in limits if name not in fields]
+    if unknown:
+        raise BandwidthError(f"Unknown limits: {', '.join(unknown)}")
+    validated = {}
+    for name, value in limits.items():
+        if value is None:
+            value = 0
+        if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            raise BandwidthError(f'{name} must be a rate in KB/s (0 for unlimited)')
+        validated[name] = value
+    return validated
+
+
+def _minutes(value, field):
+    try:
+        hours, minutes = value.split(':')
+        hours, minutes = int(hours), int(minutes)
+    except (AttributeError, ValueError):
+        raise BandwidthError(f'{field} must be a time as HH:MM')
+    if not (0 <= hours <= 24 and 0 <= minutes < 60) or hours * 60 + minutes > 24 * 60:
+        raise BandwidthError(f'{field} must be a time as HH:MM')
+    return hours * 60 + minutes
+
+
+def validate_schedule(rules):
+    """Check a list of schedule rules"""
+    if not isinstance(rules, list):
+        raise BandwidthError('The schedule must be a list of rules')
+    validated = []
+    for rule in rules:
+        if not isinstance(rule, dict):
+            raise BandwidthError('Each schedule rule must be an object')
+        fields = {name: value for name, value in rule.items() if name not in ('start', 'end', 'days')}
+        entry = {'start': rule.get('start', '00:00'), 'end': rule.get('end', '24:00')}
+        if _minutes(entry['start'], 'start') == _minutes(entry['end'], 'end'):
+            raise BandwidthError('A rule must not start and end at the same time')
+        if 'days' in rule:
+            days = rule['days']
+            if not isinstance(days, list) or not days or any(day not in DAYS for day in days):
+                raise BandwidthError(f"days must be a list of: {', '.join(DAYS)}")
+            entry['days'] = days
+        entry.update(validate_limits(fields, RULE_LIMITS))
+        validated.append(entry)
+    return validated
+
+
+def rule_applies(rule, now):
+    """Whether a schedule rule covers a datetime"""
+    if 'days' in rule and DAYS[now.weekday()] not in rule['days']:
+        return False
+    minute = now.hour * 60 + now.minute
+    start, end = _minutes(rule['start'], 'start'), _minutes(rule['end'], 'end')
+    if start < end:
+        return start <= minute < end
+    return minute >= start or minute < end
+
+
+def _lowest(*limits):
+    """The lowest of some limits, ignoring 0 (unlimited) ones"""
+    limited = [limit for limit in limits if limit]
+    return min(limited) if limited else 0
+
+
+def _share(limit, count):
+    return max(limit // count, 1) if limit and count else 0
+
+
+class BandwidthScheduler:
+    """Works out and applies the rate limits of the session and its torrents"""
+
+    def __init__(self, path):
+        self.path = path
+        saved = load_config(path)
+        self.schedule = saved.get('schedule', [])
+        self.default = saved.get('default', {})
+        self.labels = saved.get('labels', {})  # label -> limits
+        self.torrents = saved.get('torrents', {})  # key -> {'label': ..., 'download': ..., 'upload': ...}
+        self._applied_classes = {}
+        self._applied_torrents = {}  # key -> (download, upload) in bytes/s
+
+    def active_rule(self, now=None):
+        """The rule in force, or the default limits"""
+        now = now or datetime.now()
+        for rule in self.schedule:
+            if rule_applies(rule, now):
+                return rule
+        return self.default
+
+    def label(self, key):
+        return self.torrents.get(key, {}).get('label')
+
+    def update(self, schedule=None, default=None, labels=None):
+        """Replace the schedule, the default limits and/or set label limits
+
+        labels maps labels to their limits; a label with no limits left is
+        removed. Everything is checked before anything changes.
+        """
+        if schedule is not None:
+            schedule = validate_schedule(schedule)
+        if default is not None:
+            default = validate_limits(default, RULE_LIMITS)
+        if labels is not None:
+            if not isinstance(labels, dict):
+                raise BandwidthError('labels must be an object of label to limits')
+            labels = {label: validate_limits(limits, TORRENT_LIMITS) for label, limits in labels.items()}
+
+        if schedule is not None:
+            self.schedule = schedule
+        if default is not None:
+            self.default = default
+        for label, limits in (labels or {}).items():
+            if any(limits.values()):
+                self.labels[label] = limits
+            else:
+                self.labels.pop(label, None)
+
+    def set_label(self, key, label):
+        if label is not None and (not isinstance(label, str) or len(label) > 64):
+            raise BandwidthError('label must be a string of at most 64 characters')
+        self._update_torrent(key, {'label': label or None})
+
+    def set_torrent_limits(self, key, limits):
+        self._update_torrent(key, validate_limits(limits, TORRENT_LIMITS))
+
+    def _update_torrent(self, key, values):
+        entry = dict(self.torrents.get(key, {}), **values)
+        entry = {name: value for name, value in entry.items() if value}
+        if entry:
+            self.torrents[key] = entry
+        else:
+            self.torrents.pop(key, None)
+
+    def forget(self, key):
+        self.torrents.pop(key, None)
+        self._applied_torrents.pop(key, None)
+
+    def torrent_limits(self, entries, rule):
+        """KB/s (download, upload) limits for (key, status) entries of the running torrents"""
+        downloading = sum(1 for _, status in entries if status in DOWNLOADING)
+        seeding = sum(1 for _, status in entries if status in SEEDING)
+        seed_share = _share(rule.get('seed_upload', 0), seeding) if downloading else 0
+        label_counts = {}
+        for key, status in entries:
+            label = self.label(key)
+            if label in self.labels:
+                counts = label_counts.setdefault(label, [0, 0])
+                counts[0] += status in DOWNLOADING
+                counts[1] += 1
+
+        limits = {}
+        for key, status in entries:
+            own = self.torrents.get(key, {})
+            label = own.get('label')
+            label_download = label_upload = 0
+            if label in label_counts:
+                label_download = _share(self.labels[label].get('download', 0), label_counts[label][0])
+                label_upload = _share(self.labels[label].get('upload', 0), label_counts[label][1])
+            limits[key] = (
+                _lowest(own.get('download', 0), label_download),
+                _lowest(own.get('upload', 0), label_upload, seed_share if status in SEEDING else 0),
+            )
+        return limits
+
+    def apply(self, session, entries, now=None):
+        """Apply the limits in force to the session's peer classes and to torrents
+
+        entries are (key, handle, status) for every torrent; torrents that
+        aren't running are left unlimited so they don't hold a share.
+        Returns the active rule.
+        """
+        rule = self.active_rule(now)
+        for name, (class_id, download, upload) in PEER_CLASSES.items():
+            wanted = (rule.get(download, 0) * 1024, rule.get(upload, 0) * 1024)
+            if self._applied_classes.get(name) != wanted:
+                info = session.get_peer_class(class_id)
+                info['download_limit'], info['upload_limit'] = wanted
+                session.set_peer_class(class_id, info)
+                self._applied_classes[name] = wanted
+
+        running = [(key, status) for key, _, status in entries if status in DOWNLOADING + SEEDING]
+        limits = self.torrent_limits(running, rule)
+        for key, handle, _ in entries:
+            download, upload = limits.get(key, (0, 0))
+            wanted = (download * 1024, upload * 1024)
+            # Applied at least once, as resume data restores a torrent's old limits
+            if self._applied_torrents.get(key) != wanted and handle.is_valid():
+                handle.set_download_limit(wanted[0] or -1)
+                handle.set_upload_limit(wanted[1] or -1)
+                self._applied_torrents[key] = wanted
+        return rule
+
+    def to_dict(self, now=None):
+        return {
+            'schedule': self.schedule,
+            'default': self.default,
+            'active': self.active_rule(now),
+            'labels': self.labels,
+            'torrents': self.torrents,
+        }
+
+    def save(self):
+        save_config(self.path, {'schedule': self.schedule, 'default': self.default,
+                                'labels': self.labels, 'torrents': self.torrents})
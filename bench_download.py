@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark for file downloads from /api/download
+
+Runs the app under gunicorn with and without sendfile and downloads a
+2 GB file with curl, in full and as 32 range requests of 64 MB (the
+way download managers split a file), measuring the throughput and the CPU
+time the server's worker process spends per GB sent, split into user time
+(Python) and system time (the kernel copying data to the socket).
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+PORT = 8091
+FILE_SIZE = 2 * 1024 ** 3  # Sparse, so reads don't depend on the disk
+RANGE_SIZE = 64 * 1024 ** 2
+
+MODES = {
+    'sendfile': [],
+    'read + write (--no-sendfile)': ['--no-sendfile'],
+}
+
+
+def start_server(root, extra_args):
+    pid_file = os.path.join(root, 'gunicorn.pid')
+    command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(APP_DIR, 'gunicorn.conf.py'),
+               '--pythonpath', APP_DIR, '--pid', pid_file, *extra_args, 'app:app']
+    env = dict(os.environ, PORT=str(PORT), DATA_DIR=os.path.join(root, 'data'))
+    process = subprocess.Popen(command, cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            # The arbiter listens before the worker is up; wait for a response
+            urllib.request.urlopen(f'http://127.0.0.1:{PORT}/api/torrents', timeout=5).read()
+            with open(f'/proc/{process.pid}/task/{process.pid}/children') as f:
+                return process, int(f.read().split()[0])
+        except (OSError, IndexError):
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("gunicorn didn't start")
+
+
+def cpu_seconds(pid):
+    """User and system CPU time of a process"""
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    ticks = os.sysconf('SC_CLK_TCK')
+    return int(fields[11]) / ticks, int(fields[12]) / ticks
+
+
+def download(url, ranges):
+    if not ranges:
+        subprocess.run(['curl', '-sf', '-o', '/dev/null', url], check=True)
+        return
+    for start in range(0, FILE_SIZE, RANGE_SIZE):
+        subprocess.run(['curl', '-sf', '-o', '/dev/null', '-r', f'{start}-{start + RANGE_SIZE - 1}', url],
+                       check=True)
+
+
+def measure(label, worker_pid, url, ranges):
+    user, system = cpu_seconds(worker_pid)
+    start = time.perf_counter()
+    download(url, ranges)
+    elapsed = time.perf_counter() - start
+    end_user, end_system = cpu_seconds(worker_pid)
+    gigabytes = FILE_SIZE / 1024 ** 3
+    print(f"  {label:<18} {FILE_SIZE / elapsed / 1024 ** 2:7.0f} MB/s "
+          f"{(end_user - user) / gigabytes:6.2f} user {(end_system - system) / gigabytes:6.2f} sys CPU s/GB")
+
+
+def benchmark():
+    print("📥 File download benchmark")
+    print("=" * 60)
+    print(f"{FILE_SIZE // 1024 ** 3} GB file, full and in {FILE_SIZE // RANGE_SIZE} range requests")
+
+    root = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(root, 'downloads'))
+        with open(os.path.join(root, 'downloads', 'large.bin'), 'wb') as f:
+            f.truncate(FILE_SIZE)
+        url = f'http://127.0.0.1:{PORT}/api/download/large.bin'
+
+        for name, extra_args in MODES.items():
+            process, worker_pid = start_server(root, extra_args)
+            try:
+                print(f"\n{name}:")
+                measure("full file", worker_pid, url, ranges=False)
+                measure("range requests", worker_pid, url, ranges=True)
+            finally:
+                process.terminate()
+                process.wait(30)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the downloads directory scanner
+
+Builds a synthetic tree of 100k empty files and compares the os.walk based
+implementations that get_downloaded_files, get_storage_info and get_folders
+used to run on every request against a FileIndex scan, both cold and warm
+(where unchanged directories are pruned).
+"""
+
+import mimetypes
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+from file_index import FileIndex
+
+TOP_FOLDERS = 100
+SUBFOLDERS = 10
+FILES_PER_FOLDER = 100  # 100 * 10 * 100 = 100k files
+
+
+def make_tree(root):
+    old = time.time() - 3600
+    for i in range(TOP_FOLDERS):
+        for j in range(SUBFOLDERS):
+            folder = os.path.join(root, f'Torrent {i:03d}', f'Season {j:02d}')
+            os.makedirs(folder)
+            for k in range(FILES_PER_FOLDER):
+                path = os.path.join(folder, f'episode_{k:03d}.mkv')
+                open(path, 'wb').close()
+                os.utime(path, (old, old))
+    # Age the directories too so the warm scan can prune them
+    for dirpath, dirs, files in os.walk(root):
+        for name in dirs:
+            os.utime(os.path.join(dirpath, name), (old, old))
+
+
+# The previous per-request implementations
+
+def legacy_downloaded_files(download_dir):
+    files_list = []
+    for root, dirs, files in os.walk(download_dir):
+        rel_path = os.path.relpath(root, download_dir)
+        if rel_path == '.':
+            rel_path = ''
+        for file in files:
+            file_path = os.path.join(root, file)
+            file_size = os.path.getsize(file_path)
+            file_modified = datetime.fromtimestamp(os.path.getmtime(file_path))
+            _, ext = os.path.splitext(file)
+            mime_type, _ = mimetypes.guess_type(file)
+            files_list.append({
+                'name': file,
+                'path': os.path.join(rel_path, file) if rel_path else file,
+                'size': file_size,
+                'size_mb': round(file_size / (1024 * 1024), 2),
+                'modified': file_modified.strftime('%Y-%m-%d %H:%M:%S'),
+                'extension': ext.lower(),
+                'mime_type': mime_type or 'application/octet-stream',
+                'folder': rel_path if rel_path else 'root'
+            })
+    return files_list
+
+
+def legacy_storage_size(download_dir):
+    downloaded_size = 0
+    for root, dirs, files in os.walk(download_dir):
+        for file in files:
+            downloaded_size += os.path.getsize(os.path.join(root, file))
+    return downloaded_size
+
+
+def legacy_folders(download_dir):
+    folders = []
+    for item in os.listdir(download_dir):
+        item_path = os.path.join(download_dir, item)
+        if os.path.isdir(item_path):
+            file_count = 0
+            total_size = 0
+            for root, dirs, files in os.walk(item_path):
+                file_count += len(files)
+                for file in files:
+                    total_size += os.path.getsize(os.path.join(root, file))
+            folders.append({'name': item, 'file_count': file_count, 'size': total_size})
+    return folders
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<44} {elapsed * 1000:9.1f} ms")
+    return elapsed
+
+
+def benchmark():
+    print("📂 Downloads directory scan benchmark")
+    print("=" * 60)
+
+    root = tempfile.mkdtemp()
+    try:
+        print(f"Creating {TOP_FOLDERS * SUBFOLDERS * FILES_PER_FOLDER} files...")
+        make_tree(root)
+
+        print("\nPrevious implementation (one walk per endpoint):")
+        legacy = timed("get_downloaded_files", lambda: legacy_downloaded_files(root))
+        legacy += timed("get_storage_info", lambda: legacy_storage_size(root))
+        legacy += timed("get_folders", lambda: legacy_folders(root))
+        print(f"  {'total per poll':<44} {legacy * 1000:9.1f} ms")
+
+        print("\nFileIndex (one scan serves all three endpoints):")
+        index = FileIndex(root)
+        timed("cold scan", index.scan)
+        timed(f"warm scan ({index.scanner.workers} threads, pruned)", index.scan)
+        print(f"  {'directories pruned':<44} {index.scanner.pruned:9d}")
+        timed("answer all three endpoints from the index",
+              lambda: (index.list_files(), index.downloaded_size(), index.list_folders()))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    benchmark()
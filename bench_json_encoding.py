@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark for encoding large API responses
+
+Builds 10,000-entry /api/files and /api/torrents payloads and compares
+Flask's default encoder (stdlib json with sorted keys and ASCII escapes)
+against json_encoding.dumps() with the standard library and with orjson,
+and against a warm FragmentCache, where every entry is unchanged since
+the previous request and only the response around it is built.
+"""
+
+import json
+import time
+from datetime import datetime
+
+from flask.json.provider import DefaultJSONProvider
+
+import json_encoding
+from file_index import _file_info
+from json_encoding import FragmentCache, encode, encoded_array, encoded_object
+from torrent_record import TorrentRecord
+
+ENTRY_COUNT = 10000
+
+
+def make_files():
+    now = time.time()
+    return [_file_info(f'Série {i // 100:03d}/Season 01/épisode_{i:05d}.mkv', 700 * 1024 * 1024 + i, now - i)
+            for i in range(ENTRY_COUNT)]
+
+
+def make_torrents():
+    torrents = {}
+    for i in range(ENTRY_COUNT):
+        torrent_id = f'{i:040x}'
+        record = TorrentRecord(torrent_id, None, datetime.now(), 'normal')
+        record.name = f'Torrent número {i}'
+        record.size = 4 * 1024 ** 3
+        record.progress = 42.17
+        record.download_rate = 1536.25
+        torrents[torrent_id] = record.to_dict(include_files=False)
+    return torrents
+
+
+def flask_default(obj):
+    return json.dumps(obj, default=DefaultJSONProvider.default, ensure_ascii=True, sort_keys=True,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def stdlib_dumps(obj):
+    return json.dumps(obj, default=DefaultJSONProvider.default, ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def timed(label, func, repeat=5):
+    """Best of a few runs; prints the time and the response size"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"  {label:<36} {best * 1000:8.1f} ms {len(body) / 1024:9.0f} KB")
+    return body
+
+
+def run(name, build, payload):
+    print(f"\n{name} ({ENTRY_COUNT} entries):")
+    expected = json.loads(timed("Flask default (json, sorted, ASCII)", lambda: flask_default(build(payload, None))))
+    timed("json, compact UTF-8", lambda: stdlib_dumps(build(payload, None)))
+    if json_encoding.orjson is not None:
+        timed("orjson", lambda: json_encoding.dumps(build(payload, None)))
+    else:
+        print("  orjson                               not installed")
+    cache = FragmentCache()
+    encode(build(payload, cache))
+    body = timed(f"cached fragments ({json_encoding.BACKEND})", lambda: encode(build(payload, cache)))
+    assert json.loads(body) == expected
+
+
+def files_response(files, cache):
+    if cache is None:
+        return {'success': True, 'files': files, 'total': len(files)}
+    return {'success': True, 'files': encoded_array(cache.encode(entry['path'], entry) for entry in files),
+            'total': len(files)}
+
+
+def torrents_response(torrents, cache):
+    if cache is None:
+        return {'success': True, 'torrents': torrents, 'version': 1}
+    return {'success': True,
+            'torrents': encoded_object(cache.member(tid, view) for tid, view in torrents.items()),
+            'version': 1}
+
+
+def benchmark():
+    print("🧾 API response encoding benchmark")
+    print("=" * 64)
+    run("/api/files", files_response, make_files())
+    run("/api/torrents", torrents_response, make_torrents())
+
+
+if __name__ == "__main__":
+    benchmark()
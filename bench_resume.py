@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Benchmark for restarting with fast-resume data
+
+Seeds 1,000 small single-file torrents and runs the app's TorrentManager
+on them twice, each run in its own process as a server restart would be:
+the first run adds the .torrent files with a bulk add (every piece is
+hashed), saves a periodic round of resume data and shuts down, which
+writes the final resume data; the second run restores every torrent
+from the resume store (no recheck) when the app is imported.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import libtorrent as lt
+
+TORRENT_COUNT = 1000
+FILE_SIZE = 256 * 1024  # 256KB per torrent, 250MB in total
+TIMEOUT = 600
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Overrides for the app's session, so the benchmark stays on loopback
+SESSION_CONFIG = {
+    'profile': 'many-torrents',
+    'settings': {
+        'listen_interfaces': '127.0.0.1:0',
+        'enable_dht': False,
+        'enable_lsd': False,
+        'active_checking': 4,
+    },
+}
+
+
+def make_torrents(root):
+    """Write the files to root/downloads and their .torrent files to root/torrents"""
+    download_dir = os.path.join(root, 'downloads')
+    torrent_dir = os.path.join(root, 'torrents')
+    os.makedirs(download_dir)
+    os.makedirs(torrent_dir)
+    for i in range(TORRENT_COUNT):
+        path = os.path.join(download_dir, f'file_{i:04d}.bin')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(FILE_SIZE))
+        fs = lt.file_storage()
+        lt.add_files(fs, path)
+        torrent = lt.create_torrent(fs)
+        lt.set_piece_hashes(torrent, download_dir)
+        with open(os.path.join(torrent_dir, f'file_{i:04d}.torrent'), 'wb') as f:
+            f.write(lt.bencode(torrent.generate()))
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<44} {elapsed:8.2f} s", flush=True)
+    return result
+
+
+def wait_until_finished(manager, count):
+    """Wait until count torrents are registered and have all their pieces"""
+    deadline = time.monotonic() + TIMEOUT
+    while time.monotonic() < deadline:
+        with manager.lock:
+            records = list(manager.active_torrents.values())
+        if len(records) >= count and all(record.is_finished for record in records):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def wait_for_saves(manager):
+    return manager._saves_done.wait(TIMEOUT)
+
+
+def first_run(root):
+    """Add every .torrent file, save a round of resume data and shut down"""
+    import app
+    manager = app.torrent_manager
+
+    torrent_dir = os.path.join(root, 'torrents')
+    items = []
+    for name in sorted(os.listdir(torrent_dir)):
+        with open(os.path.join(torrent_dir, name), 'rb') as f:
+            items.append((f.read(), False, 'normal'))
+
+    def add_all():
+        manager.add_torrents(items)
+        return wait_until_finished(manager, TORRENT_COUNT)
+
+    timed("bulk add .torrent files (with recheck)", add_all)
+
+    def save_all():
+        manager.save_resume_data(all_torrents=True)
+        return wait_for_saves(manager)
+
+    timed("save resume data (one batch)", save_all)
+    timed("shutdown (final resume data)", manager.shutdown)
+    written = len([name for name in os.listdir(manager.resume_store.directory) if name.endswith('.resume')])
+    print(f"  {'resume files written':<44} {written:8d}")
+
+
+def restart(root):
+    """Import the app, which restores every torrent from the resume store"""
+    start = time.perf_counter()
+    import app
+    print(f"  {'import app (TorrentManager.restore)':<44} {time.perf_counter() - start:8.2f} s", flush=True)
+    manager = app.torrent_manager
+    finished = timed("until every torrent is restored",
+                     lambda: wait_until_finished(manager, TORRENT_COUNT))
+    if not finished:
+        print("  timed out")
+    timed("shutdown (final resume data)", manager.shutdown)
+
+
+def run_app(phase, root):
+    """Run one phase in a fresh process, from root as the app's working directory"""
+    env = dict(os.environ, DATA_DIR=os.path.join(root, 'data'), PYTHONPATH=APP_DIR)
+    env.pop('SESSION_PROFILE', None)
+    subprocess.run([sys.executable, os.path.abspath(__file__), phase, root], cwd=root, env=env, check=True)
+
+
+def benchmark():
+    print("⚡ Fast-resume restart benchmark")
+    print("=" * 60)
+
+    root = tempfile.mkdtemp()
+    try:
+        print(f"Creating {TORRENT_COUNT} torrents of {FILE_SIZE // 1024} KB...")
+        make_torrents(root)
+        os.makedirs(os.path.join(root, 'data'))
+        with open(os.path.join(root, 'data', 'session.json'), 'w') as f:
+            json.dump(SESSION_CONFIG, f)
+
+        print("\nFirst run:")
+        run_app('--first-run', root)
+        print("\nRestart:")
+        run_app('--restart', root)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == '--first-run':
+        first_run(sys.argv[2])
+    elif len(sys.argv) == 3 and sys.argv[1] == '--restart':
+        restart(sys.argv[2])
+    else:
+        benchmark()
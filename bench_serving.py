@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Load test for the production server
+
+Starts the app under gunicorn (gunicorn.conf.py: one process, a thread
+pool) and under the Flask development server, and against each runs
+DOWNLOADS clients streaming a 1 GB file from /api/download while POLLERS
+clients poll /api/torrents as fast as they can. Reports the download
+throughput and the poll rate and latency while the downloads stream.
+"""
+
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+PORT = 8089
+FILE_SIZE = 1024 ** 3  # Sparse, so reads don't depend on the disk
+DOWNLOADS = 8
+POLLERS = 16
+DURATION = 10
+CHUNK_SIZE = 256 * 1024
+
+SERVERS = {
+    'gunicorn (gthread)': [sys.executable, '-m', 'gunicorn', '-c', os.path.join(APP_DIR, 'gunicorn.conf.py'),
+                           '--pythonpath', APP_DIR, 'app:app'],
+    'Flask dev server': [sys.executable, os.path.join(APP_DIR, 'app.py')],
+}
+
+
+def start_server(command, root):
+    env = dict(os.environ, PORT=str(PORT), DATA_DIR=os.path.join(root, 'data'), PYTHONPATH=APP_DIR)
+    process = subprocess.Popen(command, cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', PORT), timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"Server didn't start: {' '.join(command)}")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def run_load(base_url):
+    stop = threading.Event()
+    downloaded = [0] * DOWNLOADS
+    latencies = [[] for _ in range(POLLERS)]
+    errors = []
+
+    def download(index):
+        session = requests.Session()
+        while not stop.is_set():
+            try:
+                with session.get(f'{base_url}/api/download/large.bin', stream=True, timeout=30) as response:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        downloaded[index] += len(chunk)
+                        if stop.is_set():
+                            break
+            except requests.RequestException as e:
+                errors.append(e)
+
+    def poll(index):
+        session = requests.Session()
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                session.get(f'{base_url}/api/torrents', timeout=30).raise_for_status()
+                latencies[index].append(time.perf_counter() - start)
+            except requests.RequestException as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=download, args=(i,)) for i in range(DOWNLOADS)]
+    threads += [threading.Thread(target=poll, args=(i,)) for i in range(POLLERS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    polls = sorted(latency for client in latencies for latency in client)
+    return sum(downloaded), polls, errors
+
+
+def report(downloaded, polls, errors):
+    print(f"  {'download throughput':<32} {downloaded / DURATION / 1024 ** 2:9.0f} MB/s")
+    print(f"  {'status polls served':<32} {len(polls) / DURATION:9.0f} /s")
+    if polls:
+        print(f"  {'poll latency p50':<32} {statistics.median(polls) * 1000:9.1f} ms")
+        print(f"  {'poll latency p99':<32} {polls[int(len(polls) * 0.99)] * 1000:9.1f} ms")
+        print(f"  {'poll latency max':<32} {polls[-1] * 1000:9.1f} ms")
+    print(f"  {'errors':<32} {len(errors):9d}")
+
+
+def benchmark():
+    print("🚦 Serving load test")
+    print("=" * 56)
+    print(f"{DOWNLOADS} clients downloading a {FILE_SIZE // 1024 ** 3} GB file, "
+          f"{POLLERS} clients polling /api/torrents, {DURATION} s each")
+
+    for name, command in SERVERS.items():
+        root = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(root, 'downloads'))
+            with open(os.path.join(root, 'downloads', 'large.bin'), 'wb') as f:
+                f.truncate(FILE_SIZE)
+            process = start_server(command, root)
+            try:
+                print(f"\n{name}:")
+                report(*run_load(f'http://127.0.0.1:{PORT}'))
+            finally:
+                stop_server(process)
+        finally:
+            shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    benchmark()
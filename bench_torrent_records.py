@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the per-torrent records behind /api/torrents
+
+Adds 10,000 paused magnets to a session and compares the dict per torrent
+that TorrentManager used to keep (every status field copied in on each
+update, then a second dict built and rounded for the response) against
+TorrentRecord: memory per torrent, applying one round of status updates,
+and serializing the /api/torrents body for all torrents.
+"""
+
+import hashlib
+import json
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import libtorrent as lt
+
+from torrent_record import TorrentRecord
+
+TORRENT_COUNT = 10000
+
+
+def make_statuses():
+    ses = lt.session({
+        'listen_interfaces': '127.0.0.1:0',
+        'enable_dht': False,
+        'enable_lsd': False,
+        'enable_upnp': False,
+        'enable_natpmp': False,
+    })
+    save_path = tempfile.gettempdir()
+    for i in range(TORRENT_COUNT):
+        info_hash = hashlib.sha1(str(i).encode()).hexdigest()
+        params = lt.parse_magnet_uri(f'magnet:?xt=urn:btih:{info_hash}&dn=Torrent%20{i}')
+        params.save_path = save_path
+        params.flags |= lt.torrent_flags.paused
+        ses.async_add_torrent(params)
+    while len(ses.get_torrents()) < TORRENT_COUNT:
+        ses.wait_for_alert(100)
+        ses.pop_alerts()
+    statuses = [(str(handle.info_hashes().v1), handle.status()) for handle in ses.get_torrents()]
+    return ses, statuses
+
+
+# The previous dict-based implementation
+
+def legacy_record(handle):
+    return {
+        'handle': handle,
+        'added_time': datetime.now(),
+        'name': '',
+        'size': 0,
+        'progress': 0,
+        'download_rate': 0,
+        'upload_rate': 0,
+        'status': 'downloading',
+        'peers': 0,
+        'seeds': 0,
+        'download_files': None,
+        'priority': 'normal',
+        'queue_position': -1,
+        'info_hashes': set()
+    }
+
+
+def legacy_apply_status(torrent_data, status):
+    if status.has_metadata:
+        torrent_data['name'] = status.name
+        torrent_data['size'] = status.total_wanted
+    torrent_data['progress'] = status.progress * 100
+    torrent_data['download_rate'] = status.download_rate / 1024
+    torrent_data['upload_rate'] = status.upload_rate / 1024
+    torrent_data['peers'] = status.num_peers
+    torrent_data['seeds'] = status.num_seeds
+    torrent_data['is_finished'] = status.is_finished
+    torrent_data['has_metadata'] = status.has_metadata
+    torrent_data['queue_position'] = status.queue_position
+    if status.is_seeding:
+        torrent_data['status'] = 'seeding'
+    elif status.is_finished:
+        torrent_data['status'] = 'completed'
+    elif status.paused and status.auto_managed:
+        torrent_data['status'] = 'queued'
+    elif status.paused:
+        torrent_data['status'] = 'paused'
+    else:
+        torrent_data['status'] = 'downloading'
+
+
+def legacy_view(torrent_id, torrent_data):
+    return {
+        'id': torrent_id,
+        'name': torrent_data['name'] or f"Torrent {torrent_id[:8]}",
+        'size': torrent_data['size'],
+        'progress': round(torrent_data['progress'], 2),
+        'download_rate': round(torrent_data['download_rate'], 2),
+        'upload_rate': round(torrent_data['upload_rate'], 2),
+        'status': torrent_data['status'],
+        'peers': torrent_data['peers'],
+        'seeds': torrent_data['seeds'],
+        'priority': torrent_data['priority'],
+        'queue_position': torrent_data['queue_position'],
+        'added_time': torrent_data['added_time'].strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+def measure(label, build):
+    """Build the records under tracemalloc and report the bytes per torrent"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"  {label:<44} {used / TORRENT_COUNT:9.0f} B")
+    return records
+
+
+def timed(label, func, repeat=5):
+    """Best of a few runs, in milliseconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"  {label:<44} {best * 1000:9.1f} ms")
+    return result
+
+
+def benchmark():
+    print("🧮 Torrent record benchmark")
+    print("=" * 60)
+    print(f"Adding {TORRENT_COUNT} paused magnets...")
+    ses, statuses = make_statuses()
+
+    print("\nPrevious implementation (dict per torrent):")
+
+    def build_legacy():
+        records = {}
+        for torrent_id, status in statuses:
+            records[torrent_id] = legacy_record(status.handle)
+            records[torrent_id]['info_hashes'].add(torrent_id)
+            legacy_apply_status(records[torrent_id], status)
+        return records
+
+    legacy = measure("memory per torrent", build_legacy)
+    timed("apply one status update per torrent",
+          lambda: [legacy_apply_status(legacy[torrent_id], status) for torrent_id, status in statuses])
+    timed("serialize /api/torrents body",
+          lambda: json.dumps({tid: legacy_view(tid, data) for tid, data in legacy.items()}))
+
+    print("\nTorrentRecord:")
+
+    def build_records():
+        records = {}
+        for torrent_id, status in statuses:
+            record = records[torrent_id] = TorrentRecord(torrent_id, status.handle, datetime.now(), 'normal')
+            record.info_hashes = (torrent_id,)
+            record.update(status)
+        return records
+
+    records = measure("memory per torrent", build_records)
+    changed = timed("apply one status update per torrent",
+                    lambda: sum(records[torrent_id].update(status) for torrent_id, status in statuses))
+    print(f"  {'torrents marked changed':<44} {changed:9d}")
+    timed("serialize /api/torrents body",
+          lambda: json.dumps({tid: record.to_dict(include_files=False) for tid, record in records.items()}))
+    del ses
+
+
+if __name__ == "__main__":
+    benchmark()
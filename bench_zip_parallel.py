@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the parallel ZIP compression pipeline
+
+Builds a temporary folder of compressible files and streams it through
+ZipStream with an increasing number of deflate workers, printing the
+throughput for each.
+"""
+
+import os
+import random
+import tempfile
+import time
+
+from zip_stream import ZipStream
+
+FILE_COUNT = 16
+FILE_SIZE = 8 * 1024 * 1024  # 8MB per file, 128MB total
+WORKER_COUNTS = [1, 2, 4, 8]
+
+
+def make_files(root):
+    """Write files of log-like text that deflate to roughly a third of their size"""
+    rng = random.Random(42)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 10)))
+             for _ in range(5000)]
+    paths = []
+    for i in range(FILE_COUNT):
+        path = os.path.join(root, f'file_{i:02d}.log')
+        with open(path, 'w') as f:
+            written = 0
+            while written < FILE_SIZE:
+                line = f"{rng.randint(0, 10**9)} " + ' '.join(rng.choices(words, k=12)) + '\n'
+                f.write(line)
+                written += len(line)
+        paths.append(path)
+    return paths
+
+
+def run(paths, workers):
+    stream = ZipStream(compresslevel=6, compression='deflate', workers=workers)
+    for path in paths:
+        stream.add_file(path, os.path.basename(path))
+    start = time.perf_counter()
+    archive_size = 0
+    for chunk in stream.generate():
+        archive_size += len(chunk)
+    return time.perf_counter() - start, archive_size
+
+
+def benchmark():
+    print("📦 Parallel ZIP compression benchmark")
+    print("=" * 50)
+    print(f"CPUs available: {os.cpu_count()}")
+
+    with tempfile.TemporaryDirectory() as root:
+        paths = make_files(root)
+        total = sum(os.path.getsize(p) for p in paths)
+        print(f"Input: {FILE_COUNT} files, {total / (1024 * 1024):.0f} MB\n")
+
+        baseline = None
+        for workers in WORKER_COUNTS:
+            elapsed, archive_size = run(paths, workers)
+            throughput = total / elapsed / (1024 * 1024)
+            baseline = baseline or throughput
+            print(f"workers={workers:<2}  {elapsed:6.2f}s  {throughput:7.1f} MB/s  "
+                  f"x{throughput / baseline:.2f}  archive={archive_size / (1024 * 1024):.1f} MB")
+
+
+if __name__ == "__main__":
+    benchmark()
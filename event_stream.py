@@ -0,0 +1,86 @@
+"""
+Server-Sent Events fan-out for torrent updates.
+
+A single producer (the torrent manager's alert loop) publishes events to an
+EventBroker, which copies them into a bounded queue per connected client.
+Each /api/events response drains its own queue, so the cost of producing an
+update doesn't depend on the number of clients. A client that stops reading
+and fills its queue is disconnected rather than allowed to hold back the
+others; EventSource reconnects on its own and starts again from a snapshot.
+"""
+
+import queue
+import threading
+
+from json_encoding import dumps
+
+SUBSCRIBER_QUEUE_SIZE = 256
+KEEPALIVE_INTERVAL = 15  # Seconds between comment lines on an idle stream
+RETRY_MS = 2000  # Reconnect delay suggested to EventSource clients
+
+
+def format_event(event, data):
+    """Encode one event in text/event-stream format"""
+    payload = dumps(data).decode('utf-8')
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class Subscriber:
+    """One client's queue of pending events"""
+
+    def __init__(self, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize)
+        self.dropped = False
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except queue.Full:
+            self.dropped = True
+            return False
+
+    def stream(self, keepalive=KEEPALIVE_INTERVAL):
+        """Yield encoded events until the subscriber is dropped"""
+        yield f"retry: {RETRY_MS}\n\n"
+        while not self.dropped:
+            try:
+                yield self.queue.get(timeout=keepalive)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+
+
+class EventBroker:
+    """Fans events from one producer out to any number of subscribers"""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self, *initial):
+        """Register a subscriber, queueing the given (event, data) pairs first"""
+        subscriber = Subscriber()
+        for event, data in initial:
+            subscriber.put(format_event(event, data))
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, event, data):
+        """Encode an event once and queue it for every subscriber"""
+        with self.lock:
+            if not self.subscribers:
+                return
+            message = format_event(event, data)
+            for subscriber in list(self.subscribers):
+                if not subscriber.put(message):
+                    print("Dropping slow event stream subscriber")
+                    self.subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        with self.lock:
+            return len(self.subscribers)
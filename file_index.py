@@ -0,0 +1,554 @@
+"""
+In-process index of the downloads directory.
+
+The file browser endpoints used to walk and stat the whole downloads tree on
+every request. FileIndex keeps one in-memory copy of what is on disk (file
+paths, sizes, mtimes and mime types, plus per-folder totals) that is built
+once, kept current by the routes that change files and by inotify events
+(see inotify_watch), and otherwise refreshed in the background. Requests are
+answered from memory without touching the disk.
+
+Full scans go through TreeScanner, which walks subtrees concurrently with
+os.scandir and skips re-listing directories whose mtime hasn't changed.
+
+Files are also kept in sorted indexes by name, size and modification time,
+so a page of the files API is found with a binary search and costs the same
+however many files are indexed. Each top-level folder has its own sorted
+indexes and per-extension counts, so a page or total of one folder doesn't
+depend on the size of the others either; only name searches (and folders
+below the top level) walk the entries of their folder.
+"""
+
+import base64
+import bisect
+import json
+import mimetypes
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+REFRESH_INTERVAL = 30  # Seconds between background rescans when not watched
+SCAN_WORKERS = 8  # Threads listing directories during a full scan
+# Files modified this recently are re-stat'ed even in unchanged directories,
+# since writing to a file doesn't change its directory's mtime
+ACTIVE_FILE_WINDOW = 15 * 60
+# Directory mtimes this recent aren't trusted for pruning, because another
+# change within the same timestamp tick would go unnoticed
+MTIME_SETTLE_TIME = 2
+
+SORT_FIELDS = ('name', 'size', 'modified')
+
+
+def _file_info(rel_path, size, mtime):
+    """Build the file entry returned by the files API"""
+    name = os.path.basename(rel_path)
+    folder = os.path.dirname(rel_path)
+    _, ext = os.path.splitext(name)
+    mime_type, _ = mimetypes.guess_type(name)
+    return {
+        'name': name,
+        'path': rel_path,
+        'size': size,
+        'size_mb': round(size / (1024 * 1024), 2),
+        'modified': datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S'),
+        'extension': ext.lower(),
+        'mime_type': mime_type or 'application/octet-stream',
+        'folder': folder or 'root'
+    }
+
+
+def _folder_info(name, file_count, size, mtime):
+    """Build the folder entry returned by the folders API"""
+    return {
+        'name': name,
+        'path': name,
+        'file_count': file_count,
+        'size': size,
+        'size_mb': round(size / (1024 * 1024), 2),
+        'size_gb': round(size / (1024 * 1024 * 1024), 2),
+        'modified': datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+def _sort_key(field, rel_path, size, mtime):
+    """Key of a file in the sorted index for a field; the path breaks ties"""
+    if field == 'name':
+        return (os.path.basename(rel_path).lower(), rel_path)
+    if field == 'size':
+        return (size, rel_path)
+    return (mtime, rel_path)
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Turn a cursor back into a sort key, raising ValueError if it's malformed"""
+    try:
+        value, path = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    return (value, path)
+
+
+def _top_folder(rel_path):
+    """Top-level folder a relative path belongs to, or None for root files"""
+    head, sep, _ = rel_path.partition('/')
+    return head if sep else None
+
+
+def _file_filter(folder, extensions, query):
+    """Predicate for the files API filters (folder prefix, extensions, name search), or None"""
+    if not (folder or extensions or query):
+        return None
+    folder_prefix = folder.strip('/') + '/' if folder else None
+    query = query.lower() if query else None
+
+    def matches(entry):
+        if folder_prefix and not entry['path'].startswith(folder_prefix):
+            return False
+        if extensions and entry['extension'] not in extensions:
+            return False
+        return not query or query in entry['name'].lower()
+    return matches
+
+
+class SortedFiles:
+    """Sort keys of a set of files for every sort field, and their count per extension"""
+
+    __slots__ = ('sorted', 'extensions')
+
+    def __init__(self):
+        self.sorted = {field: [] for field in SORT_FIELDS}
+        self.extensions = Counter()
+
+    def add(self, rel_path, entry, mtime):
+        for field, keys in self.sorted.items():
+            bisect.insort(keys, _sort_key(field, rel_path, entry['size'], mtime))
+        self.extensions[entry['extension']] += 1
+
+    def discard(self, rel_path, entry, mtime):
+        for field, keys in self.sorted.items():
+            key = _sort_key(field, rel_path, entry['size'], mtime)
+            position = bisect.bisect_left(keys, key)
+            if position < len(keys) and keys[position] == key:
+                del keys[position]
+        self.extensions[entry['extension']] -= 1
+        if not self.extensions[entry['extension']]:
+            del self.extensions[entry['extension']]
+
+    def count(self, extensions=None):
+        if extensions is None:
+            return len(self.sorted['name'])
+        return sum(self.extensions.get(extension, 0) for extension in extensions)
+
+    @classmethod
+    def build(cls, files, mtimes):
+        """SortedFiles of (rel path, entry) pairs, sorted once"""
+        group = cls()
+        for rel_path, entry in files:
+            mtime = mtimes[rel_path]
+            for field, keys in group.sorted.items():
+                keys.append(_sort_key(field, rel_path, entry['size'], mtime))
+            group.extensions[entry['extension']] += 1
+        for keys in group.sorted.values():
+            keys.sort()
+        return group
+
+
+class ScannedDirectory:
+    """Listing of one directory from a scan: files as name -> (size, mtime)"""
+
+    __slots__ = ('rel_path', 'mtime', 'files', 'subdirs', 'trusted')
+
+    def __init__(self, rel_path, mtime, files, subdirs, trusted):
+        self.rel_path = rel_path
+        self.mtime = mtime
+        self.files = files
+        self.subdirs = subdirs
+        self.trusted = trusted
+
+
+class TreeScanner:
+    """Parallel os.scandir walker that remembers directory listings between scans
+
+    Each directory is listed with os.scandir, reusing the DirEntry type
+    information and doing one stat per file. A directory whose mtime hasn't
+    changed since the previous scan still has the same entries, so its
+    listing is reused; only its subdirectories and recently modified files
+    are stat'ed again. Subtrees are scanned concurrently on a thread pool.
+    """
+
+    def __init__(self, root, workers=SCAN_WORKERS):
+        self.root = root
+        self.workers = workers
+        self.cache = {}  # rel dir -> ScannedDirectory from the previous scan
+        self.pruned = 0  # Directories reused without listing in the last scan
+
+    def scan(self):
+        """Return a ScannedDirectory for every directory under the root"""
+        results = {}
+        self.pruned = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='file-scan') as pool:
+            pending = {pool.submit(self._scan_directory, '')}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    directory = future.result()
+                    if directory is None:
+                        continue
+                    results[directory.rel_path] = directory
+                    for name in directory.subdirs:
+                        rel_path = f"{directory.rel_path}/{name}" if directory.rel_path else name
+                        pending.add(pool.submit(self._scan_directory, rel_path))
+        self.cache = results
+        return results
+
+    def _scan_directory(self, rel_path):
+        full_path = os.path.join(self.root, rel_path) if rel_path else self.root
+        try:
+            mtime = os.stat(full_path).st_mtime_ns
+        except OSError:
+            return None
+        trusted = time.time_ns() - mtime > MTIME_SETTLE_TIME * 10**9
+
+        previous = self.cache.get(rel_path)
+        if previous and previous.trusted and previous.mtime == mtime:
+            self.pruned += 1
+            return ScannedDirectory(rel_path, mtime, self._refresh_active(full_path, previous.files),
+                                    previous.subdirs, trusted)
+
+        files = {}
+        subdirs = []
+        try:
+            with os.scandir(full_path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                        elif entry.is_file():
+                            stat = entry.stat()
+                            files[entry.name] = (stat.st_size, stat.st_mtime)
+                    except OSError:
+                        continue
+        except OSError:
+            return None
+        return ScannedDirectory(rel_path, mtime, files, subdirs, trusted)
+
+    @staticmethod
+    def _refresh_active(full_path, files):
+        """Re-stat files that were still being written at the last scan"""
+        cutoff = time.time() - ACTIVE_FILE_WINDOW
+        refreshed = {}
+        for name, (size, mtime) in files.items():
+            if mtime >= cutoff:
+                try:
+                    stat = os.stat(os.path.join(full_path, name))
+                except OSError:
+                    continue
+                size, mtime = stat.st_size, stat.st_mtime
+            refreshed[name] = (size, mtime)
+        return refreshed
+
+
+class FileIndex:
+    """Index of every file under a root directory with per-folder totals
+
+    Paths are relative to the root and always use '/' separators. Folder
+    totals are kept for the top-level folders only, which is what the
+    folders API reports.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.files = {}  # rel path -> file info dict
+        self.mtimes = {}  # rel path -> mtime, to spot changed files on rescans
+        self.folders = {}  # top-level folder -> {'file_count', 'size', 'mtime'}
+        self.total_size = 0
+        self.lock = threading.RLock()
+        self.ready = threading.Event()
+        # Set by DirectoryWatcher while inotify keeps the index current
+        self.watched = False
+        self._rescan = threading.Event()
+        self._thread = None
+        self.scanner = TreeScanner(root)
+        self.all = SortedFiles()
+        self.groups = {}  # top-level folder -> SortedFiles of the files under it
+        # Paths changed by incremental updates while a scan is running; the
+        # scan may have listed them before the change, so they are applied
+        # again once its result is swapped in
+        self._scanning = False
+        self._changed_during_scan = set()
+
+    # Scanning
+
+    def scan(self):
+        """Rebuild the whole index from disk"""
+        with self.lock:
+            self._scanning = True
+            self._changed_during_scan.clear()
+        try:
+            directories = self.scanner.scan()
+        except Exception:
+            with self.lock:
+                self._scanning = False
+            raise
+        previous_files, previous_mtimes = self.files, self.mtimes
+        files = {}
+        mtimes = {}
+        folders = {}
+        total_size = 0
+
+        root = directories.get('')
+        if root:
+            for name in root.subdirs:
+                if name in directories:
+                    folders[name] = {'file_count': 0, 'size': 0, 'mtime': directories[name].mtime / 1e9}
+
+        for rel_root, directory in directories.items():
+            folder = _top_folder(rel_root + '/') if rel_root else None
+            for filename, (size, mtime) in directory.files.items():
+                rel_path = f"{rel_root}/{filename}" if rel_root else filename
+                # Reuse the API entry if the file hasn't changed
+                entry = previous_files.get(rel_path)
+                if entry is None or entry['size'] != size or previous_mtimes.get(rel_path) != mtime:
+                    entry = _file_info(rel_path, size, mtime)
+                files[rel_path] = entry
+                mtimes[rel_path] = mtime
+                total_size += size
+                if folder in folders:
+                    folders[folder]['file_count'] += 1
+                    folders[folder]['size'] += size
+
+        by_folder = {}
+        for rel_path, entry in files.items():
+            folder = _top_folder(rel_path)
+            if folder is not None:
+                by_folder.setdefault(folder, []).append((rel_path, entry))
+        all_files = SortedFiles.build(files.items(), mtimes)
+        groups = {folder: SortedFiles.build(items, mtimes) for folder, items in by_folder.items()}
+
+        with self.lock:
+            self.files = files
+            self.mtimes = mtimes
+            self.all = all_files
+            self.groups = groups
+            self.folders = folders
+            self.total_size = total_size
+            self._scanning = False
+            changed, self._changed_during_scan = self._changed_during_scan, set()
+            for rel_path in sorted(changed):
+                self._replay(rel_path)
+        self.ready.set()
+
+    def _replay(self, rel_path):
+        """Bring one path changed during a scan up to date"""
+        if os.path.lexists(os.path.join(self.root, rel_path)):
+            self.update_tree(rel_path)
+        else:
+            self.remove_tree(rel_path)
+            self.remove_file(rel_path)
+
+    def start(self, interval=REFRESH_INTERVAL):
+        """Build the index in a background thread and rescan it periodically
+
+        While the index is watched, rescans only happen on request_rescan().
+        """
+        if self._thread:
+            return
+
+        def run():
+            while True:
+                self._rescan.clear()
+                try:
+                    self.scan()
+                except Exception as e:
+                    print(f"Error scanning downloads directory: {e}")
+                    self.ready.set()
+                while not self._rescan.wait(interval) and self.watched:
+                    pass
+
+        self._thread = threading.Thread(target=run, name='file-index', daemon=True)
+        self._thread.start()
+
+    def request_rescan(self):
+        """Ask the background thread for a full rescan as soon as possible"""
+        self._rescan.set()
+
+    # Incremental updates
+
+    def update_file(self, rel_path):
+        """Add or refresh a single file, dropping it if it no longer exists"""
+        rel_path = rel_path.replace('\\', '/').strip('/')
+        full_path = os.path.join(self.root, rel_path)
+        try:
+            stat = os.stat(full_path)
+        except OSError:
+            self.remove_file(rel_path)
+            return
+        if not os.path.isfile(full_path):
+            return
+
+        with self.lock:
+            self._note_change(rel_path)
+            self._discard(rel_path)
+            entry = self.files[rel_path] = _file_info(rel_path, stat.st_size, stat.st_mtime)
+            self.mtimes[rel_path] = stat.st_mtime
+            self.all.add(rel_path, entry, stat.st_mtime)
+            self.total_size += stat.st_size
+            folder = _top_folder(rel_path)
+            if folder is not None:
+                self.groups.setdefault(folder, SortedFiles()).add(rel_path, entry, stat.st_mtime)
+                totals = self.folders.setdefault(folder, {'file_count': 0, 'size': 0, 'mtime': stat.st_mtime})
+                totals['file_count'] += 1
+                totals['size'] += stat.st_size
+                totals['mtime'] = max(totals['mtime'], stat.st_mtime)
+
+    def update_tree(self, rel_path):
+        """Re-index everything under a directory (or a single file)"""
+        rel_path = rel_path.replace('\\', '/').strip('/')
+        full_path = os.path.join(self.root, rel_path)
+        if not os.path.isdir(full_path):
+            self.update_file(rel_path)
+            return
+
+        self.remove_tree(rel_path)
+        folder = _top_folder(rel_path + '/') if rel_path else None
+        if folder is not None:
+            with self.lock:
+                try:
+                    mtime = os.path.getmtime(os.path.join(self.root, folder))
+                except OSError:
+                    mtime = 0
+                self.folders.setdefault(folder, {'file_count': 0, 'size': 0, 'mtime': mtime})
+        for root, dirs, filenames in os.walk(full_path):
+            for filename in filenames:
+                file_rel = os.path.relpath(os.path.join(root, filename), self.root).replace('\\', '/')
+                self.update_file(file_rel)
+
+    def remove_file(self, rel_path):
+        rel_path = rel_path.replace('\\', '/').strip('/')
+        with self.lock:
+            self._note_change(rel_path)
+            self._discard(rel_path)
+
+    def remove_tree(self, rel_path):
+        """Drop a directory and everything indexed under it"""
+        rel_path = rel_path.replace('\\', '/').strip('/')
+        prefix = rel_path + '/' if rel_path else ''
+        with self.lock:
+            self._note_change(rel_path)
+            for path in [p for p in self.files if p.startswith(prefix)]:
+                self._discard(path)
+            if rel_path in self.folders:
+                del self.folders[rel_path]
+            self.groups.pop(rel_path, None)
+
+    def _note_change(self, rel_path):
+        if self._scanning and rel_path:
+            self._changed_during_scan.add(rel_path)
+
+    def _discard(self, rel_path):
+        entry = self.files.pop(rel_path, None)
+        if entry is None:
+            return
+        mtime = self.mtimes.pop(rel_path, None)
+        self.all.discard(rel_path, entry, mtime)
+        self.total_size -= entry['size']
+        folder = _top_folder(rel_path)
+        if folder in self.groups:
+            self.groups[folder].discard(rel_path, entry, mtime)
+        if folder in self.folders:
+            self.folders[folder]['file_count'] -= 1
+            self.folders[folder]['size'] -= entry['size']
+
+    # Queries
+
+    def list_files(self):
+        self.ready.wait()
+        with self.lock:
+            return list(self.files.values())
+
+    def query_files(self, sort='name', descending=False, folder=None, extensions=None,
+                    query=None, limit=None, cursor=None):
+        """Return one page of files in sort order, and the cursor for the next page
+
+        The page starts right after the cursor's position in the sorted
+        index, of the folder's top-level folder when there is a folder
+        filter. The other filters (extensions, case-insensitive name search,
+        a folder below the top level) are applied while walking forward from
+        there, so their cost depends on how many entries of that index have
+        to be skipped, not on the number of files elsewhere.
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Unknown sort field: {sort}")
+        matches = _file_filter(folder, extensions, query)
+
+        self.ready.wait()
+        with self.lock:
+            group = self._group(folder)
+            if group is None:
+                return [], None
+            keys = group.sorted[sort]
+            try:
+                if cursor is None:
+                    position = len(keys) - 1 if descending else 0
+                elif descending:
+                    position = bisect.bisect_left(keys, cursor) - 1
+                else:
+                    position = bisect.bisect_right(keys, cursor)
+            except TypeError:
+                # A cursor from a different sort field
+                raise ValueError('Invalid cursor')
+            step = -1 if descending else 1
+
+            page = []
+            last_key = None
+            while 0 <= position < len(keys):
+                key = keys[position]
+                position += step
+                entry = self.files[key[1]]
+                if matches and not matches(entry):
+                    continue
+                page.append(entry)
+                last_key = key
+                if limit and len(page) >= limit:
+                    break
+
+            has_more = limit and len(page) >= limit and 0 <= position < len(keys)
+            next_cursor = encode_cursor(last_key) if has_more else None
+            return page, next_cursor
+
+    def file_count(self, folder=None, extensions=None, query=None):
+        """Number of files, or of those matching query_files() filters"""
+        self.ready.wait()
+        with self.lock:
+            group = self._group(folder)
+            if group is None:
+                return 0
+            folder = folder.strip('/') if folder else None
+            if not query and (not folder or '/' not in folder):
+                # The whole top-level folder (or index): counted as it changes
+                return group.count(extensions or None)
+            matches = _file_filter(folder, extensions, query)
+            return sum(1 for _, rel_path in group.sorted['name'] if matches(self.files[rel_path]))
+
+    def _group(self, folder):
+        """SortedFiles a folder filter's files are in (all files without one), or None if it has none"""
+        if not folder or not folder.strip('/'):
+            return self.all
+        return self.groups.get(folder.strip('/').partition('/')[0])
+
+    def list_folders(self):
+        self.ready.wait()
+        with self.lock:
+            return [_folder_info(name, totals['file_count'], totals['size'], totals['mtime'])
+                    for name, totals in self.folders.items()]
+
+    def downloaded_size(self):
+        self.ready.wait()
+        return self.total_size
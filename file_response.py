@@ -0,0 +1,210 @@
+"""
+File download responses with HTTP ranges, conditional requests and
+zero-copy sending.
+
+send_download() answers a GET or HEAD for a file on disk:
+
+- ETag and Last-Modified validators, with If-None-Match/If-Modified-Since
+  (304) and If-Match/If-Unmodified-Since (412);
+- single ranges (206 with Content-Range) and multiple ranges (206
+  multipart/byteranges), with If-Range, and 416 for unsatisfiable ones;
+- an exact Content-Length on every response.
+
+The body of a full or single-range response is the file itself, positioned
+at the range start and limited to its length, handed to the server as
+wsgi.file_wrapper. Gunicorn sends such responses with os.sendfile(), so the
+bytes never pass through Python; other servers read it in large blocks.
+Alternatively the file can be left to a fronting nginx with
+X-Accel-Redirect, which then handles ranges itself.
+"""
+
+import os
+import secrets
+import unicodedata
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.http import http_date, is_resource_modified
+from werkzeug.wsgi import wrap_file
+
+BLOCK_SIZE = 256 * 1024  # Read size when the server can't use sendfile
+MAX_RANGES = 32  # Requests with more ranges get the whole file
+
+
+class FileRange:
+    """A file object limited to length bytes starting at start
+
+    The underlying file is positioned at start, so servers that send
+    wsgi.file_wrapper bodies with os.sendfile() start from the right offset
+    (the Content-Length header bounds how much they send).
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self._file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self._file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def close(self):
+        self._file.close()
+
+
+def content_disposition(download_name, as_attachment=True):
+    """Content-Disposition value with an ASCII filename and an RFC 5987 one if needed"""
+    disposition = 'attachment' if as_attachment else 'inline'
+    try:
+        download_name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        quoted = quote(download_name, safe="!#$&+-.^_`|~")
+        return f'{disposition}; filename="{_escape(simple)}"; filename*=UTF-8\'\'{quoted}'
+    return f'{disposition}; filename="{_escape(download_name)}"'
+
+
+def _escape(name):
+    return name.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def file_etag(stat):
+    return f'{stat.st_mtime_ns:x}-{stat.st_size:x}-{stat.st_ino:x}'
+
+
+def requested_ranges(size):
+    """The byte ranges of the request as (start, stop) pairs, for a file of size bytes
+
+    Returns None when the whole file should be sent (no Range header, an
+    invalid one, or too many ranges) and an empty list when no range can
+    be satisfied. Overlapping and adjacent ranges are merged.
+    """
+    header = request.headers.get('Range')
+    if not header:
+        return None
+    units, _, specs = header.partition('=')
+    specs = specs.split(',')
+    if units.strip().lower() != 'bytes' or len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        first, dash, last = (part.strip() for part in spec.partition('-'))
+        if not dash or not (first or last) or not (first or '0').isdigit() or not (last or '0').isdigit():
+            return None
+        if not first:
+            # Suffix range: the last N bytes
+            start, stop = max(size - int(last), 0), size
+        elif last:
+            if int(last) < int(first):
+                return None
+            start, stop = int(first), min(int(last) + 1, size)
+        else:
+            start, stop = int(first), size
+        if start < stop:
+            ranges.append((start, stop))
+
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def _range_allowed(etag, last_modified):
+    """If-Range: ranges only apply while the client's copy is still current"""
+    if_range = request.if_range
+    if if_range.etag is None and if_range.date is None:
+        return True
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    return if_range.date == last_modified
+
+
+def send_download(path, download_name, mimetype='application/octet-stream', as_attachment=True,
+                  accel_redirect=None):
+    """Response sending the file at path, honouring ranges and conditional headers
+
+    With accel_redirect (an internal nginx location for the file), the body
+    is left to nginx through X-Accel-Redirect.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = file_etag(stat)
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': f'"{etag}"',
+        'Last-Modified': http_date(last_modified),
+        'Content-Disposition': content_disposition(download_name, as_attachment),
+        'Access-Control-Expose-Headers': 'Content-Range, Content-Length, ETag',
+    }
+
+    # Preconditions
+    if request.if_match and not request.if_match.contains(etag):
+        return Response(status=412, headers=headers)
+    if request.if_unmodified_since and last_modified > request.if_unmodified_since:
+        return Response(status=412, headers=headers)
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return Response(status=304, headers=headers)
+
+    if accel_redirect:
+        headers['X-Accel-Redirect'] = accel_redirect
+        return Response(status=200, headers=headers, mimetype=mimetype)
+
+    ranges = requested_ranges(size) if _range_allowed(etag, last_modified) else None
+    if ranges == []:
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status=416, headers=headers)
+
+    if ranges and len(ranges) > 1:
+        return _multipart_response(path, size, ranges, mimetype, headers)
+
+    status = 200
+    start, stop = 0, size
+    if ranges:
+        start, stop = ranges[0]
+        status = 206
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+    headers['Content-Length'] = str(stop - start)
+    body = wrap_file(request.environ, FileRange(open(path, 'rb'), start, stop - start), BLOCK_SIZE)
+    return Response(body, status=status, headers=headers, mimetype=mimetype, direct_passthrough=True)
+
+
+def _multipart_response(path, size, ranges, mimetype, headers):
+    """206 multipart/byteranges response with one part per range"""
+    boundary = secrets.token_hex(16)
+    part_headers = [
+        (f'--{boundary}\r\nContent-Type: {mimetype}\r\n'
+         f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n').encode('ascii')
+        for start, stop in ranges
+    ]
+    closing = f'--{boundary}--\r\n'.encode('ascii')
+    length = sum(len(part) + (stop - start) + 2 for part, (start, stop) in zip(part_headers, ranges)) + len(closing)
+
+    def generate():
+        with open(path, 'rb') as f:
+            for part, (start, stop) in zip(part_headers, ranges):
+                yield part
+                body = FileRange(f, start, stop - start)
+                while True:
+                    data = body.read(BLOCK_SIZE)
+                    if not data:
+                        break
+                    yield data
+                yield b'\r\n'
+            yield closing
+
+    headers['Content-Length'] = str(length)
+    return Response(generate(), status=206, headers=headers, direct_passthrough=True,
+                    content_type=f'multipart/byteranges; boundary={boundary}')
@@ -0,0 +1,205 @@
+"""
+Choosing which files of a torrent to download.
+
+File priorities are libtorrent's 0-7, where 0 skips the file; the API also
+takes the names in FILE_PRIORITIES. They are set with one
+prioritize_files() call for the whole torrent, and for .torrent files
+already in the add_torrent_params, so skipped files are never allocated.
+Rules pick files by glob, extension and size. A magnet's files aren't
+known until its metadata arrives, so its rules wait in a RuleStore (a
+JSON file, so they survive a restart) and are applied on
+metadata_received_alert. The priorities themselves are saved with the
+torrent's fast-resume data.
+"""
+
+import fnmatch
+import os
+
+from session_profiles import load_config, save_config
+
+FILE_PRIORITIES = {'skip': 0, 'low': 1, 'normal': 4, 'high': 7}
+DEFAULT_FILE_PRIORITY = FILE_PRIORITIES['normal']
+RULE_FIELDS = ('include', 'exclude', 'extensions', 'min_size', 'max_size')
+
+
+class SelectionError(ValueError):
+    """Raised for invalid file priorities or rules"""
+
+
+def parse_priority(value):
+    """A priority name or number as libtorrent's 0-7"""
+    if isinstance(value, str) and value in FILE_PRIORITIES:
+        return FILE_PRIORITIES[value]
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value <= 7:
+        raise SelectionError(f"File priority must be 0-7 or one of: {', '.join(FILE_PRIORITIES)}")
+    return value
+
+
+def _string_list(rules, field):
+    value = rules.get(field) or []
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list) or not all(isinstance(item, str) and item for item in value):
+        raise SelectionError(f'{field} must be a list of strings')
+    return value
+
+
+def _size(rules, field):
+    value = rules.get(field)
+    if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 0):
+        raise SelectionError(f'{field} must be a number of bytes')
+    return value
+
+
+def parse_rules(rules):
+    """Validate file rules; returns None when there are none
+
+    include and exclude are case-insensitive globs matched against the
+    file's name, or for globs with a slash against the end of its path in
+    the torrent ("sub/*" matches "Show/sub/notes.txt"); extensions may be
+    given with or without the dot. A file is downloaded if it matches an include
+    glob (when there are any) and an extension (when there are any), is
+    within min_size/max_size and matches no exclude glob.
+    """
+    if rules is None:
+        return None
+    if not isinstance(rules, dict):
+        raise SelectionError('File rules must be an object')
+    unknown = [field for field in rules if field not in RULE_FIELDS]
+    if unknown:
+        raise SelectionError(f"Unknown file rules: {', '.join(unknown)}")
+    parsed = {
+        'include': _string_list(rules, 'include'),
+        'exclude': _string_list(rules, 'exclude'),
+        'extensions': ['.' + ext.lower().lstrip('.') for ext in _string_list(rules, 'extensions')],
+        'min_size': _size(rules, 'min_size'),
+        'max_size': _size(rules, 'max_size'),
+    }
+    if not (parsed['include'] or parsed['exclude'] or parsed['extensions']) \
+            and parsed['min_size'] is None and parsed['max_size'] is None:
+        return None
+    return parsed
+
+
+def _matches(path, pattern):
+    parts = path.replace(os.sep, '/').lower().split('/')
+    pattern = pattern.lower()
+    if '/' not in pattern:
+        return fnmatch.fnmatchcase(parts[-1], pattern)
+    return any(fnmatch.fnmatchcase('/'.join(parts[start:]), pattern) for start in range(len(parts)))
+
+
+def wanted(path, size, rules):
+    """Whether the rules select a file"""
+    if rules['include'] and not any(_matches(path, pattern) for pattern in rules['include']):
+        return False
+    if rules['extensions'] and not path.lower().endswith(tuple(rules['extensions'])):
+        return False
+    if rules['min_size'] is not None and size < rules['min_size']:
+        return False
+    if rules['max_size'] is not None and size > rules['max_size']:
+        return False
+    return not any(_matches(path, pattern) for pattern in rules['exclude'])
+
+
+def _is_pad(files, index):
+    return bool(files.file_flags(index) & files.flag_pad_file)
+
+
+def select_files(files, current, priorities=None, rules=None):
+    """New priorities for every file of a file_storage
+
+    current is the list of current priorities. Rules skip the files they
+    don't select and give skipped files they do select the normal
+    priority; priorities, a list with one entry per file or a dict from
+    file index to priority, are applied on top.
+    """
+    result = list(current)
+    if rules:
+        for index in range(files.num_files()):
+            if _is_pad(files, index):
+                continue
+            if not wanted(files.file_path(index), files.file_size(index), rules):
+                result[index] = 0
+            elif not result[index]:
+                result[index] = DEFAULT_FILE_PRIORITY
+
+    if priorities is None:
+        return result
+    if isinstance(priorities, list):
+        if len(priorities) != files.num_files():
+            raise SelectionError(f'Expected {files.num_files()} file priorities, got {len(priorities)}')
+        priorities = dict(enumerate(priorities))
+    if not isinstance(priorities, dict):
+        raise SelectionError('File priorities must be a list or an object of file index to priority')
+    for key, value in priorities.items():
+        try:
+            index = int(key)
+        except ValueError:
+            raise SelectionError(f'Invalid file index: {key}')
+        if not 0 <= index < files.num_files():
+            raise SelectionError(f'Invalid file index: {key}')
+        if not _is_pad(files, index):
+            result[index] = parse_priority(value)
+    return result
+
+
+def file_entries(files, priorities, progress):
+    """The API view of a torrent's files (pad files left out)"""
+    entries = []
+    for index in range(files.num_files()):
+        if _is_pad(files, index):
+            continue
+        size = files.file_size(index)
+        entries.append({
+            'index': index,
+            'path': files.file_path(index),
+            'name': files.file_name(index),
+            'size': size,
+            'priority': priorities[index],
+            'progress': round(progress[index] * 100 / size, 2) if size else 100.0,
+        })
+    return entries
+
+
+def file_tree(entries):
+    """Nest file entries in folders with their total and selected sizes"""
+    root = {'children': []}
+    folders = {}
+    for entry in entries:
+        parent = root
+        parts = entry['path'].split(os.sep)
+        for depth in range(1, len(parts)):
+            path = os.sep.join(parts[:depth])
+            folder = folders.get(path)
+            if folder is None:
+                folder = {'name': parts[depth - 1], 'path': path, 'size': 0, 'selected_size': 0, 'children': []}
+                folders[path] = folder
+                parent['children'].append(folder)
+            folder['size'] += entry['size']
+            if entry['priority']:
+                folder['selected_size'] += entry['size']
+            parent = folder
+        parent['children'].append(entry)
+    return root['children']
+
+
+class RuleStore:
+    """File rules of torrents waiting for their metadata, saved to a JSON file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.rules = load_config(path)
+
+    def get(self, key):
+        return self.rules.get(key)
+
+    def set(self, key, rules):
+        self.rules[key] = rules
+        save_config(self.path, self.rules)
+
+    def pop(self, key):
+        rules = self.rules.pop(key, None)
+        if rules is not None:
+            save_config(self.path, self.rules)
+        return rules
@@ -0,0 +1,66 @@
+"""
+Gunicorn settings for serving the app in production (gunicorn app:app).
+
+The libtorrent session, the torrent manager and the file index live in the
+app module, so the app must be imported by exactly one process: there is a
+single worker, and concurrency comes from its thread pool (the gthread
+worker). Each request runs on one of WEB_THREADS threads; downloads, ZIP
+archives, /api/stream and /api/events clients each hold a thread for as
+long as they are open, while status polls are short. The app answers 503
+to streams and event clients beyond OPEN_STREAM_LIMIT (half the threads by
+default), so they can't leave the status polls without a thread.
+"""
+
+import os
+import signal
+import threading
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '80')}"
+worker_class = 'gthread'
+workers = 1
+threads = int(os.environ.get('WEB_THREADS', 32))
+# Long downloads don't count against the timeout: the gthread worker
+# reports to the arbiter from its main loop, not from request threads
+timeout = 60
+keepalive = 5
+# The worker is killed once graceful_timeout runs out, so it covers the final
+# resume data save, which gets all but the last few seconds of it
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', 35))
+SHUTDOWN_TIMEOUT = max(graceful_timeout - 5, 1)
+# Files sent with send_file go out with os.sendfile()
+sendfile = True
+accesslog = os.environ.get('ACCESS_LOG')
+errorlog = '-'
+
+
+def on_starting(server):
+    if server.cfg.workers != 1:
+        server.log.warning("Only one worker can own the libtorrent session; using 1 worker with %s threads",
+                           server.cfg.threads)
+        server.cfg.set('workers', 1)
+
+
+def post_worker_init(worker):
+    """Save the torrents as soon as the worker is told to stop
+
+    The worker waits up to graceful_timeout for open requests, and the
+    arbiter kills it when that runs out, so the final resume data save
+    starts right away instead of after the downloads have drained.
+    """
+    import app
+
+    handle_exit = worker.handle_exit
+
+    def handle_exit_and_save(signum, frame):
+        handle_exit(signum, frame)
+        threading.Thread(target=app.torrent_manager.shutdown, kwargs={'timeout': SHUTDOWN_TIMEOUT},
+                         name='torrent-shutdown').start()
+
+    signal.signal(signal.SIGTERM, handle_exit_and_save)
+
+
+def worker_int(worker):
+    """Save the torrents before the worker quits on Ctrl+C"""
+    import app
+
+    app.torrent_manager.shutdown(timeout=SHUTDOWN_TIMEOUT)
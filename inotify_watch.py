@@ -0,0 +1,218 @@
+"""
+inotify-driven updates for the file index.
+
+Watches the downloads directory recursively with Linux inotify (through a
+small ctypes binding, so no extra package is needed) and applies create,
+modify, delete and move events to a FileIndex as they happen. Events are
+coalesced per path and applied in batches, so a torrent writing thousands
+of pieces a second costs one stat per file per batch.
+
+If inotify isn't available, or the kernel's watch limit is reached, the
+watcher gives up and the index falls back to its periodic rescans. A queue
+overflow triggers a single rescan.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+import time
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR)
+
+_EVENT = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+FLUSH_INTERVAL = 1.0  # Seconds events are coalesced before being applied
+
+# Pending actions per path; a later event for the same path replaces an earlier one
+_UPDATE_FILE = 'update_file'
+_UPDATE_TREE = 'update_tree'
+_REMOVE = 'remove'
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class WatchLimitReached(Exception):
+    """Raised when the kernel refuses more inotify watches"""
+
+
+class DirectoryWatcher:
+    """Keeps a FileIndex current from inotify events on its root directory"""
+
+    def __init__(self, index, flush_interval=FLUSH_INTERVAL):
+        self.index = index
+        self.root = index.root
+        self.flush_interval = flush_interval
+        self.fd = None
+        self.libc = None
+        self.watches = {}  # watch descriptor -> directory path relative to the root
+        self.pending = {}  # rel path -> pending action
+        self.running = False
+        self._thread = None
+
+    def start(self):
+        """Start watching; returns False if inotify can't be used on this system"""
+        self.libc = _load_libc()
+        if self.libc is None:
+            return False
+        fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            print(f"inotify unavailable ({os.strerror(ctypes.get_errno())}), using periodic rescans")
+            return False
+        self.fd = fd
+
+        try:
+            self._watch_tree('')
+        except WatchLimitReached:
+            self._give_up("inotify watch limit reached")
+            return False
+
+        self.index.watched = True
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name='file-index-watcher', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self.running = False
+        if self._thread:
+            self._thread.join()
+        self._close()
+
+    # Watch management
+
+    def _add_watch(self, rel_dir):
+        path = os.path.join(self.root, rel_dir) if rel_dir else self.root
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise WatchLimitReached()
+            # The directory vanished or isn't readable; its events will tell us
+            return
+        self.watches[wd] = rel_dir
+
+    def _watch_tree(self, rel_dir):
+        """Watch a directory and every directory below it"""
+        top = os.path.join(self.root, rel_dir) if rel_dir else self.root
+        for root, dirs, files in os.walk(top):
+            rel_root = os.path.relpath(root, self.root).replace('\\', '/')
+            self._add_watch('' if rel_root == '.' else rel_root)
+
+    def _unwatch_tree(self, rel_dir):
+        prefix = rel_dir + '/'
+        for wd, path in list(self.watches.items()):
+            if path == rel_dir or path.startswith(prefix):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+
+    def _give_up(self, reason):
+        print(f"{reason}, falling back to periodic rescans of {self.root}")
+        self.running = False
+        self.index.watched = False
+        self._close()
+
+    def _close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.watches.clear()
+
+    # Event loop
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while self.running:
+            try:
+                readable, _, _ = select.select([self.fd], [], [], self.flush_interval)
+                if readable:
+                    self._read_events()
+                if time.monotonic() - last_flush >= self.flush_interval:
+                    self._flush()
+                    last_flush = time.monotonic()
+            except WatchLimitReached:
+                self._flush()
+                self._give_up("inotify watch limit reached")
+                self.index.request_rescan()
+            except Exception as e:
+                print(f"Error processing inotify events: {e}")
+                self.index.request_rescan()
+
+    def _read_events(self):
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+            offset += _EVENT.size + length
+            self._handle_event(wd, mask, os.fsdecode(name))
+
+    def _handle_event(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            # Events were dropped; only a rescan can tell what changed
+            self.pending.clear()
+            self.index.request_rescan()
+            return
+        if mask & IN_IGNORED:
+            self.watches.pop(wd, None)
+            return
+
+        rel_dir = self.watches.get(wd)
+        if rel_dir is None or not name:
+            return
+        rel_path = f"{rel_dir}/{name}" if rel_dir else name
+
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_tree(rel_path)
+                self.pending[rel_path] = _UPDATE_TREE
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._unwatch_tree(rel_path)
+                self.pending[rel_path] = _REMOVE
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            self.pending[rel_path] = _REMOVE
+        else:
+            self.pending[rel_path] = _UPDATE_FILE
+
+    def _flush(self):
+        """Apply the coalesced events to the index"""
+        pending, self.pending = self.pending, {}
+        for rel_path, action in pending.items():
+            if action == _REMOVE:
+                self.index.remove_tree(rel_path)
+                self.index.remove_file(rel_path)
+            elif action == _UPDATE_TREE:
+                self.index.update_tree(rel_path)
+            else:
+                self.index.update_file(rel_path)
@@ -0,0 +1,154 @@
+"""
+JSON encoding for API responses.
+
+dumps() encodes with orjson when it is installed and falls back to the
+standard library otherwise; both produce compact UTF-8 bytes. JSONProvider
+plugs it into Flask, so every jsonify() response goes through it.
+
+Large listings are mostly made of entries that don't change between
+requests, so they can be encoded once: FragmentCache keeps the encoded
+bytes of each entry for as long as the entry is the same object (the
+torrent manager and the file index replace an entry's dict when it
+changes), and Encoded wraps JSON that is spliced into a response as it is.
+"""
+
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+FRAGMENT_CACHE_SIZE = 100000  # Entries per cache generation
+
+
+def _default(obj):
+    if isinstance(obj, Encoded):
+        # Only top-level values of a response are spliced
+        raise TypeError('Encoded JSON can only be a value of the response object')
+    return DefaultJSONProvider.default(obj)
+
+
+if orjson is not None:
+    # Leave dates to Flask's default so they look the same with either backend
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(obj):
+        """Encode obj as compact JSON bytes"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    loads = orjson.loads
+else:
+    def dumps(obj):
+        """Encode obj as compact JSON bytes"""
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    loads = json.loads
+
+
+class Encoded:
+    """A value that is already encoded JSON"""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+
+def encoded_object(members):
+    """An Encoded JSON object from encoded "key":value members (see FragmentCache.member)"""
+    return Encoded(b'{' + b','.join(members) + b'}')
+
+
+def encoded_array(values):
+    """An Encoded JSON array of encoded values"""
+    return Encoded(b'[' + b','.join(values) + b']')
+
+
+def encode(obj):
+    """Encode obj, splicing in Encoded values of a top-level dict"""
+    if isinstance(obj, Encoded):
+        return obj.data
+    if isinstance(obj, dict) and any(isinstance(value, Encoded) for value in obj.values()):
+        return b'{' + b','.join(
+            dumps(str(key)) + b':' + (value.data if isinstance(value, Encoded) else dumps(value))
+            for key, value in obj.items()
+        ) + b'}'
+    return dumps(obj)
+
+
+class FragmentCache:
+    """Encoded JSON of API entries, reused while an entry is the same object
+
+    Entries are kept in two generations: lookups move them into the current
+    one, and when it is full the previous generation is dropped. Entries
+    that are no longer requested (removed torrents and files) age out that
+    way without the cache having to know what is still live.
+    """
+
+    def __init__(self, size=FRAGMENT_CACHE_SIZE):
+        self.size = size
+        self._current = {}
+        self._previous = {}
+
+    def encode(self, key, entry, view=None):
+        """The encoded JSON of entry, or of view(entry) when view is given"""
+        cached = self._current.get(key) or self._promote(key)
+        if cached is not None and cached[0] is entry:
+            return cached[1]
+        data = dumps(view(entry) if view else entry)
+        self._store(key, (entry, data))
+        return data
+
+    def member(self, key, entry, view=None):
+        """Like encode(), as the object member "key":value for encoded_object()"""
+        cached = self._current.get(key) or self._promote(key)
+        if cached is not None and cached[0] is entry:
+            return cached[1]
+        data = dumps(str(key)) + b':' + dumps(view(entry) if view else entry)
+        self._store(key, (entry, data))
+        return data
+
+    def _promote(self, key):
+        cached = self._previous.pop(key, None)
+        if cached is not None:
+            self._store(key, cached)
+        return cached
+
+    def _store(self, key, cached):
+        if key not in self._current and len(self._current) >= self.size:
+            self._previous = self._current
+            self._current = {}
+        self._current[key] = cached
+
+    def discard(self, key):
+        self._current.pop(key, None)
+        self._previous.pop(key, None)
+
+    def __len__(self):
+        return len(self._current) + len(self._previous)
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask JSON provider using dumps() and loads() from this module
+
+    Responses are always compact and keep the keys in insertion order.
+    Top-level Encoded values of a response object are spliced in as they are.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(encode(obj) + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,89 @@
+"""
+Content-addressed cache of torrent metadata.
+
+A magnet link only carries an info-hash, so libtorrent has to find peers
+(usually through the DHT) and download the info dict from them before it
+knows the torrent's name and files. Once it has, the torrent is written to
+this cache as a .torrent file named after its info-hash, once for the v1
+hash and once for the v2 hash of v2 torrents. Adding the same magnet again
+starts from the cached file: the torrent has its metadata the moment it is
+added. A file is only used if its content hashes to its name, so a
+corrupt or foreign file is dropped rather than added.
+
+v2 piece layers are only known once the pieces are, so they may be
+missing from a cached file; libtorrent then requests them from peers.
+"""
+
+import os
+import string
+
+import libtorrent as lt
+
+TORRENT_SUFFIX = '.torrent'
+TEMP_SUFFIX = '.tmp'
+
+
+def is_info_hash(value):
+    """Whether value is a hex v1 (40 characters) or v2 (64 characters) info-hash"""
+    return len(value) in (40, 64) and all(c in string.hexdigits for c in value)
+
+
+def hash_keys(info_hashes):
+    """The hex info-hashes a torrent is cached under"""
+    keys = []
+    if info_hashes.has_v1():
+        keys.append(str(info_hashes.v1))
+    if info_hashes.has_v2():
+        keys.append(str(info_hashes.v2))
+    return keys
+
+
+class MetadataCache:
+    """.torrent files of torrents seen before, keyed by info-hash"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key.lower() + TORRENT_SUFFIX)
+
+    def get(self, info_hash):
+        """The cached torrent_info for a hex info-hash, or None"""
+        if not is_info_hash(info_hash):
+            return None
+        path = self._path(info_hash)
+        try:
+            with open(path, 'rb') as f:
+                torrent_info = lt.torrent_info(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, RuntimeError) as e:
+            print(f"Dropping unreadable cached torrent {path}: {e}")
+            self._remove(path)
+            return None
+        if info_hash.lower() not in hash_keys(torrent_info.info_hashes()):
+            print(f"Dropping cached torrent {path}: its info-hash doesn't match")
+            self._remove(path)
+            return None
+        return torrent_info
+
+    def store(self, torrent_info, trackers=()):
+        """Write a torrent's metadata (and trackers) under each of its info-hashes"""
+        params = lt.add_torrent_params()
+        params.ti = torrent_info
+        params.trackers = list(trackers)
+        data = lt.bencode(lt.write_torrent_file(params, lt.write_flags.allow_missing_piece_layer))
+        for key in hash_keys(torrent_info.info_hashes()):
+            path = self._path(key)
+            temp_path = path + TEMP_SUFFIX
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
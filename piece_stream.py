@@ -0,0 +1,179 @@
+"""
+Streaming a torrent's file while it downloads.
+
+A FileStream serves one byte range of one file. The range is mapped to the
+torrent's pieces, and the torrent downloads sequentially, with piece
+deadlines for the next READAHEAD_PIECES pieces of the range, so libtorrent
+requests those pieces first and from the fastest peers. The generator
+hands out the file piece by piece: the piece it needs next gets a deadline
+with alert_when_available, so libtorrent posts its data in a
+read_piece_alert once it has passed its hash check, or right away if it
+already has. The file on disk isn't read directly because a checked piece
+can still be in libtorrent's write buffer. Request threads wait on a
+PieceWaiter, which the alert thread feeds with read_piece_alert and
+metadata_received_alert; no per-piece alerts are needed for the rest of
+the session.
+"""
+
+import os
+import threading
+import time
+
+import libtorrent as lt
+
+METADATA_TIMEOUT = 30  # Seconds a stream of a magnet waits for the metadata
+READAHEAD_PIECES = 8  # Pieces ahead of the reader that get a deadline
+DEADLINE_STEP_MS = 300  # Deadline spacing between consecutive pieces
+PIECE_TIMEOUT = 120  # Seconds to wait for a piece before ending the stream
+
+
+class StreamError(Exception):
+    """Raised when a stream can't be opened; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+class PieceWaiter:
+    """Lets request threads wait for pieces and metadata reported by the alert thread"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._waiting = {}  # (handle, piece) -> readers waiting for its data
+        self._read = {}  # (handle, piece) -> data of its read_piece_alert (None if the read failed)
+        self._wakeups = 0  # Counts notifications, so none is missed between a check and a wait
+
+    def notify(self):
+        with self._condition:
+            self._wakeups += 1
+            self._condition.notify_all()
+
+    def piece_read(self, alert):
+        """Hand a read_piece_alert's data to the readers waiting for the piece"""
+        key = (alert.handle, alert.piece)
+        with self._condition:
+            if key in self._waiting:
+                self._read[key] = None if alert.error.value() else alert.buffer
+                self._wakeups += 1
+                self._condition.notify_all()
+
+    def read_piece(self, handle, piece, timeout, request=None):
+        """The data of a piece, or None if it can't be read in time
+
+        request() makes libtorrent post the piece's read_piece_alert; it
+        defaults to reading a piece the torrent already has.
+        """
+        key = (handle, piece)
+        with self._condition:
+            self._waiting[key] = self._waiting.get(key, 0) + 1
+        try:
+            if request:
+                request()
+            else:
+                handle.read_piece(piece)
+            if not self.wait_for(lambda: key in self._read or not handle.is_valid(), timeout):
+                return None
+            with self._condition:
+                return self._read.get(key)
+        finally:
+            with self._condition:
+                self._waiting[key] -= 1
+                if not self._waiting[key]:
+                    del self._waiting[key]
+                    self._read.pop(key, None)
+
+    def wait_for(self, predicate, timeout):
+        """Wait until predicate() is true; returns False on timeout
+
+        The predicate runs outside the lock, since it may call into
+        libtorrent, and is re-checked at least once a second, so a torrent
+        that is removed meanwhile doesn't keep a request waiting.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._condition:
+                wakeups = self._wakeups
+            if predicate():
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            with self._condition:
+                if self._wakeups == wakeups:
+                    self._condition.wait(min(remaining, 1))
+
+
+class FileStream:
+    """Reads one file of a torrent in piece order as the pieces arrive"""
+
+    def __init__(self, handle, file_index, waiter, save_path):
+        torrent_info = handle.torrent_file()
+        files = torrent_info.files()
+        self.handle = handle
+        self.waiter = waiter
+        self.index = file_index
+        self.name = files.file_name(file_index)
+        self.path = os.path.join(save_path, files.file_path(file_index))
+        self.size = files.file_size(file_index)
+        self.offset = files.file_offset(file_index)
+        self.piece_length = torrent_info.piece_length()
+        self._deadlines = set()
+
+    def complete(self):
+        """Whether the whole file has been downloaded"""
+        return self.handle.file_progress(lt.torrent_handle.piece_granularity)[self.index] >= self.size
+
+    def piece_at(self, position):
+        """Index of the piece holding the byte at position in the file"""
+        return (self.offset + position) // self.piece_length
+
+    def _set_deadlines(self, piece, last_piece):
+        """Give the next pieces of the range deadlines, nearest first"""
+        for step, ahead in enumerate(range(piece, min(piece + READAHEAD_PIECES, last_piece + 1))):
+            if ahead not in self._deadlines and not self.handle.have_piece(ahead):
+                self.handle.set_piece_deadline(ahead, step * DEADLINE_STEP_MS)
+                self._deadlines.add(ahead)
+
+    def _request(self, piece):
+        """Have libtorrent post the piece's data once it has it (at once if it already has)"""
+        self.handle.set_piece_deadline(piece, 0, lt.deadline_flags_t.alert_when_available)
+        self._deadlines.add(piece)
+
+    def _clear_deadlines(self):
+        """Drop the deadlines of pieces this stream asked for and no longer needs"""
+        if self.handle.is_valid():
+            for piece in self._deadlines:
+                if not self.handle.have_piece(piece):
+                    self.handle.reset_piece_deadline(piece)
+        self._deadlines.clear()
+
+    def generate(self, start, stop):
+        """Yield the bytes start..stop-1 of the file, one piece's worth at a time
+
+        Ends early (leaving the response short of its Content-Length) if a
+        piece doesn't arrive within PIECE_TIMEOUT or the torrent is removed.
+        """
+        try:
+            position = start
+            last_piece = self.piece_at(stop - 1) if start < stop else -1
+            while position < stop:
+                piece = self.piece_at(position)
+                self._set_deadlines(piece, last_piece)
+                data = self.waiter.read_piece(self.handle, piece, PIECE_TIMEOUT,
+                                              lambda: self._request(piece))
+                if not self.handle.is_valid():
+                    return
+                if data is None:
+                    print(f"Stream of {self.name} timed out or couldn't read piece {piece}")
+                    return
+                self._deadlines.discard(piece)
+                # Where the piece starts in the file; negative for a piece shared with the previous file
+                piece_start = piece * self.piece_length - self.offset
+                chunk = data[position - piece_start:stop - piece_start]
+                if not chunk:
+                    return
+                position += len(chunk)
+                yield chunk
+        finally:
+            self._clear_deadlines()
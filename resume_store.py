@@ -0,0 +1,108 @@
+"""
+On-disk store for libtorrent fast-resume data.
+
+Each torrent's resume data (the bencoded add_torrent_params libtorrent
+produces in a save_resume_data_alert, including the info dict) lives in
+its own <info-hash>.resume file. Saves are staged in memory and written
+in batches: every file of a batch is written to a temporary name and
+synced, then all of them are renamed into place and the directory is
+synced once, so a crash leaves either the old or the new data and never
+a partial file.
+"""
+
+import os
+import threading
+
+import libtorrent as lt
+
+RESUME_SUFFIX = '.resume'
+TEMP_SUFFIX = '.tmp'
+
+
+class ResumeStore:
+    """Batched, atomic persistence of fast-resume data keyed by info-hash"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.pending = {}  # key -> bencoded resume data waiting for flush()
+        self.removed = set()
+        self.lock = threading.Lock()
+        # Held for a whole flush, so two flushes can't share a temporary file
+        # or rename data back into place after the other removed it
+        self._flush_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + RESUME_SUFFIX)
+
+    def stage(self, key, params):
+        """Queue resume data (add_torrent_params) for the next flush"""
+        data = lt.write_resume_data_buf(params)
+        with self.lock:
+            self.pending[key] = data
+            self.removed.discard(key)
+
+    def remove(self, key):
+        with self.lock:
+            self.pending.pop(key, None)
+            self.removed.add(key)
+
+    def flush(self):
+        """Write staged resume data and removals to disk; returns the number written"""
+        with self._flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+                removed, self.removed = self.removed, set()
+            if not pending and not removed:
+                return 0
+            self._write(pending, removed)
+            return len(pending)
+
+    def _write(self, pending, removed):
+        temp_paths = []
+        for key, data in pending.items():
+            temp_path = self._path(key) + TEMP_SUFFIX
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            temp_paths.append((temp_path, self._path(key)))
+
+        for temp_path, path in temp_paths:
+            os.replace(temp_path, path)
+        for key in removed:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+        self._sync_directory()
+
+    def _sync_directory(self):
+        try:
+            fd = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def load(self):
+        """Yield (key, add_torrent_params) for every stored torrent"""
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name.endswith(TEMP_SUFFIX):
+                # Left over from a flush interrupted before its rename
+                os.remove(path)
+                continue
+            if not name.endswith(RESUME_SUFFIX):
+                continue
+            try:
+                with open(path, 'rb') as f:
+                    params = lt.read_resume_data(f.read())
+            except Exception as e:
+                print(f"Skipping unreadable resume data {name}: {e}")
+                continue
+            yield name[:-len(RESUME_SUFFIX)], params
@@ -0,0 +1,190 @@
+"""
+libtorrent session configuration and performance profiles.
+
+The session is configured through settings_pack names (a plain dict passed
+to lt.session() / session.apply_settings()). BASE_SETTINGS holds what every
+deployment shares; a named profile then tunes disk threads, send buffers,
+connection limits and queueing for a kind of workload. The profile is
+picked with the SESSION_PROFILE environment variable or the "profile" key
+of the session config file, which can also carry per-setting overrides,
+and can be switched at runtime.
+"""
+
+import json
+import os
+
+import libtorrent as lt
+
+DEFAULT_PROFILE = 'default'
+
+# Alerts the torrent manager relies on (status updates, finished, resume data,
+# storage moves). Streams get their pieces as read_piece_alerts (storage), so
+# the per-piece alerts of every torrent stay off. The errors it handles are
+# storage or status alerts too; the error category on its own would add
+# dht_error_alert, which the Python bindings don't wrap and which crashes the
+# interpreter when popped while another thread runs Python code
+ALERT_MASK = (lt.alert.category_t.status_notification |
+              lt.alert.category_t.storage_notification)
+
+# Alerts are dropped once this many are queued, resume data saves included;
+# libtorrent's default of 2000 is small next to a batch save of every torrent
+ALERT_QUEUE_SIZE = 50000
+
+BASE_SETTINGS = {
+    # Network
+    'listen_interfaces': '0.0.0.0:6881,[::]:6881',
+    'max_failcount': 3,
+
+    # DHT and peer exchange; UPnP and NAT-PMP are useless on cloud servers
+    'enable_dht': True,
+    'enable_lsd': True,
+    'enable_upnp': False,
+    'enable_natpmp': False,
+    'dht_bootstrap_nodes': 'router.bittorrent.com:6881,dht.transmissionbt.com:6881,'
+                           'router.utorrent.com:6881,dht.libtorrent.org:25401',
+
+    # Choking algorithm (for better performance)
+    'choking_algorithm': int(lt.choking_algorithm_t.rate_based_choker),
+
+    # Tracker settings
+    'tracker_completion_timeout': 30,
+    'tracker_receive_timeout': 10,
+    'stop_tracker_timeout': 5,
+    'announce_to_all_trackers': True,
+    'announce_to_all_tiers': True,
+
+    'alert_mask': int(ALERT_MASK),
+    'alert_queue_size': ALERT_QUEUE_SIZE,
+}
+
+# libtorrent 2.x reads and writes through memory-mapped files, so there is no
+# disk cache to size; throughput is governed by the disk and hashing threads,
+# how much is buffered per peer and how many torrents are active at once.
+PROFILES = {
+    'default': {
+        'description': 'Balanced settings for a small server',
+        'settings': {
+            'connections_limit': 500,
+            'aio_threads': 4,
+            'hashing_threads': 2,
+            'send_buffer_watermark': 1024 * 1024,
+            'send_buffer_low_watermark': 64 * 1024,
+            'active_downloads': 5,
+            'active_seeds': 10,
+            'active_limit': 500,
+        },
+    },
+    'seedbox': {
+        'description': 'High-throughput seedbox: many peers, deep buffers, fast uploads',
+        'settings': {
+            'connections_limit': 2000,
+            'aio_threads': 16,
+            'hashing_threads': 4,
+            'send_buffer_watermark': 8 * 1024 * 1024,
+            'send_buffer_low_watermark': 1024 * 1024,
+            'send_buffer_watermark_factor': 150,
+            'max_queued_disk_bytes': 16 * 1024 * 1024,
+            'unchoke_slots_limit': 32,
+            'seed_choking_algorithm': int(lt.seed_choking_algorithm_t.fastest_upload),
+            'max_out_request_queue': 1500,
+            'max_allowed_in_request_queue': 4000,
+            'active_downloads': 10,
+            'active_seeds': 50,
+            'active_limit': 1000,
+            'file_pool_size': 500,
+        },
+    },
+    'low-memory': {
+        'description': 'Small VPS: few threads, small buffers and peer lists',
+        'settings': {
+            'connections_limit': 100,
+            'aio_threads': 2,
+            'hashing_threads': 1,
+            'send_buffer_watermark': 256 * 1024,
+            'send_buffer_low_watermark': 16 * 1024,
+            'send_buffer_watermark_factor': 25,
+            'max_queued_disk_bytes': 256 * 1024,
+            'max_peerlist_size': 500,
+            'max_paused_peerlist_size': 100,
+            'unchoke_slots_limit': 4,
+            'active_downloads': 2,
+            'active_seeds': 3,
+            'active_limit': 20,
+            'file_pool_size': 20,
+        },
+    },
+    'many-torrents': {
+        'description': 'Thousands of mostly idle torrents: keep them announced, limit the busy ones',
+        'settings': {
+            'connections_limit': 1000,
+            'aio_threads': 8,
+            'hashing_threads': 2,
+            'send_buffer_watermark': 512 * 1024,
+            'send_buffer_low_watermark': 32 * 1024,
+            'active_downloads': 8,
+            'active_seeds': 2000,
+            'active_limit': 4000,
+            'active_tracker_limit': 4000,
+            'active_dht_limit': 1000,
+            'active_lsd_limit': 200,
+            'dont_count_slow_torrents': True,
+            'auto_scrape_interval': 3600,
+            'max_paused_peerlist_size': 100,
+            'file_pool_size': 200,
+        },
+    },
+}
+
+
+class ProfileError(ValueError):
+    """Raised for unknown profiles or settings"""
+
+
+def build_settings(profile, overrides=None):
+    """Return the settings_pack dict for a profile plus any overrides"""
+    if profile not in PROFILES:
+        raise ProfileError(f"Unknown profile '{profile}', choose one of: {', '.join(PROFILES)}")
+    defaults = lt.default_settings()
+    # Settings tuned by any profile start from libtorrent's default, so
+    # switching profiles at runtime doesn't keep the previous one's values
+    settings = {name: defaults[name] for p in PROFILES.values() for name in p['settings']}
+    settings.update(BASE_SETTINGS)
+    settings.update(PROFILES[profile]['settings'])
+    if overrides:
+        unknown = [name for name in overrides if name not in defaults]
+        if unknown:
+            raise ProfileError(f"Unknown settings: {', '.join(unknown)}")
+        # lt.session() would refuse a value of the wrong type (bool is no int here)
+        wrong = [f"{name} (expected {type(defaults[name]).__name__})"
+                 for name, value in overrides.items() if type(value) is not type(defaults[name])]
+        if wrong:
+            raise ProfileError(f"Wrong type for settings: {', '.join(wrong)}")
+        settings.update(overrides)
+    return settings
+
+
+def load_config(path):
+    """Read the session config file; a missing file means the defaults"""
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable session config {path}: {e}")
+        return {}
+    return config if isinstance(config, dict) else {}
+
+
+def save_config(path, config):
+    """Write the session config file atomically"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(config, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def select_profile(config):
+    """The profile to start with: SESSION_PROFILE, then the config file, then the default"""
+    return os.environ.get('SESSION_PROFILE') or config.get('profile') or DEFAULT_PROFILE
@@ -1,6 +1,11 @@
 // Global variables
 let refreshInterval;
 
+// File list paging state
+const FILES_PAGE_SIZE = 100;
+let filesFolder = null;
+let filesCursor = null;
+
 // Utility function to escape HTML characters
 function escapeHtml(text) {
     const map = {
@@ -209,11 +214,12 @@ async function refreshTorrents() {
     const container = document.getElementById('torrentsContainer');
     
     try {
-        const response = await fetch('/api/torrents');
+        const response = await fetch('/api/torrents?files=1');
         const result = await response.json();
         
         if (result.success) {
-            displayTorrents(result.torrents);
+            torrentsState = result.torrents;
+            displayTorrents(torrentsState);
         } else {
             container.innerHTML = `
                 <div class="empty-state">
@@ -258,34 +264,11 @@ function createTorrentHTML(torrent) {
     const statusClass = `status-${torrent.status}`;
     const progressWidth = Math.max(0, Math.min(100, torrent.progress));
     
-    // Create download files section for completed torrents
-    let downloadFilesHtml = '';
-    if ((torrent.status === 'completed' || torrent.status === 'seeding') && torrent.download_files && torrent.download_files.length > 0) {
-        downloadFilesHtml = `
-            <div class="download-files">
-                <h4><i class="fas fa-download"></i> Available Downloads:</h4>
-                <div class="download-files-list">
-                    ${torrent.download_files.map(file => `
-                        <div class="download-file-item">
-                            <div class="download-file-info">
-                                <span class="download-file-name">${escapeHtml(file.name)}</span>
-                                <span class="download-file-size">${formatBytes(file.size)}</span>
-                            </div>
-                            <a href="/api/download/${encodeURIComponent(file.path)}" class="btn-download-small" title="Download ${escapeHtml(file.name)}">
-                                <i class="fas fa-download"></i>
-                            </a>
-                        </div>
-                    `).join('')}
-                </div>
-            </div>
-        `;
-    }
-    
     return `
-        <div class="torrent-item">
+        <div class="torrent-item" data-torrent-id="${torrent.id}">
             <div class="torrent-header">
-                <h3 class="torrent-name">${escapeHtml(torrent.name)}</h3>
-                <span class="torrent-status ${statusClass}">${torrent.status}</span>
+                <h3 class="torrent-name" data-field="name">${escapeHtml(torrent.name)}</h3>
+                <span class="torrent-status ${statusClass}" data-field="status">${torrent.status}</span>
             </div>
             
             <div class="progress-container">
@@ -298,23 +281,23 @@ function createTorrentHTML(torrent) {
             <div class="torrent-info">
                 <div class="info-item">
                     <div class="info-label">Size</div>
-                    <div class="info-value">${formatBytes(torrent.size)}</div>
+                    <div class="info-value" data-field="size">${formatBytes(torrent.size)}</div>
                 </div>
                 <div class="info-item">
                     <div class="info-label">Download Speed</div>
-                    <div class="info-value">${formatSpeed(torrent.download_rate)}</div>
+                    <div class="info-value" data-field="download_rate">${formatSpeed(torrent.download_rate)}</div>
                 </div>
                 <div class="info-item">
                     <div class="info-label">Upload Speed</div>
-                    <div class="info-value">${formatSpeed(torrent.upload_rate)}</div>
+                    <div class="info-value" data-field="upload_rate">${formatSpeed(torrent.upload_rate)}</div>
                 </div>
                 <div class="info-item">
                     <div class="info-label">Peers</div>
-                    <div class="info-value">${torrent.peers}</div>
+                    <div class="info-value" data-field="peers">${torrent.peers}</div>
                 </div>
                 <div class="info-item">
                     <div class="info-label">Seeds</div>
-                    <div class="info-value">${torrent.seeds}</div>
+                    <div class="info-value" data-field="seeds">${torrent.seeds}</div>
                 </div>
                 <div class="info-item">
                     <div class="info-label">Added</div>
@@ -322,25 +305,149 @@ function createTorrentHTML(torrent) {
                 </div>
             </div>
             
-            ${downloadFilesHtml}
+            <div class="download-files-slot">${createDownloadFilesHTML(torrent)}</div>
             
-            <div class="torrent-actions">
-                ${torrent.status === 'paused' ? 
-                    `<button class="action-btn btn-success" onclick="resumeTorrent('${torrent.id}')">
-                        <i class="fas fa-play"></i> Resume
-                    </button>` :
-                    `<button class="action-btn btn-warning" onclick="pauseTorrent('${torrent.id}')">
-                        <i class="fas fa-pause"></i> Pause
-                    </button>`
-                }
-                <button class="action-btn btn-danger" onclick="removeTorrent('${torrent.id}')">
-                    <i class="fas fa-trash"></i> Remove
-                </button>
+            <div class="torrent-actions">${createTorrentActionsHTML(torrent)}</div>
+        </div>
+    `;
+}
+
+// Create the download files section for completed torrents
+function createDownloadFilesHTML(torrent) {
+    if (!((torrent.status === 'completed' || torrent.status === 'seeding') && torrent.download_files && torrent.download_files.length > 0)) {
+        return '';
+    }
+    return `
+        <div class="download-files">
+            <h4><i class="fas fa-download"></i> Available Downloads:</h4>
+            <div class="download-files-list">
+                ${torrent.download_files.map(file => `
+                    <div class="download-file-item">
+                        <div class="download-file-info">
+                            <span class="download-file-name">${escapeHtml(file.name)}</span>
+                            <span class="download-file-size">${formatBytes(file.size)}</span>
+                        </div>
+                        <a href="/api/download/${encodeURIComponent(file.path)}" class="btn-download-small" title="Download ${escapeHtml(file.name)}">
+                            <i class="fas fa-download"></i>
+                        </a>
+                    </div>
+                `).join('')}
             </div>
         </div>
     `;
 }
 
+// Create the pause/resume and remove buttons for a torrent
+function createTorrentActionsHTML(torrent) {
+    return `
+        ${torrent.status === 'paused' ? 
+            `<button class="action-btn btn-success" onclick="resumeTorrent('${torrent.id}')">
+                <i class="fas fa-play"></i> Resume
+            </button>` :
+            `<button class="action-btn btn-warning" onclick="pauseTorrent('${torrent.id}')">
+                <i class="fas fa-pause"></i> Pause
+            </button>`
+        }
+        <button class="action-btn btn-danger" onclick="removeTorrent('${torrent.id}')">
+            <i class="fas fa-trash"></i> Remove
+        </button>
+    `;
+}
+
+// Live updates pushed by /api/events
+let eventSource = null;
+let torrentsState = {};
+
+function connectEvents() {
+    eventSource = new EventSource('/api/events');
+    
+    eventSource.addEventListener('snapshot', (event) => {
+        const data = JSON.parse(event.data);
+        torrentsState = data.torrents;
+        displayTorrents(torrentsState);
+        if (data.storage) {
+            displayStorageInfo(data.storage);
+        }
+    });
+    
+    eventSource.addEventListener('torrents', (event) => {
+        applyTorrentDelta(JSON.parse(event.data));
+    });
+    
+    eventSource.addEventListener('storage', (event) => {
+        displayStorageInfo(JSON.parse(event.data));
+    });
+}
+
+// Apply changed and removed torrents to the list, touching only what changed
+function applyTorrentDelta(delta) {
+    const container = document.getElementById('torrentsContainer');
+    let rebuild = false;
+    
+    delta.removed.forEach(id => {
+        delete torrentsState[id];
+        const element = container.querySelector(`[data-torrent-id="${id}"]`);
+        if (element) {
+            element.remove();
+        }
+    });
+    
+    Object.entries(delta.changed).forEach(([id, fields]) => {
+        if (!torrentsState[id]) {
+            torrentsState[id] = fields;
+            if (container.querySelector('.empty-state')) {
+                rebuild = true;
+            } else {
+                container.insertAdjacentHTML('beforeend', createTorrentHTML(fields));
+            }
+            return;
+        }
+        const torrent = Object.assign(torrentsState[id], fields);
+        const element = container.querySelector(`[data-torrent-id="${id}"]`);
+        if (element) {
+            patchTorrent(element, torrent, fields);
+        }
+    });
+    
+    if (rebuild || Object.keys(torrentsState).length === 0) {
+        displayTorrents(torrentsState);
+    }
+}
+
+// Update the DOM nodes of one torrent for the fields that changed
+function patchTorrent(element, torrent, fields) {
+    const setField = (name, text) => {
+        const node = element.querySelector(`[data-field="${name}"]`);
+        if (node) {
+            node.textContent = text;
+        }
+    };
+    
+    if ('name' in fields) setField('name', torrent.name);
+    if ('size' in fields) setField('size', formatBytes(torrent.size));
+    if ('download_rate' in fields) setField('download_rate', formatSpeed(torrent.download_rate));
+    if ('upload_rate' in fields) setField('upload_rate', formatSpeed(torrent.upload_rate));
+    if ('peers' in fields) setField('peers', torrent.peers);
+    if ('seeds' in fields) setField('seeds', torrent.seeds);
+    
+    if ('progress' in fields) {
+        const progressWidth = Math.max(0, Math.min(100, torrent.progress));
+        element.querySelector('.progress-fill').style.width = `${progressWidth}%`;
+        element.querySelector('.progress-text').textContent = `${progressWidth.toFixed(1)}% complete`;
+    }
+    
+    if ('status' in fields) {
+        const status = element.querySelector('[data-field="status"]');
+        status.className = `torrent-status status-${torrent.status}`;
+        status.textContent = torrent.status;
+        element.querySelector('.torrent-actions').innerHTML = createTorrentActionsHTML(torrent);
+    }
+    
+    if ('status' in fields || 'download_files' in fields) {
+        element.querySelector('.download-files-slot').innerHTML = createDownloadFilesHTML(torrent);
+    }
+}
+
 // Torrent control functions
 async function pauseTorrent(torrentId) {
     try {
@@ -541,16 +648,18 @@ function displayFolders(folders) {
 }
 
 // Refresh files
-async function refreshFiles() {
+async function refreshFiles(folder = null) {
     const container = document.getElementById('filesContainer');
     container.innerHTML = '<div class="files-loading"><i class="fas fa-spinner fa-spin"></i> Loading files...</div>';
     
+    filesFolder = folder;
+    filesCursor = null;
+    
     try {
-        const response = await fetch('/api/files');
-        const result = await response.json();
+        const result = await fetchFilesPage();
         
         if (result.success) {
-            displayFiles(result.files);
+            displayFiles(result.files, false, result.next_cursor);
         } else {
             container.innerHTML = `<div class="empty-state">
                 <i class="fas fa-exclamation-triangle"></i>
@@ -558,6 +667,7 @@ async function refreshFiles() {
                 <p>${result.message}</p>
             </div>`;
         }
+        return result;
     } catch (error) {
         container.innerHTML = `<div class="empty-state">
             <i class="fas fa-exclamation-triangle"></i>
@@ -567,11 +677,41 @@ async function refreshFiles() {
     }
 }
 
-// Display files
-function displayFiles(files) {
+// Fetch the next page of files for the current folder filter
+async function fetchFilesPage() {
+    const params = new URLSearchParams({ limit: FILES_PAGE_SIZE, sort: 'name' });
+    if (filesFolder) params.set('folder', filesFolder);
+    if (filesCursor) params.set('cursor', filesCursor);
+    
+    const response = await fetch(`/api/files?${params}`);
+    return response.json();
+}
+
+// Append the next page of files
+async function loadMoreFiles() {
+    const button = document.getElementById('loadMoreFiles');
+    if (button) button.disabled = true;
+    
+    try {
+        const result = await fetchFilesPage();
+        if (result.success) {
+            displayFiles(result.files, true, result.next_cursor);
+        } else {
+            showToast('Error', result.message, 'error');
+        }
+    } catch (error) {
+        showToast('Error', 'Failed to load more files: ' + error.message, 'error');
+    } finally {
+        if (button) button.disabled = false;
+    }
+}
+
+// Display files, either replacing the list or appending another page
+function displayFiles(files, append = false, nextCursor = null) {
     const container = document.getElementById('filesContainer');
+    filesCursor = nextCursor;
     
-    if (files.length === 0) {
+    if (!append && files.length === 0) {
         container.innerHTML = `<div class="empty-state">
             <i class="fas fa-file"></i>
             <h3>No files found</h3>
@@ -627,7 +767,21 @@ function displayFiles(files) {
         </div>
     `).join('');
     
-    container.innerHTML = bulkActionsHtml + filesHtml;
+    const loadMoreHtml = nextCursor ? `
+        <div class="load-more" id="loadMoreContainer">
+            <button id="loadMoreFiles" class="btn-secondary" onclick="loadMoreFiles()">
+                <i class="fas fa-chevron-down"></i> Load more
+            </button>
+        </div>
+    ` : '';
+    
+    if (append) {
+        const previous = document.getElementById('loadMoreContainer');
+        if (previous) previous.remove();
+        container.insertAdjacentHTML('beforeend', filesHtml + loadMoreHtml);
+    } else {
+        container.innerHTML = bulkActionsHtml + filesHtml + loadMoreHtml;
+    }
 }
 
 // Get file icon based on extension
@@ -695,24 +849,13 @@ function getFileIconClass(extension) {
 
 // Show folder files
 async function showFolderFiles(folderPath) {
-    try {
-        const response = await fetch('/api/files');
-        const result = await response.json();
-        
-        if (result.success) {
-            // Filter files by folder
-            const folderFiles = result.files.filter(file => 
-                file.folder === folderPath || file.path.startsWith(folderPath + '/')
-            );
-            
-            // Switch to file view and display filtered files
-            showFileView();
-            displayFiles(folderFiles);
-            
-            showToast('Success', `Showing ${folderFiles.length} files from ${folderPath}`, 'success');
-        }
-    } catch (error) {
-        showToast('Error', 'Failed to load folder files: ' + error.message, 'error');
+    // Switch to file view and let the server filter files by folder
+    showFileView();
+    const result = await refreshFiles(folderPath);
+    
+    if (result && result.success) {
+        const more = result.next_cursor ? '+' : '';
+        showToast('Success', `Showing ${result.files.length}${more} files from ${folderPath}`, 'success');
     }
 }
 
@@ -749,13 +892,21 @@ function showFolderDetails(folderPath) {
 
 // Update auto refresh to include files
 function startAutoRefresh() {
+    // Torrent and storage updates are pushed when the browser supports it
+    const pushed = !!window.EventSource;
+    if (pushed) {
+        connectEvents();
+    }
+    
     refreshInterval = setInterval(() => {
-        refreshTorrents();
-        refreshStorage();
+        if (!pushed) {
+            refreshTorrents();
+            refreshStorage();
+        }
         // Refresh files every 30 seconds instead of every 5 seconds
         if (Date.now() % 30000 < 5000) {
             refreshFolders();
-            refreshFiles();
+            refreshFiles(filesFolder);
         }
     }, 5000); // 5 second intervals
 }
@@ -881,7 +1032,14 @@ async function downloadSelectedFiles() {
             document.body.removeChild(a);
             
             closeBulkModal();
-            showToast('Success', `Downloaded ${selectedFiles.size} files as ${filename}`, 'success');
+            
+            // Report how much the per-file compression policy saved
+            let savedMessage = '';
+            const uncompressedSize = parseInt(response.headers.get('X-Uncompressed-Size'), 10);
+            if (!isNaN(uncompressedSize) && uncompressedSize > blob.size) {
+                savedMessage = ` (${formatBytes(uncompressedSize - blob.size)} saved by compression)`;
+            }
+            showToast('Success', `Downloaded ${selectedFiles.size} files as ${filename}${savedMessage}`, 'success');
             
             // Clear selection
             selectedFiles.clear();
@@ -947,7 +1105,7 @@ async function deleteFile(filePath, fileName) {
         if (result.success) {
             showToast('Success', result.message, 'success');
             closeDeleteModal();
-            refreshFiles();
+            refreshFiles(filesFolder);
             refreshStorage();
         } else {
             showToast('Error', 'Failed to delete file: ' + result.message, 'error');
@@ -1015,7 +1173,7 @@ async function deleteSelectedFiles() {
             
             closeDeleteModal();
             closeBulkModal();
-            refreshFiles();
+            refreshFiles(filesFolder);
             refreshStorage();
             
             // Clear selection
@@ -1034,56 +1192,16 @@ async function deleteSelectedFiles() {
 }
 
 // Download folder as ZIP
-async function downloadFolderAsZip(folderPath) {
-    try {
-        showToast('Info', 'Creating ZIP file...', 'info');
-        
-        const response = await fetch(`/api/folder/download/${encodeURIComponent(folderPath)}`);
-        
-        if (response.ok) {
-            // Create a blob from the response and trigger download
-            const blob = await response.blob();
-            
-            // Check if we actually got a ZIP file
-            if (blob.size === 0) {
-                showToast('Error', 'ZIP file is empty. No files found in folder.', 'error');
-                return;
-            }
-            
-            const url = window.URL.createObjectURL(blob);
-            const a = document.createElement('a');
-            a.style.display = 'none';
-            a.href = url;
-            
-            // Get filename from response headers or create one
-            const contentDisposition = response.headers.get('Content-Disposition');
-            let filename = `${folderPath}.zip`;
-            if (contentDisposition) {
-                const matches = /filename[^;=\n]*=((['"]).*?\2|[^;\n]*)/.exec(contentDisposition);
-                if (matches != null && matches[1]) {
-                    filename = matches[1].replace(/['"]/g, '');
-                }
-            }
-            
-            a.download = filename;
-            document.body.appendChild(a);
-            a.click();
-            window.URL.revokeObjectURL(url);
-            document.body.removeChild(a);
-            
-            showToast('Success', `Folder downloaded as ${filename}`, 'success');
-        } else {
-            let errorMessage = 'Failed to download folder';
-            try {
-                const result = await response.json();
-                errorMessage = result.message || errorMessage;
-            } catch (e) {
-                // If response is not JSON, use default message
-            }
-            showToast('Error', errorMessage, 'error');
-        }
-    } catch (error) {
-        console.error('Download folder error:', error);
-        showToast('Error', 'Network error while downloading folder: ' + error.message, 'error');
-    }
+function downloadFolderAsZip(folderPath) {
+    // The archive is streamed by the server, so let the browser save it
+    // directly instead of buffering the whole ZIP in memory as a blob
+    const a = document.createElement('a');
+    a.style.display = 'none';
+    a.href = `/api/folder/download/${encodeURIComponent(folderPath)}`;
+    a.download = `${folderPath.split('/').pop()}.zip`;
+    document.body.appendChild(a);
+    a.click();
+    document.body.removeChild(a);
+    
+    showToast('Info', 'ZIP download started', 'info');
 }
\ No newline at end of file
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests for the bandwidth scheduler
+"""
+
+import hashlib
+import os
+import tempfile
+from datetime import datetime
+
+import libtorrent as lt
+
+from bandwidth import BandwidthScheduler, BandwidthError, validate_schedule, rule_applies
+
+MONDAY_NOON = datetime(2024, 5, 6, 12, 0)
+MONDAY_NIGHT = datetime(2024, 5, 6, 23, 30)
+SATURDAY_NOON = datetime(2024, 5, 11, 12, 0)
+
+BUSINESS_HOURS = {'start': '09:00', 'end': '18:00', 'days': ['mon', 'tue', 'wed', 'thu', 'fri'],
+                  'download': 2048, 'upload': 256, 'seed_upload': 90}
+NIGHT = {'start': '22:00', 'end': '06:00', 'upload': 4096}
+
+
+def _expect_error(function, *args):
+    try:
+        function(*args)
+    except BandwidthError:
+        return
+    assert False, f'{function.__name__}{args} should fail'
+
+
+def test_schedule_rules():
+    business, night = validate_schedule([BUSINESS_HOURS, NIGHT])
+    assert rule_applies(business, MONDAY_NOON)
+    assert not rule_applies(business, SATURDAY_NOON)
+    assert not rule_applies(business, MONDAY_NIGHT)
+    # Night rules run over midnight
+    assert rule_applies(night, MONDAY_NIGHT)
+    assert rule_applies(night, datetime(2024, 5, 7, 5, 59))
+    assert not rule_applies(night, datetime(2024, 5, 7, 6, 0))
+
+    with tempfile.TemporaryDirectory() as root:
+        scheduler = BandwidthScheduler(os.path.join(root, 'bandwidth.json'))
+        scheduler.update([BUSINESS_HOURS, NIGHT], {'download': 0, 'upload': 8192})
+        assert scheduler.active_rule(MONDAY_NOON)['download'] == 2048
+        assert scheduler.active_rule(MONDAY_NIGHT)['upload'] == 4096
+        assert scheduler.active_rule(SATURDAY_NOON) == {'download': 0, 'upload': 8192}
+
+        _expect_error(validate_schedule, [{'start': '9am'}])
+        _expect_error(validate_schedule, [{'start': '10:00', 'end': '10:00'}])
+        _expect_error(validate_schedule, [{'days': ['monday']}])
+        _expect_error(validate_schedule, [{'download': -1}])
+        _expect_error(validate_schedule, [{'upload_limit': 10}])
+        # Nothing changes when part of an update is invalid
+        _expect_error(scheduler.update, [], None, {'tv': {'download': 'fast'}})
+        assert len(scheduler.schedule) == 2
+
+
+def test_torrent_shares():
+    with tempfile.TemporaryDirectory() as root:
+        scheduler = BandwidthScheduler(os.path.join(root, 'bandwidth.json'))
+        scheduler.update(labels={'tv': {'download': 1000, 'upload': 300}})
+        scheduler.set_label('a', 'tv')
+        scheduler.set_label('b', 'tv')
+        scheduler.set_torrent_limits('b', {'download': 200})
+        rule = {'seed_upload': 90}
+
+        entries = [('a', 'downloading'), ('b', 'downloading'), ('c', 'seeding'), ('d', 'seeding')]
+        assert scheduler.torrent_limits(entries, rule) == {
+            'a': (500, 150),
+            'b': (200, 150),  # its own limit is lower than the label share
+            'c': (0, 45),  # seeders share seed_upload while anything downloads
+            'd': (0, 45),
+        }
+        # Without downloads, seeding is unlimited
+        assert scheduler.torrent_limits([('c', 'seeding')], rule) == {'c': (0, 0)}
+
+        scheduler.set_label('b', None)
+        scheduler.set_torrent_limits('b', {'download': None})
+        assert 'b' not in scheduler.torrents
+        _expect_error(scheduler.set_label, 'a', 42)
+
+        scheduler.save()
+        restored = BandwidthScheduler(scheduler.path)
+        assert restored.label('a') == 'tv' and restored.labels == scheduler.labels
+
+
+def test_apply_to_session():
+    with tempfile.TemporaryDirectory() as root:
+        session = lt.session({'listen_interfaces': '127.0.0.1:0', 'enable_dht': False, 'enable_lsd': False})
+        entries = []
+        for key, status in (('a', 'downloading'), ('b', 'downloading'), ('c', 'paused')):
+            params = lt.parse_magnet_uri(f'magnet:?xt=urn:btih:{hashlib.sha1(key.encode()).hexdigest()}')
+            params.save_path = root
+            entries.append((key, session.add_torrent(params), status))
+
+        scheduler = BandwidthScheduler(os.path.join(root, 'bandwidth.json'))
+        scheduler.update([BUSINESS_HOURS], {'lan_download': 100}, {'tv': {'download': 1000}})
+        scheduler.set_label('a', 'tv')
+        scheduler.set_label('b', 'tv')
+
+        assert scheduler.apply(session, entries, MONDAY_NOON) == scheduler.schedule[0]
+        global_class = session.get_peer_class(lt.session.global_peer_class_id)
+        assert (global_class['download_limit'], global_class['upload_limit']) == (2048 * 1024, 256 * 1024)
+        assert global_class['label'] == 'global'
+        # Paused torrents don't take a share of their label's limit
+        scheduler.set_label('c', 'tv')
+        scheduler.apply(session, entries, MONDAY_NOON)
+        assert [handle.download_limit() for _, handle, _ in entries] == [500 * 1024, 500 * 1024, -1]
+
+        scheduler.apply(session, entries, SATURDAY_NOON)
+        assert session.get_peer_class(lt.session.global_peer_class_id)['download_limit'] == 0
+        assert session.get_peer_class(lt.session.local_peer_class_id)['download_limit'] == 100 * 1024
+
+
+if __name__ == "__main__":
+    test_schedule_rules()
+    test_torrent_shares()
+    test_apply_to_session()
+    print("✅ Bandwidth tests passed")
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Tests for the Server-Sent Events broker
+"""
+
+import json
+
+from event_stream import EventBroker, format_event
+
+
+def _parse(message):
+    lines = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+    return lines['event'], json.loads(lines['data'])
+
+
+def test_format_event():
+    message = format_event('torrents', {'changed': {}, 'removed': ['abc']})
+    assert message.endswith('\n\n')
+    assert _parse(message) == ('torrents', {'changed': {}, 'removed': ['abc']})
+
+
+def test_fan_out():
+    broker = EventBroker()
+    first = broker.subscribe(('snapshot', {'torrents': {}}))
+    second = broker.subscribe()
+
+    broker.publish('torrents', {'changed': {'a': {'progress': 50}}, 'removed': []})
+
+    assert _parse(first.queue.get_nowait())[0] == 'snapshot'
+    for subscriber in (first, second):
+        event, data = _parse(subscriber.queue.get_nowait())
+        assert event == 'torrents'
+        assert data['changed']['a']['progress'] == 50
+        assert subscriber.queue.empty()
+
+    broker.unsubscribe(second)
+    assert broker.subscriber_count() == 1
+
+
+def test_slow_subscriber_is_dropped():
+    broker = EventBroker()
+    slow = broker.subscribe()
+    fast = broker.subscribe()
+    for i in range(slow.queue.maxsize + 1):
+        broker.publish('storage', {'n': i})
+        while not fast.queue.empty():
+            fast.queue.get_nowait()
+
+    assert slow.dropped
+    assert broker.subscriber_count() == 1
+    # A dropped subscriber's stream ends so the client reconnects
+    stream = slow.stream()
+    assert next(stream).startswith('retry:')
+    assert list(stream) == []
+
+
+if __name__ == "__main__":
+    test_format_event()
+    test_fan_out()
+    test_slow_subscriber_is_dropped()
+    print("✅ Event stream tests passed")
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Tests for the downloads directory index
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from file_index import FileIndex, TreeScanner, decode_cursor
+from inotify_watch import DirectoryWatcher, WatchLimitReached
+
+
+def _write(root, rel_path, size):
+    path = os.path.join(root, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+
+def _make_tree(root):
+    _write(root, 'single.mkv', 100)
+    _write(root, 'Show/ep1.mkv', 1000)
+    _write(root, 'Show/ep2.mkv', 2000)
+    _write(root, 'Show/Subs/ep1.srt', 10)
+    os.makedirs(os.path.join(root, 'Empty'))
+
+
+def test_scan():
+    with tempfile.TemporaryDirectory() as root:
+        _make_tree(root)
+        index = FileIndex(root)
+        index.scan()
+
+        files = {f['path']: f for f in index.list_files()}
+        assert set(files) == {'single.mkv', 'Show/ep1.mkv', 'Show/ep2.mkv', 'Show/Subs/ep1.srt'}
+        assert files['Show/Subs/ep1.srt']['folder'] == 'Show/Subs'
+        assert files['single.mkv']['folder'] == 'root'
+        assert files['Show/ep1.mkv']['mime_type'] == 'video/x-matroska'
+        assert index.downloaded_size() == 3110
+
+        folders = {f['name']: f for f in index.list_folders()}
+        assert folders['Show']['file_count'] == 3
+        assert folders['Show']['size'] == 3010
+        assert folders['Empty']['file_count'] == 0
+
+
+def test_incremental_updates():
+    with tempfile.TemporaryDirectory() as root:
+        _make_tree(root)
+        index = FileIndex(root)
+        index.scan()
+
+        os.remove(os.path.join(root, 'Show/ep1.mkv'))
+        index.remove_file('Show/ep1.mkv')
+        assert index.downloaded_size() == 2110
+        assert {f['name']: f for f in index.list_folders()}['Show']['file_count'] == 2
+
+        _write(root, 'Movie/movie.mp4', 500)
+        _write(root, 'Movie/extras/trailer.mp4', 50)
+        index.update_tree('Movie')
+        folders = {f['name']: f for f in index.list_folders()}
+        assert folders['Movie']['file_count'] == 2
+        assert folders['Movie']['size'] == 550
+
+        _write(root, 'Show/ep2.mkv', 2500)
+        index.update_file('Show/ep2.mkv')
+        assert {f['name']: f for f in index.list_folders()}['Show']['size'] == 2510
+
+        shutil.rmtree(os.path.join(root, 'Show'))
+        index.remove_tree('Show')
+        assert 'Show' not in {f['name'] for f in index.list_folders()}
+        assert index.downloaded_size() == 650
+
+        # Incremental updates agree with a full rescan
+        rescanned = FileIndex(root)
+        rescanned.scan()
+        assert sorted(f['path'] for f in rescanned.list_files()) == sorted(f['path'] for f in index.list_files())
+        assert rescanned.downloaded_size() == index.downloaded_size()
+
+
+def test_paged_queries():
+    with tempfile.TemporaryDirectory() as root:
+        for i in range(25):
+            _write(root, f'Show/ep{i:02d}.mkv', 100 + i)
+        _write(root, 'Show/Subs/ep00.srt', 5)
+        _write(root, 'other.txt', 1)
+        index = FileIndex(root)
+        index.scan()
+
+        # Walking the cursor visits every file once, in order
+        paths = []
+        cursor = None
+        while True:
+            page, cursor = index.query_files(sort='size', limit=10, cursor=cursor)
+            paths.extend(f['path'] for f in page)
+            if cursor is None:
+                break
+            cursor = decode_cursor(cursor)
+        sizes = [f['size'] for f in index.list_files()]
+        assert len(paths) == 27
+        assert [index.files[p]['size'] for p in paths] == sorted(sizes)
+
+        page, _ = index.query_files(sort='size', descending=True, limit=3)
+        assert [f['size'] for f in page] == [124, 123, 122]
+
+        page, _ = index.query_files(folder='Show', extensions={'.srt'})
+        assert [f['path'] for f in page] == ['Show/Subs/ep00.srt']
+
+        page, _ = index.query_files(query='EP1')
+        assert len(page) == 10
+
+        # Counts agree with the filters of the pages
+        assert index.file_count() == 27
+        assert index.file_count(query='EP1') == 10
+        assert index.file_count(folder='Show', extensions={'.srt'}) == 1
+
+        # Incremental updates keep the sorted indexes in step
+        _write(root, 'Show/ep00.mkv', 1000)
+        index.update_file('Show/ep00.mkv')
+        index.remove_file('other.txt')
+        page, _ = index.query_files(sort='size', descending=True, limit=1)
+        assert page[0]['path'] == 'Show/ep00.mkv'
+        assert len(index.query_files()[0]) == 26
+
+
+def test_folder_queries():
+    with tempfile.TemporaryDirectory() as root:
+        for i in range(12):
+            _write(root, f'Show/ep{i:02d}.mkv', 100 + i)
+        _write(root, 'Show/Subs/ep00.srt', 5)
+        for i in range(30):
+            _write(root, f'Movie/part{i:02d}.mkv', i)
+        _write(root, 'Showcase.txt', 1)
+        index = FileIndex(root)
+        index.scan()
+
+        # A folder's pages come from its own index, in order, across cursors
+        paths = []
+        cursor = None
+        while True:
+            page, cursor = index.query_files(sort='name', folder='Show', limit=5, cursor=cursor)
+            paths.extend(f['path'] for f in page)
+            if cursor is None:
+                break
+            cursor = decode_cursor(cursor)
+        assert paths == sorted(paths, key=lambda p: (os.path.basename(p).lower(), p))
+        assert len(paths) == 13 and all(p.startswith('Show/') for p in paths)
+
+        assert index.file_count(folder='Show') == 13
+        assert index.file_count(folder='/Movie/', extensions={'.mkv', '.srt'}) == 30
+        assert index.file_count(folder='Show', extensions=set()) == 13
+        assert index.file_count(folder='Show/Subs') == 1
+        assert [f['path'] for f in index.query_files(folder='Show/Subs')[0]] == ['Show/Subs/ep00.srt']
+        assert index.file_count(folder='Movie', query='PART1') == 10
+        assert index.query_files(folder='Missing') == ([], None)
+        assert index.file_count(folder='Missing') == 0
+
+        # Incremental updates keep the folder indexes and counts in step
+        _write(root, 'Movie/extra.srt', 7)
+        index.update_file('Movie/extra.srt')
+        index.remove_file('Movie/part00.mkv')
+        assert index.file_count(folder='Movie') == 30
+        assert index.file_count(folder='Movie', extensions={'.srt'}) == 1
+        assert index.query_files(folder='Movie', sort='size', limit=1)[0][0]['path'] == 'Movie/part01.mkv'
+        shutil.rmtree(os.path.join(root, 'Movie'))
+        index.remove_tree('Movie')
+        assert index.file_count(folder='Movie') == 0
+        assert index.file_count() == 14
+
+
+def test_scanner_prunes_unchanged_directories():
+    with tempfile.TemporaryDirectory() as root:
+        _make_tree(root)
+        # Age everything so directory mtimes are trusted for pruning
+        old = time.time() - 3600
+        for dirpath, dirs, files in os.walk(root):
+            for name in files + dirs:
+                os.utime(os.path.join(dirpath, name), (old, old))
+        os.utime(root, (old, old))
+
+        scanner = TreeScanner(root, workers=4)
+        first = scanner.scan()
+        assert set(first) == {'', 'Show', 'Show/Subs', 'Empty'}
+        assert scanner.pruned == 0
+
+        scanner.scan()
+        assert scanner.pruned == 4
+
+        # Adding a file changes its directory's mtime, so only that one is listed again
+        _write(root, 'Show/Subs/ep2.srt', 20)
+        result = scanner.scan()
+        assert scanner.pruned == 3
+        assert result['Show/Subs'].files['ep2.srt'][0] == 20
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_inotify_watcher():
+    if not sys.platform.startswith('linux'):
+        return
+    with tempfile.TemporaryDirectory() as root:
+        _make_tree(root)
+        index = FileIndex(root)
+        watcher = DirectoryWatcher(index, flush_interval=0.1)
+        assert watcher.start()
+        index.scan()
+        try:
+            def folder(name):
+                return {f['name']: f for f in index.list_folders()}.get(name)
+
+            # New folder with files, created after the scan
+            _write(root, 'Movie/movie.mp4', 500)
+            _write(root, 'Movie/extras/trailer.mp4', 50)
+            assert _wait_for(lambda: folder('Movie') and folder('Movie')['size'] == 550)
+
+            # Growing file
+            _write(root, 'Show/ep1.mkv', 4000)
+            assert _wait_for(lambda: folder('Show')['size'] == 6010)
+
+            # Move between folders
+            os.rename(os.path.join(root, 'single.mkv'), os.path.join(root, 'Movie/single.mkv'))
+            assert _wait_for(lambda: folder('Movie')['file_count'] == 3)
+            assert 'single.mkv' not in {f['path'] for f in index.list_files()}
+
+            # Deleting a folder
+            shutil.rmtree(os.path.join(root, 'Show'))
+            assert _wait_for(lambda: folder('Show') is None)
+            assert index.downloaded_size() == 650
+        finally:
+            watcher.stop()
+
+
+def test_changes_during_scan_are_kept():
+    if not sys.platform.startswith('linux'):
+        return
+    with tempfile.TemporaryDirectory() as root:
+        _make_tree(root)
+        index = FileIndex(root)
+        watcher = DirectoryWatcher(index, flush_interval=0.1)
+        assert watcher.start()
+        list_tree = index.scanner.scan
+
+        def scan_then_change():
+            # The scan has listed the tree; the watcher indexes a new file and
+            # a deletion before the scan's result is swapped in
+            directories = list_tree()
+            _write(root, 'Show/ep3.mkv', 3000)
+            os.remove(os.path.join(root, 'single.mkv'))
+            assert _wait_for(lambda: 'Show/ep3.mkv' in index.files and 'single.mkv' not in index.files)
+            return directories
+
+        index.scanner.scan = scan_then_change
+        try:
+            index.scan()
+        finally:
+            watcher.stop()
+        paths = {f['path'] for f in index.list_files()}
+        assert 'Show/ep3.mkv' in paths and 'single.mkv' not in paths
+        assert {f['name']: f for f in index.list_folders()}['Show']['size'] == 6010
+        assert index.downloaded_size() == 6010
+
+
+def test_watch_limit_falls_back_to_rescans():
+    if not sys.platform.startswith('linux'):
+        return
+
+    class LimitedWatcher(DirectoryWatcher):
+        def _add_watch(self, rel_dir):
+            if len(self.watches) >= 2:
+                raise WatchLimitReached()
+            super()._add_watch(rel_dir)
+
+    with tempfile.TemporaryDirectory() as root:
+        _make_tree(root)
+        index = FileIndex(root)
+        assert not LimitedWatcher(index).start()
+        assert not index.watched
+
+
+if __name__ == "__main__":
+    test_scan()
+    test_incremental_updates()
+    test_paged_queries()
+    test_folder_queries()
+    test_scanner_prunes_unchanged_directories()
+    test_inotify_watcher()
+    test_changes_during_scan_are_kept()
+    test_watch_limit_falls_back_to_rescans()
+    print("✅ File index tests passed")
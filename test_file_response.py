@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Tests for file downloads with ranges and conditional requests
+"""
+
+import os
+import tempfile
+
+from flask import Flask
+
+from file_response import send_download
+
+DATA = bytes(range(256)) * 40  # 10240 bytes
+
+
+def _client(root, **kwargs):
+    path = os.path.join(root, 'video.mkv')
+    with open(path, 'wb') as f:
+        f.write(DATA)
+    app = Flask(__name__)
+
+    @app.route('/download')
+    def download():
+        return send_download(path, 'vidéo.mkv', **kwargs)
+
+    return app.test_client()
+
+
+def test_full_and_single_range():
+    with tempfile.TemporaryDirectory() as root:
+        client = _client(root)
+        response = client.get('/download')
+        assert response.status_code == 200
+        assert response.data == DATA
+        assert response.headers['Content-Length'] == str(len(DATA))
+        assert response.headers['Accept-Ranges'] == 'bytes'
+        assert "filename*=UTF-8''vid%C3%A9o.mkv" in response.headers['Content-Disposition']
+
+        response = client.get('/download', headers={'Range': 'bytes=100-199'})
+        assert response.status_code == 206
+        assert response.data == DATA[100:200]
+        assert response.headers['Content-Range'] == f'bytes 100-199/{len(DATA)}'
+        assert response.headers['Content-Length'] == '100'
+
+        response = client.get('/download', headers={'Range': 'bytes=-10'})
+        assert response.data == DATA[-10:]
+        response = client.get('/download', headers={'Range': 'bytes=10000-'})
+        assert response.data == DATA[10000:]
+
+        response = client.get('/download', headers={'Range': 'bytes=20000-'})
+        assert response.status_code == 416
+        assert response.headers['Content-Range'] == f'bytes */{len(DATA)}'
+
+
+def test_multiple_ranges():
+    with tempfile.TemporaryDirectory() as root:
+        client = _client(root)
+        response = client.get('/download', headers={'Range': 'bytes=0-9,500-509,505-519'})
+        assert response.status_code == 206
+        assert response.mimetype == 'multipart/byteranges'
+        assert response.headers['Content-Length'] == str(len(response.data))
+
+        boundary = response.mimetype_params['boundary'].encode()
+        parts = response.data.split(b'--' + boundary)
+        assert parts[0] == b'' and parts[-1] == b'--\r\n'
+        # Overlapping ranges are merged into one part
+        assert len(parts) == 4
+        first_headers, first_body = parts[1].split(b'\r\n\r\n', 1)
+        assert b'Content-Range: bytes 0-9/10240' in first_headers
+        assert first_body == DATA[0:10] + b'\r\n'
+        second_headers, second_body = parts[2].split(b'\r\n\r\n', 1)
+        assert b'Content-Range: bytes 500-519/10240' in second_headers
+        assert second_body == DATA[500:520] + b'\r\n'
+
+
+def test_conditional_requests():
+    with tempfile.TemporaryDirectory() as root:
+        client = _client(root)
+        response = client.get('/download')
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+
+        assert client.get('/download', headers={'If-None-Match': etag}).status_code == 304
+        assert client.get('/download', headers={'If-Modified-Since': last_modified}).status_code == 304
+        assert client.get('/download', headers={'If-Match': '"other"'}).status_code == 412
+        assert client.get('/download', headers={'If-Match': etag}).status_code == 200
+
+        # A range only applies while the client's copy is current
+        response = client.get('/download', headers={'Range': 'bytes=0-9', 'If-Range': etag})
+        assert response.status_code == 206
+        response = client.get('/download', headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+        assert response.status_code == 200
+        assert response.data == DATA
+
+
+def test_accel_redirect():
+    with tempfile.TemporaryDirectory() as root:
+        client = _client(root, accel_redirect='/internal/downloads/vid%C3%A9o.mkv')
+        response = client.get('/download', headers={'Range': 'bytes=0-9'})
+        assert response.status_code == 200
+        assert response.headers['X-Accel-Redirect'] == '/internal/downloads/vid%C3%A9o.mkv'
+        assert response.data == b''
+
+
+if __name__ == "__main__":
+    test_full_and_single_range()
+    test_multiple_ranges()
+    test_conditional_requests()
+    test_accel_redirect()
+    print("✅ File response tests passed")
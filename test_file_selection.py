@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Tests for file priorities and selection rules
+"""
+
+import os
+import tempfile
+
+import libtorrent as lt
+
+from file_selection import (SelectionError, RuleStore, parse_rules, parse_priority, select_files,
+                            file_entries, file_tree)
+
+FILES = {
+    'Pack/Show.S01E01.mkv': 700,
+    'Pack/Show.S01E02.MKV': 800,
+    'Pack/sample/sample.mkv': 50,
+    'Pack/Extras/making-of.mp4': 900,
+    'Pack/readme.txt': 10,
+}
+
+
+def _files():
+    fs = lt.file_storage()
+    for path, size in FILES.items():
+        fs.add_file(path, size)
+    return fs
+
+
+def _expect_error(function, *args):
+    try:
+        function(*args)
+    except SelectionError:
+        return
+    assert False, f'{function.__name__}{args} should fail'
+
+
+def test_rules():
+    files = _files()
+    normal = [4] * files.num_files()
+
+    rules = parse_rules({'extensions': ['MKV'], 'exclude': ['sample/*']})
+    assert select_files(files, normal, rules=rules) == [4, 4, 0, 0, 0]
+
+    rules = parse_rules({'include': ['*E02*', 'Extras/*'], 'min_size': 850})
+    assert select_files(files, normal, rules=rules) == [0, 0, 0, 4, 0]
+
+    # Rules bring back skipped files they select and keep other priorities
+    rules = parse_rules({'max_size': 100})
+    assert select_files(files, [7, 0, 0, 1, 0], rules=rules) == [0, 0, 4, 0, 4]
+
+    assert parse_rules(None) is None
+    assert parse_rules({'include': []}) is None
+    _expect_error(parse_rules, {'glob': '*.mkv'})
+    _expect_error(parse_rules, {'min_size': '1 GB'})
+    _expect_error(parse_rules, {'include': [1]})
+
+
+def test_priorities():
+    files = _files()
+    normal = [4] * files.num_files()
+
+    assert select_files(files, normal, [0, 1, 'high', 'skip', 'normal']) == [0, 1, 7, 0, 4]
+    assert select_files(files, normal, {'1': 'skip', 3: 7}) == [4, 0, 4, 7, 4]
+    # Explicit priorities win over rules
+    rules = parse_rules({'extensions': ['txt']})
+    assert select_files(files, normal, {0: 'high'}, rules) == [7, 0, 0, 0, 4]
+
+    assert parse_priority('low') == 1
+    _expect_error(parse_priority, 8)
+    _expect_error(parse_priority, True)
+    _expect_error(select_files, files, normal, [4, 4])
+    _expect_error(select_files, files, normal, {'9': 4})
+    _expect_error(select_files, files, normal, {'first': 4})
+
+
+def test_entries_and_tree():
+    files = _files()
+    entries = file_entries(files, [4, 0, 0, 4, 4], [700, 400, 0, 0, 10])
+    assert entries[1] == {'index': 1, 'path': os.path.join('Pack', 'Show.S01E02.MKV'), 'name': 'Show.S01E02.MKV',
+                          'size': 800, 'priority': 0, 'progress': 50.0}
+
+    tree = file_tree(entries)
+    assert len(tree) == 1
+    pack = tree[0]
+    assert (pack['name'], pack['size'], pack['selected_size']) == ('Pack', 2460, 1610)
+    folders = {child['name']: child for child in pack['children'] if 'children' in child}
+    assert folders['sample']['selected_size'] == 0
+    assert folders['Extras']['children'][0]['index'] == 3
+
+
+def test_rule_store():
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'file_rules.json')
+        store = RuleStore(path)
+        rules = parse_rules({'extensions': ['mkv']})
+        store.set('aaa', rules)
+        assert RuleStore(path).get('aaa') == rules
+        assert store.pop('aaa') == rules
+        assert store.pop('aaa') is None
+        assert RuleStore(path).get('aaa') is None
+
+
+if __name__ == "__main__":
+    test_rules()
+    test_priorities()
+    test_entries_and_tree()
+    test_rule_store()
+    print("✅ File selection tests passed")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for the API JSON encoding layer
+"""
+
+import importlib
+import json
+import sys
+from datetime import datetime
+
+from flask import Flask, jsonify
+
+import json_encoding
+from json_encoding import FragmentCache, JSONProvider, encode, encoded_array, encoded_object
+
+
+def test_encode_and_splice():
+    entry = {'name': 'ép1.mkv', 'size': 200000, 'tags': ('a', 'b')}
+    assert json.loads(encode(entry)) == {'name': 'ép1.mkv', 'size': 200000, 'tags': ['a', 'b']}
+
+    files = encoded_array([encode(entry), encode({'name': 'notes.txt'})])
+    torrents = encoded_object([FragmentCache().member('abc', {'id': 'abc'})])
+    body = encode({'success': True, 'files': files, 'torrents': torrents, 'total': 2})
+    assert json.loads(body) == {
+        'success': True,
+        'files': [{'name': 'ép1.mkv', 'size': 200000, 'tags': ['a', 'b']}, {'name': 'notes.txt'}],
+        'torrents': {'abc': {'id': 'abc'}},
+        'total': 2,
+    }
+    assert encode({'empty': encoded_array([])}) == b'{"empty":[]}'
+
+
+def test_fragment_cache():
+    cache = FragmentCache(size=2)
+    first = {'path': 'a'}
+    data = cache.encode('a', first)
+    assert cache.encode('a', first) is data
+
+    # A replaced entry is encoded again, a view can drop fields
+    second = {'path': 'a', 'size': 1}
+    assert json.loads(cache.encode('a', second)) == second
+    assert cache.encode('b', second, lambda entry: {'size': entry['size']}) == b'{"size":1}'
+
+    # Entries nobody asks for age out after two generations
+    for key in 'cdef':
+        cache.encode(key, first)
+    assert len(cache) <= 4
+    cache.discard('f')
+    assert len(cache) <= 3
+
+
+def test_provider():
+    app = Flask(__name__)
+    app.json = JSONProvider(app)
+    with app.app_context():
+        response = jsonify({'success': True, 'when': datetime(2024, 5, 1), 'files': encoded_array([b'1', b'2'])})
+        assert response.mimetype == 'application/json'
+        assert json.loads(response.get_data()) == {'success': True, 'when': 'Wed, 01 May 2024 00:00:00 GMT',
+                                                   'files': [1, 2]}
+        assert app.json.loads('{"a": [1]}') == {'a': [1]}
+
+
+def test_stdlib_fallback():
+    orjson = sys.modules.get('orjson')
+    sys.modules['orjson'] = None
+    try:
+        fallback = importlib.reload(json_encoding)
+        assert fallback.BACKEND == 'json'
+        body = fallback.encode({'files': fallback.encoded_array([fallback.dumps({'name': 'ép1'})])})
+        assert body == '{"files":[{"name":"ép1"}]}'.encode('utf-8')
+    finally:
+        if orjson is None:
+            del sys.modules['orjson']
+        else:
+            sys.modules['orjson'] = orjson
+        importlib.reload(json_encoding)
+
+
+if __name__ == "__main__":
+    test_encode_and_splice()
+    test_fragment_cache()
+    test_provider()
+    test_stdlib_fallback()
+    print("✅ JSON encoding tests passed")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for the torrent metadata cache
+"""
+
+import os
+import tempfile
+
+import libtorrent as lt
+
+from metadata_cache import MetadataCache, is_info_hash
+
+
+def _torrent_info(root, name, flags=0):
+    path = os.path.join(root, name)
+    with open(path, 'wb') as f:
+        f.write(os.urandom(64 * 1024))
+    fs = lt.file_storage()
+    lt.add_files(fs, path)
+    torrent = lt.create_torrent(fs, flags=flags)
+    lt.set_piece_hashes(torrent, root)
+    return lt.torrent_info(lt.bencode(torrent.generate()))
+
+
+def test_store_and_get():
+    with tempfile.TemporaryDirectory() as root:
+        cache = MetadataCache(os.path.join(root, 'metadata'))
+        torrent_info = _torrent_info(root, 'a.bin')
+        info_hashes = torrent_info.info_hashes()
+        v1, v2 = str(info_hashes.v1), str(info_hashes.v2)
+        assert cache.get(v1) is None
+
+        cache.store(torrent_info, ['http://tracker.example/announce'])
+        assert sorted(os.listdir(cache.directory)) == sorted([v1 + '.torrent', v2 + '.torrent'])
+        for key in (v1, v2, v1.upper()):
+            cached = cache.get(key)
+            assert cached.info_hashes() == info_hashes
+            assert cached.name() == 'a.bin'
+            assert [tracker.url for tracker in cached.trackers()] == ['http://tracker.example/announce']
+
+
+def test_v1_only_torrent():
+    with tempfile.TemporaryDirectory() as root:
+        cache = MetadataCache(os.path.join(root, 'metadata'))
+        torrent_info = _torrent_info(root, 'a.bin', lt.create_torrent.v1_only)
+        cache.store(torrent_info)
+        assert os.listdir(cache.directory) == [str(torrent_info.info_hashes().v1) + '.torrent']
+
+
+def test_bad_files_are_dropped():
+    with tempfile.TemporaryDirectory() as root:
+        cache = MetadataCache(os.path.join(root, 'metadata'))
+        first = _torrent_info(root, 'a.bin', lt.create_torrent.v1_only)
+        second = _torrent_info(root, 'b.bin', lt.create_torrent.v1_only)
+        cache.store(second)
+        key = str(first.info_hashes().v1)
+
+        # A file whose content doesn't hash to its name isn't used
+        os.rename(os.path.join(cache.directory, str(second.info_hashes().v1) + '.torrent'),
+                  os.path.join(cache.directory, key + '.torrent'))
+        assert cache.get(key) is None
+        assert os.listdir(cache.directory) == []
+
+        with open(os.path.join(cache.directory, key + '.torrent'), 'wb') as f:
+            f.write(b'not bencoded')
+        assert cache.get(key) is None
+        assert os.listdir(cache.directory) == []
+
+        assert cache.get('../' * 10 + 'etc/passwd') is None
+        assert is_info_hash('a' * 40) and is_info_hash('B' * 64)
+        assert not is_info_hash('g' * 40) and not is_info_hash('a' * 41)
+
+
+if __name__ == "__main__":
+    test_store_and_get()
+    test_v1_only_torrent()
+    test_bad_files_are_dropped()
+    print("✅ Metadata cache tests passed")
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tests for streaming a file while its torrent downloads
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+import libtorrent as lt
+
+import piece_stream
+from piece_stream import PieceWaiter, FileStream
+
+PIECE_LENGTH = 16 * 1024
+SETTINGS = {
+    'enable_dht': False, 'enable_lsd': False, 'enable_upnp': False, 'enable_natpmp': False,
+    'alert_mask': lt.alert.category_t.storage_notification,
+}
+
+
+def _torrent(root):
+    """A torrent of a folder with a small file and a 20-piece one"""
+    folder = os.path.join(root, 'seed', 'Show')
+    os.makedirs(folder)
+    with open(os.path.join(folder, 'a.txt'), 'wb') as f:
+        f.write(b'first file')
+    data = os.urandom(20 * PIECE_LENGTH - 100)
+    with open(os.path.join(folder, 'b.mkv'), 'wb') as f:
+        f.write(data)
+    fs = lt.file_storage()
+    lt.add_files(fs, folder)
+    torrent = lt.create_torrent(fs, PIECE_LENGTH, flags=lt.create_torrent.v1_only)
+    lt.set_piece_hashes(torrent, os.path.join(root, 'seed'))
+    return lt.torrent_info(lt.bencode(torrent.generate())), data
+
+
+def _file_index(torrent_info, name):
+    files = torrent_info.files()
+    return next(i for i in range(files.num_files()) if files.file_name(i) == name)
+
+
+def test_piece_waiter():
+    waiter = PieceWaiter()
+    assert not waiter.wait_for(lambda: False, 0.05)
+
+    ready = []
+    threading.Timer(0.1, lambda: (ready.append(True), waiter.notify())).start()
+    start = time.monotonic()
+    assert waiter.wait_for(lambda: ready, 5)
+    assert time.monotonic() - start < 1
+
+
+def test_stream_while_downloading():
+    with tempfile.TemporaryDirectory() as root:
+        torrent_info, data = _torrent(root)
+        seeder = lt.session(dict(SETTINGS, listen_interfaces='127.0.0.1:0'))
+        seeder.add_torrent({'ti': torrent_info, 'save_path': os.path.join(root, 'seed')})
+        leecher = lt.session(dict(SETTINGS, listen_interfaces='127.0.0.1:0'))
+        save_path = os.path.join(root, 'downloads')
+        handle = leecher.add_torrent({'ti': lt.torrent_info(torrent_info), 'save_path': save_path,
+                                      'flags': lt.torrent_flags.sequential_download})
+
+        # The alert thread of the app: hand readers the pieces' data
+        waiter = PieceWaiter()
+        running = True
+
+        def pump_alerts():
+            while running:
+                leecher.wait_for_alert(100)
+                for alert in leecher.pop_alerts():
+                    if isinstance(alert, lt.read_piece_alert):
+                        waiter.piece_read(alert)
+
+        pump = threading.Thread(target=pump_alerts)
+        pump.start()
+        try:
+            stream = FileStream(handle, _file_index(torrent_info, 'b.mkv'), waiter, save_path)
+            assert stream.size == len(data)
+            assert stream.path == os.path.join(save_path, 'Show', 'b.mkv')
+            assert stream.piece_at(0) == stream.offset // PIECE_LENGTH
+            assert not stream.complete()
+
+            body = stream.generate(5 * PIECE_LENGTH + 7, 9 * PIECE_LENGTH)
+            handle.connect_peer(('127.0.0.1', seeder.listen_port()))
+            assert b''.join(body) == data[5 * PIECE_LENGTH + 7:9 * PIECE_LENGTH]
+
+            assert b''.join(stream.generate(0, stream.size)) == data
+            assert stream.complete()
+        finally:
+            running = False
+            pump.join()
+
+
+def test_stream_ends_when_piece_times_out():
+    with tempfile.TemporaryDirectory() as root:
+        torrent_info, _ = _torrent(root)
+        session = lt.session(dict(SETTINGS, listen_interfaces='127.0.0.1:0'))
+        handle = session.add_torrent({'ti': torrent_info, 'save_path': os.path.join(root, 'downloads')})
+        stream = FileStream(handle, _file_index(torrent_info, 'b.mkv'), PieceWaiter(), os.path.join(root, 'downloads'))
+
+        timeout = piece_stream.PIECE_TIMEOUT
+        piece_stream.PIECE_TIMEOUT = 0.1
+        try:
+            assert b''.join(stream.generate(0, stream.size)) == b''
+        finally:
+            piece_stream.PIECE_TIMEOUT = timeout
+
+
+if __name__ == "__main__":
+    test_piece_waiter()
+    test_stream_while_downloading()
+    test_stream_ends_when_piece_times_out()
+    print("✅ Piece stream tests passed")
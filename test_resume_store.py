@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Tests for the fast-resume data store
+"""
+
+import os
+import tempfile
+import threading
+
+import libtorrent as lt
+
+from resume_store import ResumeStore
+
+
+def _params(root, name):
+    path = os.path.join(root, name)
+    with open(path, 'wb') as f:
+        f.write(os.urandom(64 * 1024))
+    fs = lt.file_storage()
+    lt.add_files(fs, path)
+    torrent = lt.create_torrent(fs)
+    lt.set_piece_hashes(torrent, root)
+    params = lt.add_torrent_params()
+    params.ti = lt.torrent_info(lt.bencode(torrent.generate()))
+    params.save_path = root
+    return params
+
+
+def test_round_trip():
+    with tempfile.TemporaryDirectory() as root:
+        store = ResumeStore(os.path.join(root, 'resume'))
+        first = _params(root, 'a.bin')
+        second = _params(root, 'b.bin')
+        store.stage('aaa', first)
+        store.stage('bbb', second)
+
+        # Nothing reaches the disk until the batch is flushed
+        assert os.listdir(store.directory) == []
+        assert store.flush() == 2
+        assert sorted(os.listdir(store.directory)) == ['aaa.resume', 'bbb.resume']
+
+        loaded = dict(ResumeStore(store.directory).load())
+        assert loaded['aaa'].ti.name() == 'a.bin'
+        assert loaded['bbb'].save_path == root
+        assert str(loaded['bbb'].ti.info_hash()) == str(second.ti.info_hash())
+
+
+def test_remove_and_leftovers():
+    with tempfile.TemporaryDirectory() as root:
+        store = ResumeStore(os.path.join(root, 'resume'))
+        store.stage('aaa', _params(root, 'a.bin'))
+        store.flush()
+
+        # A removal cancels a staged save and deletes the stored file
+        store.stage('aaa', _params(root, 'a.bin'))
+        store.remove('aaa')
+        assert store.flush() == 0
+        assert os.listdir(store.directory) == []
+
+        # Temporary files from an interrupted flush are ignored and cleaned up
+        with open(os.path.join(store.directory, 'ccc.resume.tmp'), 'wb') as f:
+            f.write(b'partial')
+        with open(os.path.join(store.directory, 'ddd.resume'), 'wb') as f:
+            f.write(b'not bencoded')
+        assert list(store.load()) == []
+        assert os.listdir(store.directory) == ['ddd.resume']
+
+
+def test_removal_waits_for_a_flush_in_progress():
+    with tempfile.TemporaryDirectory() as root:
+        store = ResumeStore(os.path.join(root, 'resume'))
+        store.stage('aaa', _params(root, 'a.bin'))
+        write = store._write
+        removers = []
+
+        def write_while_removing(pending, removed):
+            # The torrent is removed while the periodic flush is writing it
+            store._write = write
+            remover = threading.Thread(target=lambda: (store.remove('aaa'), store.flush()))
+            remover.start()
+            remover.join(0.2)
+            assert remover.is_alive()
+            removers.append(remover)
+            write(pending, removed)
+
+        store._write = write_while_removing
+        assert store.flush() == 1
+        removers[0].join()
+        assert os.listdir(store.directory) == []
+
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_remove_and_leftovers()
+    test_removal_waits_for_a_flush_in_progress()
+    print("✅ Resume store tests passed")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests for the libtorrent session profiles
+"""
+
+import os
+import tempfile
+
+import libtorrent as lt
+
+from session_profiles import (PROFILES, DEFAULT_PROFILE, ProfileError, build_settings,
+                              load_config, save_config, select_profile)
+
+
+def test_profiles_apply_to_a_session():
+    session = lt.session({'listen_interfaces': '127.0.0.1:0', 'enable_dht': False})
+    for name, profile in PROFILES.items():
+        settings = build_settings(name)
+        settings['listen_interfaces'] = '127.0.0.1:0'
+        session.apply_settings(settings)
+        applied = session.get_settings()
+        for key, value in profile['settings'].items():
+            assert applied[key] == value, (name, key)
+
+
+def test_switching_resets_other_profiles_settings():
+    seedbox = build_settings('seedbox')
+    default = build_settings(DEFAULT_PROFILE)
+    assert seedbox['seed_choking_algorithm'] == int(lt.seed_choking_algorithm_t.fastest_upload)
+    assert default['seed_choking_algorithm'] == lt.default_settings()['seed_choking_algorithm']
+
+
+def test_overrides_and_errors():
+    settings = build_settings('low-memory', {'upload_rate_limit': 1000})
+    assert settings['upload_rate_limit'] == 1000
+    assert settings['aio_threads'] == PROFILES['low-memory']['settings']['aio_threads']
+
+    for args in (('turbo',), ('seedbox', {'not_a_setting': 1}), ('default', {'connections_limit': '500'}),
+                 ('default', {'enable_dht': 1}), ('default', {'connections_limit': True})):
+        try:
+            build_settings(*args)
+            assert False, args
+        except ProfileError:
+            pass
+
+
+def test_config_file_and_environment():
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'data', 'session.json')
+        assert load_config(path) == {}
+
+        save_config(path, {'profile': 'many-torrents', 'settings': {'active_seeds': 10}})
+        config = load_config(path)
+        assert config['settings'] == {'active_seeds': 10}
+
+        previous = os.environ.pop('SESSION_PROFILE', None)
+        try:
+            assert select_profile(config) == 'many-torrents'
+            assert select_profile({}) == DEFAULT_PROFILE
+            os.environ['SESSION_PROFILE'] = 'seedbox'
+            assert select_profile(config) == 'seedbox'
+        finally:
+            os.environ.pop('SESSION_PROFILE', None)
+            if previous is not None:
+                os.environ['SESSION_PROFILE'] = previous
+
+        with open(path, 'w') as f:
+            f.write('{not json')
+        assert load_config(path) == {}
+
+
+if __name__ == "__main__":
+    test_profiles_apply_to_a_session()
+    test_switching_resets_other_profiles_settings()
+    test_overrides_and_errors()
+    test_config_file_and_environment()
+    print("✅ Session profile tests passed")
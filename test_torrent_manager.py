@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Tests for the torrent manager and the torrents API, against the app's own
+libtorrent session (on loopback, in a temporary working directory)
+"""
+
+import atexit
+import concurrent.futures
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import libtorrent as lt
+
+
+def _app():
+    """Import the app once, with its downloads and data in a temporary directory"""
+    if 'app' in sys.modules:
+        return sys.modules['app']
+    root = tempfile.mkdtemp()
+    # Registered first, so it runs after the app's own shutdown hook
+    atexit.register(shutil.rmtree, root, True)
+    data_dir = os.path.join(root, 'data')
+    os.makedirs(data_dir)
+    config = {'settings': {'listen_interfaces': '127.0.0.1:0', 'enable_dht': False, 'enable_lsd': False}}
+    with open(os.path.join(data_dir, 'session.json'), 'w') as f:
+        json.dump(config, f)
+    os.environ.update(DATA_DIR=data_dir, SESSION_CONFIG=os.path.join(data_dir, 'session.json'),
+                      STATUS_UPDATE_INTERVAL='0.2')
+    os.environ.pop('SESSION_PROFILE', None)
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        import app
+    finally:
+        os.chdir(cwd)
+    return app
+
+
+def _magnet():
+    """A magnet for a new random torrent, and its id"""
+    info_hash = uuid.uuid4().hex + uuid.uuid4().hex[:8]
+    return f'magnet:?xt=urn:btih:{info_hash}', info_hash
+
+
+def _torrent_data(root, name, flags=0):
+    """Contents of a .torrent file for a new 64KB file (hybrid v1/v2 unless flags say otherwise)"""
+    path = os.path.join(root, name)
+    with open(path, 'wb') as f:
+        f.write(os.urandom(64 * 1024))
+    fs = lt.file_storage()
+    lt.add_files(fs, path)
+    torrent = lt.create_torrent(fs, flags=flags)
+    lt.set_piece_hashes(torrent, root)
+    return lt.bencode(torrent.generate())
+
+
+def _wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_versions_and_conditional_polls():
+    app = _app()
+    manager = app.torrent_manager
+    client = app.app.test_client()
+
+    # Unchanged torrents answer 304 (a status sweep may land in between once)
+    for _ in range(10):
+        response = client.get('/api/torrents')
+        again = client.get('/api/torrents', headers={'If-None-Match': response.headers['ETag']})
+        if again.status_code == 304:
+            break
+        assert again.json['version'] > response.json['version']
+    else:
+        assert False, 'never answered 304'
+    assert client.get('/api/torrents?files=1').headers['ETag'] != response.headers['ETag']
+
+    since = manager.current_version()
+    magnet, torrent_id = _magnet()
+    assert manager.add_torrent(magnet, is_magnet=True)[0] == torrent_id
+    assert manager.current_version() > since
+
+    data = client.get(f'/api/torrents?since={since}').json
+    assert torrent_id in data['torrents'] and data['removed'] == [] and not data['full']
+    assert client.get(f'/api/torrents?since={data["version"]}').json['torrents'] == {}
+
+    # Versions too old, from another run or not numbers
+    for value in (0, data['version'] + 1000):
+        data = client.get(f'/api/torrents?since={value}').json
+        assert data['full'] and torrent_id in data['torrents']
+    assert client.get('/api/torrents?since=abc').status_code == 400
+
+    # A torrent removed and added again is listed as changed, not removed
+    assert manager.remove_torrent(torrent_id)
+    data = client.get(f'/api/torrents?since={since}').json
+    assert torrent_id not in data['torrents'] and torrent_id in data['removed']
+    assert manager.add_torrent(magnet, is_magnet=True)[0] == torrent_id
+    data = client.get(f'/api/torrents?since={since}').json
+    assert torrent_id in data['torrents'] and torrent_id not in data['removed']
+    manager.remove_torrent(torrent_id)
+
+
+def test_ids_and_duplicates():
+    app = _app()
+    manager = app.torrent_manager
+    client = app.app.test_client()
+    with tempfile.TemporaryDirectory() as root:
+        data = _torrent_data(root, 'hybrid.bin')
+        info_hashes = lt.torrent_info(data).info_hashes()
+        v1, v2 = str(info_hashes.v1), str(info_hashes.v2)
+
+        torrent_id, added, _ = manager.add_torrent(data, priority='high')
+        assert added and torrent_id == v1
+        for key in (v1, v2, v2[:40], v2.upper()):
+            assert manager._find_by_hash(key) == torrent_id
+        record = manager.active_torrents[torrent_id]
+        assert manager._torrent_id(record.handle) == torrent_id
+
+        # Added again by any of its hashes: reported, priority left alone
+        for torrent_data, is_magnet in ((data, False), (f'magnet:?xt=urn:btih:{v1}', True),
+                                        (f'magnet:?xt=urn:btmh:1220{v2}', True)):
+            assert manager.add_torrent(torrent_data, is_magnet) == (torrent_id, False, 'Torrent already added')
+        assert record.priority == 'high' and manager.queue.priority(torrent_id) == 'high'
+        response = client.post('/api/add_torrent', json={'magnet_link': f'magnet:?xt=urn:btih:{v1}'})
+        assert response.json == {'success': False, 'duplicate': True, 'torrent_id': torrent_id,
+                                 'message': 'Torrent already added'}
+
+        # v2-only torrents go by their full v2 hash
+        v2_only = _torrent_data(root, 'v2.bin', flags=lt.create_torrent.v2_only)
+        v2_id, added, _ = manager.add_torrent(v2_only)
+        assert added and v2_id == str(lt.torrent_info(v2_only).info_hashes().v2) and len(v2_id) == 64
+
+        for key in (torrent_id, v2_id):
+            assert manager.remove_torrent(key)
+        assert manager._find_by_hash(v2) is None and record.handle not in manager._by_handle
+
+
+def test_restore_renames_old_ids():
+    app = _app()
+    manager = app.torrent_manager
+    with tempfile.TemporaryDirectory() as root:
+        magnet, torrent_id = _magnet()
+        params = lt.parse_magnet_uri(magnet)
+        params.save_path = root
+        # A store written when ids were not info-hashes
+        restorer = app.TorrentManager()
+        restorer.resume_store = app.ResumeStore(os.path.join(root, 'resume'))
+        restorer.queue = app.QueueScheduler(os.path.join(root, 'queue.json'))
+        restorer.resume_store.stage('legacy-id', params)
+        restorer.resume_store.flush()
+        restorer.queue.set_priority('legacy-id', 'low')
+
+        assert restorer.restore() == 1
+        assert os.listdir(os.path.join(root, 'resume')) == [f'{torrent_id}.resume']
+        assert restorer.queue.priority(torrent_id) == 'low'
+        # Registered under its info-hash once the session has added it
+        assert _wait_for(lambda: torrent_id in manager.active_torrents)
+        manager.remove_torrent(torrent_id)
+
+
+def test_streams_count_while_waiting_for_metadata():
+    app = _app()
+    manager = app.torrent_manager
+    client = app.app.test_client()
+    magnet, torrent_id = _magnet()
+    manager.add_torrent(magnet, is_magnet=True)
+    limit, timeout = app.open_streams, app.METADATA_TIMEOUT
+    app.open_streams, app.METADATA_TIMEOUT = threading.BoundedSemaphore(1), 2
+    try:
+        statuses = []
+        waiting = threading.Thread(target=lambda: statuses.append(
+            client.get(f'/api/stream/{torrent_id}/0').status_code))
+        waiting.start()
+        # The magnet's stream holds the only slot while it waits for the metadata
+        assert _wait_for(lambda: client.get('/api/stream/unknown/0').status_code == 503, 2)
+        assert waiting.is_alive()
+        waiting.join()
+        assert statuses == [504]
+        # Every answer that isn't a stream gives its slot back
+        for _ in range(2):
+            assert client.get('/api/stream/unknown/0').status_code == 404
+        assert app.open_streams.acquire(blocking=False)
+        assert not manager._streams
+    finally:
+        app.open_streams, app.METADATA_TIMEOUT = limit, timeout
+        manager.remove_torrent(torrent_id)
+
+
+def test_finished_torrents_are_indexed_outside_the_lock():
+    app = _app()
+    manager = app.torrent_manager
+    data = _torrent_data(app.download_dir, f'{uuid.uuid4().hex}.bin')
+    name = lt.torrent_info(data).name()
+    indexed = []
+
+    def update_tree(rel_path):
+        def take_lock():
+            if manager.lock.acquire(timeout=1):
+                indexed.append(rel_path)
+                manager.lock.release()
+        # Requests can still take the manager lock meanwhile
+        locker = threading.Thread(target=take_lock)
+        locker.start()
+        locker.join()
+        update(rel_path)
+
+    update, watched = app.file_index.update_tree, app.file_index.watched
+    app.file_index.update_tree, app.file_index.watched = update_tree, False
+    try:
+        torrent_id, added, _ = manager.add_torrent(data)
+        assert added and _wait_for(lambda: name in indexed)
+        assert app.file_index.file_count(query=name) == 1
+    finally:
+        app.file_index.update_tree, app.file_index.watched = update, watched
+        manager.remove_torrent(torrent_id, delete_files=True)
+
+
+def test_a_failing_alert_does_not_drop_the_batch():
+    app = _app()
+    # A manager of its own, so the app's alert thread doesn't run into the stub
+    manager = app.TorrentManager()
+    handled = []
+
+    def handle_alert(alert):
+        if alert == 'bad':
+            raise RuntimeError('invalid torrent handle used')
+        handled.append(alert)
+
+    manager._handle_alert = handle_alert
+    manager._handle_alerts(['first', 'bad', 'save_resume_data', 'bad', 'last'])
+    assert handled == ['first', 'save_resume_data', 'last']
+
+
+def test_bulk_add_results():
+    app = _app()
+    manager = app.torrent_manager
+    client = app.app.test_client()
+    with tempfile.TemporaryDirectory() as root:
+        magnet, magnet_id = _magnet()
+        data = _torrent_data(root, 'bulk.bin')
+        file_id = str(lt.torrent_info(data).info_hashes().v1)
+        # A v2-only torrent already in the session from a magnet of its truncated hash
+        v2_only = _torrent_data(root, 'v2.bin', flags=lt.create_torrent.v2_only)
+        v2 = str(lt.torrent_info(v2_only).info_hashes().v2)
+        truncated_id, added, _ = manager.add_torrent(f'magnet:?xt=urn:btih:{v2[:40]}', is_magnet=True)
+        assert added and manager._find_by_hash(v2) is None
+        # Another request is adding this one
+        pending, pending_id = _magnet()
+        manager._pending_adds[pending_id] = concurrent.futures.Future()
+        try:
+            results = manager.add_torrents([
+                (magnet, True, 'high'),
+                ('magnet:?xt=urn:btih:nothex', True, 'normal'),
+                (data, False, 'low'),
+                (magnet, True, 'normal'),
+                (v2_only, False, 'normal'),
+                (pending, True, 'normal'),
+                (data, False, 'urgent'),
+            ])
+        finally:
+            del manager._pending_adds[pending_id]
+        # One result per item, in order
+        assert [result['status'] for result in results] == [
+            'added', 'error', 'added', 'duplicate', 'duplicate', 'duplicate', 'error']
+        assert results[0]['torrent_id'] == magnet_id and results[2]['torrent_id'] == file_id
+        assert results[3]['torrent_id'] == magnet_id and results[3]['message'] == 'Duplicate of an earlier item'
+        assert results[4]['torrent_id'] == truncated_id and results[4]['info_hash'] == v2
+        assert 'torrent_id' not in results[5]
+        assert manager.active_torrents[magnet_id].priority == 'high'
+        assert manager.queue.priority(file_id) == 'low'
+
+        # Everything is in the session now, so the endpoint reports duplicates
+        response = client.post('/api/add_torrents/bulk', json=[magnet, {'magnet_link': magnet}, 'bad'])
+        assert [result['status'] for result in response.json['results']] == ['duplicate', 'duplicate', 'error']
+        assert (response.json['added'], response.json['duplicate'], response.json['error']) == (0, 2, 1)
+
+        # The session answers after the timeout: an error result, but the torrent stays
+        late, late_id = _magnet()
+        with manager.lock:
+            # The alert thread can't register it while the lock is held
+            results = manager.add_torrents([(late, True, 'normal')], timeout=0.2)
+        assert results == [{'status': 'error', 'info_hash': late_id, 'message': 'Timed out waiting for the session'}]
+        assert _wait_for(lambda: late_id in manager.active_torrents)
+
+        for torrent_id in (magnet_id, file_id, truncated_id, late_id):
+            assert manager.remove_torrent(torrent_id)
+
+
+if __name__ == "__main__":
+    test_versions_and_conditional_polls()
+    test_ids_and_duplicates()
+    test_restore_renames_old_ids()
+    test_streams_count_while_waiting_for_metadata()
+    test_finished_torrents_are_indexed_outside_the_lock()
+    test_a_failing_alert_does_not_drop_the_batch()
+    test_bulk_add_results()
+    print("✅ Torrent manager tests passed")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Tests for the download queue scheduler
+"""
+
+import hashlib
+import os
+import tempfile
+
+import libtorrent as lt
+
+from torrent_queue import QueueScheduler, QueueError, validate_limits
+
+
+def _session_with_magnets(count):
+    session = lt.session({'listen_interfaces': '127.0.0.1:0', 'enable_dht': False,
+                          'enable_lsd': False, 'active_downloads': 1})
+    entries = []
+    for i in range(count):
+        info_hash = hashlib.sha1(str(i).encode()).hexdigest()
+        params = lt.parse_magnet_uri(f'magnet:?xt=urn:btih:{info_hash}')
+        params.save_path = tempfile.gettempdir()
+        entries.append((info_hash, session.add_torrent(params)))
+    return session, entries
+
+
+def _order(entries):
+    return [key for key, handle in sorted(entries, key=lambda entry: entry[1].queue_position())]
+
+
+def test_priority_bands():
+    with tempfile.TemporaryDirectory() as root:
+        session, entries = _session_with_magnets(5)
+        keys = [key for key, _ in entries]
+        scheduler = QueueScheduler(os.path.join(root, 'queue.json'))
+
+        scheduler.set_priority(keys[3], 'high')
+        scheduler.set_priority(keys[0], 'low')
+        assert scheduler.apply(entries)
+        assert _order(entries) == [keys[3], keys[1], keys[2], keys[4], keys[0]]
+        assert not scheduler.apply(entries)
+
+        # Moves stay within the torrent's band
+        scheduler.move(dict(entries)[keys[4]], 'top', entries)
+        assert _order(entries) == [keys[3], keys[4], keys[1], keys[2], keys[0]]
+        scheduler.move(dict(entries)[keys[0]], 'up', entries)
+        assert _order(entries)[-1] == keys[0]
+
+        try:
+            scheduler.set_priority(keys[0], 'urgent')
+            assert False
+        except QueueError:
+            pass
+
+
+def test_saved_order_and_priorities():
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'queue.json')
+        session, entries = _session_with_magnets(3)
+        keys = [key for key, _ in entries]
+        scheduler = QueueScheduler(path)
+        scheduler.set_priority(keys[2], 'high')
+        scheduler.apply(entries)
+        scheduler.save(entries)
+
+        restored = QueueScheduler(path)
+        assert restored.priority(keys[2]) == 'high'
+        assert restored.priority('unknown') == 'normal'
+        items = [('unknown', None)] + [(key, None) for key in keys]
+        assert [key for key, _ in restored.restore_order(items)] == [keys[2], keys[0], keys[1], 'unknown']
+
+
+def test_validate_limits():
+    assert validate_limits({'active_downloads': 3, 'dont_count_slow_torrents': False}) == {
+        'active_downloads': 3, 'dont_count_slow_torrents': False}
+    assert validate_limits({'active_seeds': -1}) == {'active_seeds': -1}
+    for limits in (None, {}, {'active_downloads': 'many'}, {'active_downloads': -5},
+                   {'active_downloads': True}, {'dont_count_slow_torrents': 1}, {'upload_rate_limit': 0}):
+        try:
+            validate_limits(limits)
+            assert False, limits
+        except QueueError:
+            pass
+
+
+if __name__ == "__main__":
+    test_priority_bands()
+    test_saved_order_and_priorities()
+    test_validate_limits()
+    print("✅ Torrent queue tests passed")
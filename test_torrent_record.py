@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-torrent record
+"""
+
+from datetime import datetime
+from types import SimpleNamespace
+
+from torrent_record import TorrentRecord
+
+TORRENT_ID = 'a31758bb36c560bc4099eab801efc216da2c7978'
+
+
+def _status(**fields):
+    status = dict(has_metadata=True, name='Show', total_wanted=4096, progress=0.5,
+                  download_rate=2048, upload_rate=512, num_peers=3, num_seeds=1, queue_position=0,
+                  is_seeding=False, is_finished=False, paused=False, auto_managed=True)
+    status.update(fields)
+    return SimpleNamespace(**status)
+
+
+def test_update_and_serialize():
+    record = TorrentRecord(TORRENT_ID, None, datetime(2024, 5, 1, 12, 30), 'normal')
+    assert record.to_dict()['name'] == 'Torrent a31758bb'
+    assert not hasattr(record, '__dict__')
+
+    assert record.update(_status())
+    assert record.to_dict() == {
+        'id': TORRENT_ID,
+        'name': 'Show',
+        'size': 4096,
+        'progress': 50.0,
+        'download_rate': 2.0,
+        'upload_rate': 0.5,
+        'status': 'downloading',
+        'peers': 3,
+        'seeds': 1,
+        'priority': 'normal',
+        'label': None,
+        'queue_position': 0,
+        'added_time': '2024-05-01 12:30:00',
+        'download_files': [],
+    }
+    assert 'download_files' not in record.to_dict(include_files=False)
+
+    # The same snapshot again is not a change
+    assert not record.update(_status())
+    assert record.update(_status(paused=True))
+    assert record.status == 'queued'
+
+
+def test_files_pending():
+    record = TorrentRecord(TORRENT_ID, None, None, 'high')
+    record.update(_status(has_metadata=False, name=''))
+    assert record.name == 'Torrent a31758bb'
+    assert not record.files_pending
+
+    assert record.update(_status(progress=1.0, is_finished=True, is_seeding=True))
+    assert record.status == 'seeding'
+    assert record.files_pending
+    record.download_files = [{'name': 'e01.mkv', 'path': 'Show/e01.mkv', 'size': 4096}]
+    assert not record.files_pending
+    assert record.to_dict()['download_files'] == record.download_files
+
+
+if __name__ == "__main__":
+    test_update_and_serialize()
+    test_files_pending()
+    print("✅ Torrent record tests passed")
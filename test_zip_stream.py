@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming ZIP writer
+"""
+
+import io
+import os
+import tempfile
+import zipfile
+
+import zip_stream
+from zip_stream import ZipStream, ZipManifest, archive_compression, choose_compress_type
+
+
+def _make_folder(root):
+    files = {
+        'a.txt': b'hello world\n' * 1000,
+        'empty.bin': b'',
+        os.path.join('sub', 'b.bin'): os.urandom(300000),
+        os.path.join('sub', 'ünïcode.txt'): b'unicode name',
+    }
+    for name, content in files.items():
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+    return files
+
+
+def _build(root, files, **kwargs):
+    stream = ZipStream(**kwargs)
+    for name in files:
+        stream.add_file(os.path.join(root, name), name)
+    return b''.join(stream.generate())
+
+
+def test_streamed_archive_is_valid():
+    with tempfile.TemporaryDirectory() as root:
+        files = _make_folder(root)
+        data = _build(root, files, chunk_size=4096)
+
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            assert zf.testzip() is None
+            for name, content in files.items():
+                assert zf.read(name.replace(os.sep, '/')) == content
+
+
+def test_stored_members():
+    with tempfile.TemporaryDirectory() as root:
+        files = _make_folder(root)
+        stream = ZipStream()
+        for name in files:
+            stream.add_file(os.path.join(root, name), name, compress_type=zipfile.ZIP_STORED)
+        data = b''.join(stream.generate())
+
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            for info in zf.infolist():
+                assert info.compress_type == zipfile.ZIP_STORED
+            assert zf.testzip() is None
+
+
+def test_missing_file_is_skipped():
+    with tempfile.TemporaryDirectory() as root:
+        files = _make_folder(root)
+        stream = ZipStream()
+        for name in files:
+            stream.add_file(os.path.join(root, name), name)
+        os.remove(os.path.join(root, 'a.txt'))
+        data = b''.join(stream.generate())
+
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            assert 'a.txt' not in zf.namelist()
+            assert len(zf.namelist()) == len(files) - 1
+
+
+def test_compression_policy():
+    with tempfile.TemporaryDirectory() as root:
+        paths = {}
+        for name, content in {
+            'movie.mkv': b'\0' * 1000,
+            'notes.txt': os.urandom(1000),
+            'text.dat': b'abc' * 100000,
+            'random.dat': os.urandom(300000),
+        }.items():
+            paths[name] = os.path.join(root, name)
+            with open(paths[name], 'wb') as f:
+                f.write(content)
+
+        def pick(name, mode='auto'):
+            return choose_compress_type(paths[name], os.path.getsize(paths[name]), mode)
+
+        # Known formats go by extension/mime type, unknown ones are probed
+        assert pick('movie.mkv') == zipfile.ZIP_STORED
+        assert pick('notes.txt') == zipfile.ZIP_DEFLATED
+        assert pick('text.dat') == zipfile.ZIP_DEFLATED
+        assert pick('random.dat') == zipfile.ZIP_STORED
+        # Explicit modes override the policy
+        assert pick('movie.mkv', 'deflate') == zipfile.ZIP_DEFLATED
+        assert pick('text.dat', 'store') == zipfile.ZIP_STORED
+
+
+def test_mostly_media_archives_are_stored():
+    media_folder = [('Show/ep1.mkv', 700000), ('Show/ep1.srt', 30), ('Show/show.nfo', 2)]
+    assert archive_compression(media_folder) == 'store'
+    assert archive_compression(media_folder, 'deflate') == 'deflate'
+    assert archive_compression([('ep1.mkv', 500), ('notes.txt', 500)]) == 'auto'
+    assert archive_compression([('empty.txt', 0)]) == 'auto'
+
+
+def test_bytes_saved_reported():
+    with tempfile.TemporaryDirectory() as root:
+        files = _make_folder(root)
+        stream = ZipStream()
+        for name in files:
+            stream.add_file(os.path.join(root, name), name)
+        data = b''.join(stream.generate())
+
+        assert stream.bytes_saved > 0
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            assert zf.getinfo('sub/b.bin').compress_type == zipfile.ZIP_STORED
+            assert zf.getinfo('a.txt').compress_type == zipfile.ZIP_DEFLATED
+            assert str(stream.bytes_saved).encode() in zf.comment
+
+
+def test_parallel_deflate():
+    with tempfile.TemporaryDirectory() as root:
+        files = _make_folder(root)
+        # Small blocks so every member is split across several deflate jobs
+        data = _build(root, files, chunk_size=4096, compression='deflate', workers=3)
+
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            assert zf.testzip() is None
+            for name, content in files.items():
+                assert zf.read(name.replace(os.sep, '/')) == content
+
+
+def test_manifest_matches_stream():
+    with tempfile.TemporaryDirectory() as root:
+        files = _make_folder(root)
+        data = _build(root, files, compression='store')
+
+        stream = ZipStream(compression='store')
+        for name in files:
+            stream.add_file(os.path.join(root, name), name)
+        manifest = ZipManifest(stream.members, chunk_size=4096)
+
+        # The precomputed layout produces the same bytes as streaming
+        assert manifest.size == len(data)
+        assert b''.join(manifest.iter_range()) == data
+
+        # Any range can be served without producing the bytes before it
+        for start, stop in [(0, 1), (10, 5000), (len(data) - 30, len(data)), (123456, 300500)]:
+            manifest = ZipManifest(stream.members, chunk_size=4096)
+            assert b''.join(manifest.iter_range(start, stop)) == data[start:stop]
+
+
+def test_zip64_end_records():
+    # Lower the entry limit so the ZIP64 end records are written for a small archive
+    original = zip_stream.ZIP_FILECOUNT_LIMIT
+    zip_stream.ZIP_FILECOUNT_LIMIT = 3
+    try:
+        with tempfile.TemporaryDirectory() as root:
+            files = _make_folder(root)
+            data = _build(root, files)
+    finally:
+        zip_stream.ZIP_FILECOUNT_LIMIT = original
+
+    assert b'PK\x06\x06' in data
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert len(zf.namelist()) == len(files)
+        assert zf.testzip() is None
+
+
+def test_zip64_member_fields():
+    # Lower the size limit so member headers carry ZIP64 extra fields
+    original = zip_stream.ZIP64_LIMIT
+    zip_stream.ZIP64_LIMIT = 1000
+    try:
+        with tempfile.TemporaryDirectory() as root:
+            files = _make_folder(root)
+            data = _build(root, files, compresslevel=1)
+    finally:
+        zip_stream.ZIP64_LIMIT = original
+
+    assert b'PK\x06\x06' in data
+    assert b'PK\x06\x07' in data
+
+
+if __name__ == "__main__":
+    test_streamed_archive_is_valid()
+    test_stored_members()
+    test_missing_file_is_skipped()
+    test_compression_policy()
+    test_mostly_media_archives_are_stored()
+    test_bytes_saved_reported()
+    test_parallel_deflate()
+    test_manifest_matches_stream()
+    test_zip64_end_records()
+    test_zip64_member_fields()
+    print("✅ Streaming ZIP tests passed")
@@ -0,0 +1,121 @@
+"""
+Download queue scheduling on top of libtorrent's auto-management.
+
+Torrents are added auto-managed, so libtorrent only runs as many as the
+active_downloads / active_seeds / active_checking / active_limit settings
+allow and starts the next one by queue position when a slot frees up
+(slow torrents don't take a slot while dont_count_slow_torrents is on).
+QueueScheduler adds priorities on top: the queue is kept ordered in
+high, normal, low bands, moves happen within a torrent's band, and the
+priorities and order are saved to a JSON file so a restart restores the
+same queue.
+"""
+
+import threading
+
+from session_profiles import load_config, save_config
+
+PRIORITIES = ('high', 'normal', 'low')
+DEFAULT_PRIORITY = 'normal'
+MOVES = ('top', 'up', 'down', 'bottom')
+
+# Session settings that make up the queue limits, and whether each is a flag
+LIMIT_SETTINGS = {
+    'active_downloads': False,
+    'active_seeds': False,
+    'active_checking': False,
+    'active_limit': False,
+    'dont_count_slow_torrents': True,
+    'inactive_down_rate': False,
+    'inactive_up_rate': False,
+    'auto_manage_interval': False,
+}
+
+
+class QueueError(ValueError):
+    """Raised for invalid priorities, moves or limits"""
+
+
+def validate_limits(limits):
+    """Check a dict of queue limits; -1 means unlimited for the active_* counts"""
+    if not isinstance(limits, dict) or not limits:
+        raise QueueError('Provide at least one limit')
+    unknown = [name for name in limits if name not in LIMIT_SETTINGS]
+    if unknown:
+        raise QueueError(f"Unknown limits: {', '.join(unknown)}")
+    for name, value in limits.items():
+        if LIMIT_SETTINGS[name]:
+            if not isinstance(value, bool):
+                raise QueueError(f'{name} must be true or false')
+        elif isinstance(value, bool) or not isinstance(value, int) or value < -1:
+            raise QueueError(f'{name} must be an integer of at least -1')
+    return dict(limits)
+
+
+class QueueScheduler:
+    """Keeps the libtorrent queue ordered by priority and persists it"""
+
+    def __init__(self, path):
+        self.path = path
+        saved = load_config(path)
+        self.priorities = {key: entry.get('priority', DEFAULT_PRIORITY) for key, entry in saved.items()}
+        self.saved_positions = {key: entry.get('queue_position', -1) for key, entry in saved.items()}
+        # Saves come from request threads and the alert thread, through one temporary file
+        self._save_lock = threading.Lock()
+
+    def priority(self, key):
+        return self.priorities.get(key, DEFAULT_PRIORITY)
+
+    def set_priority(self, key, priority):
+        if priority not in PRIORITIES:
+            raise QueueError(f"Priority must be one of: {', '.join(PRIORITIES)}")
+        self.priorities[key] = priority
+
+    def rename(self, old_key, new_key):
+        if old_key in self.priorities:
+            self.priorities[new_key] = self.priorities.pop(old_key)
+        if old_key in self.saved_positions:
+            self.saved_positions[new_key] = self.saved_positions.pop(old_key)
+
+    def forget(self, key):
+        self.priorities.pop(key, None)
+        self.saved_positions.pop(key, None)
+
+    def restore_order(self, items):
+        """Sort (key, params) pairs into the saved queue order; unknown ones go last"""
+        def position(item):
+            saved = self.saved_positions.get(item[0], -1)
+            return (saved < 0, saved)
+        return sorted(items, key=position)
+
+    def apply(self, entries):
+        """Reorder the queued torrents of (key, handle) entries into priority bands
+
+        Within a band the current queue order is kept. Torrents are moved to
+        the bottom one by one in the wanted order, which only happens when
+        the order is actually wrong.
+        """
+        queued = [(handle.queue_position(), key, handle) for key, handle in entries if handle.is_valid()]
+        queued = sorted(entry for entry in queued if entry[0] >= 0)
+        wanted = sorted(queued, key=lambda entry: PRIORITIES.index(self.priority(entry[1])))
+        if [entry[1] for entry in wanted] == [entry[1] for entry in queued]:
+            return False
+        for _, _, handle in wanted:
+            handle.queue_position_bottom()
+        return True
+
+    def move(self, handle, action, entries):
+        """Move a torrent within its priority band"""
+        if action not in MOVES:
+            raise QueueError(f"Action must be one of: {', '.join(MOVES)}")
+        getattr(handle, f'queue_position_{action}')()
+        self.apply(entries)
+
+    def save(self, entries):
+        """Write priorities and queue positions for the given (key, handle) entries"""
+        with self._save_lock:
+            state = {}
+            for key, handle in entries:
+                if handle.is_valid():
+                    state[key] = {'priority': self.priority(key), 'queue_position': handle.queue_position()}
+            save_config(self.path, state)
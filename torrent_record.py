@@ -0,0 +1,116 @@
+"""
+Per-torrent state kept by the torrent manager.
+
+Every torrent in the session has one TorrentRecord holding the handle, the
+fields shown by the API and a little bookkeeping. It uses __slots__, so a
+record is a fixed-size object instead of a dict with a hash table of its
+own, and it stores values the way the API returns them (rates in KB/s and
+progress already rounded, the added time already formatted). update()
+copies a libtorrent torrent_status into the record and reports whether
+any API field changed; to_dict() is the one serializer used by the
+torrents API, the event stream and the queue view.
+"""
+
+from datetime import datetime
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def torrent_state(status):
+    """The API status string for a libtorrent torrent_status"""
+    if status.is_seeding:
+        return 'seeding'
+    if status.is_finished:
+        return 'completed'
+    if status.paused and status.auto_managed:
+        # Waiting for a free slot in the download queue
+        return 'queued'
+    if status.paused:
+        return 'paused'
+    return 'downloading'
+
+
+class TorrentRecord:
+    """One torrent's handle, API fields and cached file list"""
+
+    __slots__ = (
+        'id', 'handle', 'added_time', 'name', 'size', 'progress', 'download_rate', 'upload_rate',
+        'status', 'peers', 'seeds', 'priority', 'queue_position', 'is_finished', 'has_metadata',
+        'download_files', 'info_hashes', 'indexed', 'label',
+    )
+
+    def __init__(self, torrent_id, handle, added_time, priority, label=None):
+        self.id = torrent_id
+        self.handle = handle
+        self.added_time = (added_time or datetime.now()).strftime(TIME_FORMAT)
+        self.name = f"Torrent {torrent_id[:8]}"
+        self.size = 0
+        self.progress = 0
+        self.download_rate = 0
+        self.upload_rate = 0
+        self.status = 'downloading'
+        self.peers = 0
+        self.seeds = 0
+        self.priority = priority
+        self.queue_position = -1
+        self.is_finished = False
+        self.has_metadata = False
+        self.download_files = None  # Built once the torrent is finished
+        self.info_hashes = ()  # Every hash the torrent is indexed under
+        self.indexed = False  # Whether its files were added to the file index
+        self.label = label  # Bandwidth label
+
+    def update(self, status):
+        """Copy a torrent_status into the record; returns True when an API field changed"""
+        has_metadata = status.has_metadata
+        is_finished = status.is_finished
+        progress = status.progress
+        download_rate = status.download_rate
+        upload_rate = status.upload_rate
+        values = (
+            status.name if has_metadata else self.name,
+            status.total_wanted if has_metadata else self.size,
+            round(progress * 100, 2) if progress else 0,
+            round(download_rate / 1024, 2) if download_rate else 0,  # KB/s
+            round(upload_rate / 1024, 2) if upload_rate else 0,  # KB/s
+            torrent_state(status),
+            status.num_peers,
+            status.num_seeds,
+            status.queue_position,
+            is_finished,
+            has_metadata,
+        )
+        current = (self.name, self.size, self.progress, self.download_rate, self.upload_rate, self.status,
+                   self.peers, self.seeds, self.queue_position, self.is_finished, self.has_metadata)
+        if values == current:
+            return False
+        (self.name, self.size, self.progress, self.download_rate, self.upload_rate, self.status,
+         self.peers, self.seeds, self.queue_position, self.is_finished, self.has_metadata) = values
+        return True
+
+    @property
+    def files_pending(self):
+        """Whether the record is finished but its file list hasn't been built yet"""
+        return self.is_finished and self.has_metadata and self.download_files is None
+
+    def to_dict(self, include_files=True):
+        """The API view of the torrent"""
+        view = {
+            'id': self.id,
+            'name': self.name,
+            'size': self.size,
+            'progress': self.progress,
+            'download_rate': self.download_rate,
+            'upload_rate': self.upload_rate,
+            'status': self.status,
+            'peers': self.peers,
+            'seeds': self.seeds,
+            'priority': self.priority,
+            'label': self.label,
+            'queue_position': self.queue_position,
+            'added_time': self.added_time,
+        }
+        if include_files:
+            finished = self.is_finished and self.has_metadata
+            view['download_files'] = (self.download_files or []) if finished else []
+        return view
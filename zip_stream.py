@@ -0,0 +1,586 @@
+"""
+Streaming ZIP archive writer.
+
+Archives are produced as a generator of byte chunks so a folder can be sent
+to the client while it is being read from disk, instead of being built in
+memory first. Every member is followed by a data descriptor carrying its
+CRC32 and sizes, and the central directory is written once all members have
+been streamed. ZIP64 records are used automatically for large members and
+large archives.
+
+Each member is either deflated or stored as-is depending on a compression
+policy, so already-compressed media isn't recompressed for no gain. With
+more than one worker, members are split into blocks that are deflated in
+parallel on a thread pool (zlib releases the GIL) and stitched back into a
+single deflate stream per member, the same way pigz does.
+
+Archives whose members are all stored have a layout that depends only on
+the names, sizes and timestamps of the files. ZipManifest computes that
+layout so the archive can be served with an exact Content-Length and read
+at any byte offset, which is what HTTP Range requests need to resume a
+download.
+"""
+
+import bisect
+import hashlib
+import mimetypes
+import os
+import struct
+import time
+import threading
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from zipfile import ZIP_STORED, ZIP_DEFLATED
+
+CHUNK_SIZE = 1024 * 1024  # 1MB read size
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_FILECOUNT_LIMIT = 0xFFFF
+
+# Record layouts, matching the ones used by the zipfile module
+_LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+_CENTRAL_HEADER = struct.Struct('<4s4B4HL2L5H2L')
+_DATA_DESCRIPTOR = struct.Struct('<4sLLL')
+_DATA_DESCRIPTOR64 = struct.Struct('<4sLQQ')
+_ZIP64_END = struct.Struct('<4sQ2H2L4Q')
+_ZIP64_LOCATOR = struct.Struct('<4sLQL')
+_END_RECORD = struct.Struct('<4s4H2LH')
+
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_VERSION_DEFAULT = 20
+_VERSION_ZIP64 = 45
+_CREATE_SYSTEM_UNIX = 3
+_FILE_ATTRIBUTES = 0o100644 << 16
+
+# Compression policies accepted by the ZIP download endpoints
+COMPRESSION_MODES = ('auto', 'store', 'deflate')
+
+# Formats that are already compressed and gain nothing from deflate
+COMPRESSED_EXTENSIONS = {
+    '.zip', '.rar', '.7z', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.lz4', '.cab',
+    '.mkv', '.mp4', '.m4v', '.avi', '.webm', '.mov', '.wmv', '.flv', '.ts',
+    '.mp3', '.flac', '.aac', '.ogg', '.opus', '.m4a', '.wma',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic',
+    '.epub', '.docx', '.xlsx', '.pptx', '.jar', '.apk',
+}
+COMPRESSED_MIME_PREFIXES = ('video/', 'audio/', 'image/')
+# Media types under those prefixes that are usually uncompressed
+UNCOMPRESSED_MEDIA_TYPES = {'image/bmp', 'image/x-ms-bmp', 'image/tiff', 'image/svg+xml', 'audio/x-wav', 'audio/wav'}
+
+# Share of an archive's bytes in compressed formats from which 'auto' stores
+# every member, including the few small text files (.nfo, .srt, .txt) a
+# media folder usually has
+MOSTLY_COMPRESSED_RATIO = 0.9
+
+PROBE_SAMPLE_SIZE = 64 * 1024  # Bytes read from each probe position
+PROBE_MIN_RATIO = 0.9  # Deflate only if a sample shrinks below this ratio
+
+DEFLATE_WINDOW = 32 * 1024  # History carried between parallel deflate blocks
+BLOCKS_IN_FLIGHT_PER_WORKER = 4  # Bounds memory held by the parallel pipeline
+
+CRC_CACHE_SIZE = 100000  # File CRC32s remembered across archive requests
+MANIFEST_CACHE_SIZE = 32  # Stored-archive layouts remembered across requests
+
+
+def _dos_datetime(timestamp):
+    """Convert a POSIX timestamp into the (time, date) pair used by ZIP headers"""
+    t = time.localtime(timestamp)
+    if t.tm_year < 1980:
+        return 0, (0 << 9) | (1 << 5) | 1
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def probe_compressibility(path, size):
+    """Estimate the deflate ratio of a file from samples at its start, middle and end"""
+    if size <= 3 * PROBE_SAMPLE_SIZE:
+        slices = [(0, size)]
+    else:
+        slices = [(0, PROBE_SAMPLE_SIZE), (size // 2, PROBE_SAMPLE_SIZE), (size - PROBE_SAMPLE_SIZE, PROBE_SAMPLE_SIZE)]
+    sample = b''
+    with open(path, 'rb') as f:
+        for position, length in slices:
+            f.seek(position)
+            sample += f.read(length)
+    if not sample:
+        return 1.0
+    return len(zlib.compress(sample, 1)) / len(sample)
+
+
+def is_compressed_format(path):
+    """Whether a file is in a format known to be compressed already (by extension or mime type)"""
+    if os.path.splitext(path)[1].lower() in COMPRESSED_EXTENSIONS:
+        return True
+    mime_type, _ = mimetypes.guess_type(path)
+    return bool(mime_type and mime_type.startswith(COMPRESSED_MIME_PREFIXES)
+                and mime_type not in UNCOMPRESSED_MEDIA_TYPES)
+
+
+def archive_compression(files, mode='auto'):
+    """The compression mode for an archive of (path, size) files
+
+    In 'auto' mode an archive that is mostly already-compressed media is
+    stored entirely: deflating its small text members saves next to
+    nothing, and an all-stored archive can be sent with a Content-Length
+    and resumed (see ZipManifest).
+    """
+    if mode != 'auto':
+        return mode
+    total = sum(size for _, size in files)
+    compressed = sum(size for path, size in files if is_compressed_format(path))
+    return 'store' if total and compressed >= total * MOSTLY_COMPRESSED_RATIO else 'auto'
+
+
+def choose_compress_type(path, size, mode='auto'):
+    """Pick ZIP_STORED or ZIP_DEFLATED for a file under the given compression mode
+
+    'store' and 'deflate' force a method. 'auto' stores formats that are
+    known to be compressed already (by extension or mime type, as in the
+    file info API), deflates text, and probes anything else.
+    """
+    if mode == 'store':
+        return ZIP_STORED
+    if mode == 'deflate':
+        return ZIP_DEFLATED
+
+    if is_compressed_format(path):
+        return ZIP_STORED
+    mime_type, _ = mimetypes.guess_type(path)
+    if mime_type and mime_type.startswith('text/'):
+        return ZIP_DEFLATED
+
+    try:
+        ratio = probe_compressibility(path, size)
+    except OSError:
+        return ZIP_DEFLATED
+    return ZIP_DEFLATED if ratio < PROBE_MIN_RATIO else ZIP_STORED
+
+
+def _deflate_block(data, zdict, level, final):
+    """Deflate one block of a member as part of a larger raw deflate stream
+
+    Non-final blocks end with a sync flush so they stop on a byte boundary,
+    and the previous block's tail is used as the preset dictionary so matches
+    can still reach back across block boundaries. Concatenating the outputs
+    in order gives a valid deflate stream for the whole member.
+    """
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class ZipMember:
+    """A file queued for inclusion in a streamed archive"""
+
+    def __init__(self, path, arcname, size, mtime, compress_type=ZIP_DEFLATED):
+        self.path = path
+        self.arcname = arcname.replace(os.sep, '/')
+        self.size = size
+        self.mtime = mtime
+        self.compress_type = compress_type
+        self.crc = 0
+        self.compressed_size = 0
+        self.header_offset = 0
+
+    @property
+    def encoded_name(self):
+        return self.arcname.encode('utf-8')
+
+    @property
+    def flag_bits(self):
+        flags = _FLAG_DATA_DESCRIPTOR
+        if not self.arcname.isascii():
+            flags |= _FLAG_UTF8
+        return flags
+
+    @property
+    def zip64(self):
+        # Deflate can expand incompressible data slightly, so leave headroom
+        # the same way zipfile does when it decides on ZIP64 up front
+        return self.size * 1.05 > ZIP64_LIMIT
+
+    def local_header(self):
+        name = self.encoded_name
+        dos_time, dos_date = _dos_datetime(self.mtime)
+        if self.zip64:
+            extra = struct.pack('<HHQQ', 1, 16, 0, 0)
+            version = _VERSION_ZIP64
+            size_field = ZIP64_LIMIT
+        else:
+            extra = b''
+            version = _VERSION_DEFAULT
+            size_field = 0
+        header = _LOCAL_HEADER.pack(
+            b'PK\003\004', version, 0, self.flag_bits, self.compress_type,
+            dos_time, dos_date, 0, size_field, size_field, len(name), len(extra)
+        )
+        return header + name + extra
+
+    def data_descriptor(self):
+        if self.zip64:
+            return _DATA_DESCRIPTOR64.pack(b'PK\007\010', self.crc, self.compressed_size, self.size)
+        return _DATA_DESCRIPTOR.pack(b'PK\007\010', self.crc, self.compressed_size, self.size)
+
+    def central_header(self):
+        name = self.encoded_name
+        dos_time, dos_date = _dos_datetime(self.mtime)
+
+        zip64_fields = []
+        file_size = self.size
+        compressed_size = self.compressed_size
+        header_offset = self.header_offset
+        if file_size >= ZIP64_LIMIT:
+            zip64_fields.append(file_size)
+            file_size = ZIP64_LIMIT
+        if compressed_size >= ZIP64_LIMIT:
+            zip64_fields.append(compressed_size)
+            compressed_size = ZIP64_LIMIT
+        if header_offset >= ZIP64_LIMIT:
+            zip64_fields.append(header_offset)
+            header_offset = ZIP64_LIMIT
+
+        if zip64_fields:
+            extra = struct.pack('<HH' + 'Q' * len(zip64_fields), 1, 8 * len(zip64_fields), *zip64_fields)
+        else:
+            extra = b''
+        version = _VERSION_ZIP64 if (zip64_fields or self.zip64) else _VERSION_DEFAULT
+
+        header = _CENTRAL_HEADER.pack(
+            b'PK\001\002', version, _CREATE_SYSTEM_UNIX, version, 0, self.flag_bits,
+            self.compress_type, dos_time, dos_date, self.crc, compressed_size, file_size,
+            len(name), len(extra), 0, 0, 0, _FILE_ATTRIBUTES, header_offset
+        )
+        return header + name + extra
+
+
+def _end_of_archive(entry_count, cd_offset, cd_size, comment=b''):
+    """Build the (ZIP64) end of central directory records"""
+    records = b''
+    if entry_count >= ZIP_FILECOUNT_LIMIT or cd_offset >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT:
+        zip64_end_offset = cd_offset + cd_size
+        records += _ZIP64_END.pack(
+            b'PK\006\006', _ZIP64_END.size - 12, _VERSION_ZIP64, _VERSION_ZIP64,
+            0, 0, entry_count, entry_count, cd_size, cd_offset
+        )
+        records += _ZIP64_LOCATOR.pack(b'PK\006\007', 0, zip64_end_offset, 1)
+        entry_count = min(entry_count, ZIP_FILECOUNT_LIMIT)
+        cd_offset = min(cd_offset, ZIP64_LIMIT)
+        cd_size = min(cd_size, ZIP64_LIMIT)
+    records += _END_RECORD.pack(
+        b'PK\005\006', 0, 0, entry_count, entry_count, cd_size, cd_offset, len(comment)
+    )
+    return records + comment
+
+
+class ZipStream:
+    """Builds a ZIP archive incrementally as an iterable of byte chunks
+
+    Files are added with add_file() and the archive is produced by iterating
+    over the stream. Only one read chunk per member is held in memory at a
+    time, so memory use does not depend on the size of the archive.
+
+    The compression mode ('auto', 'store' or 'deflate') decides per member
+    whether it is deflated; see choose_compress_type(). With workers > 1,
+    chunk_size blocks from upcoming members are deflated concurrently while
+    the archive is written in order.
+    """
+
+    def __init__(self, compresslevel=6, chunk_size=CHUNK_SIZE, compression='auto', workers=1):
+        if compression not in COMPRESSION_MODES:
+            raise ValueError(f"Unknown compression mode: {compression}")
+        self.compresslevel = compresslevel
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.workers = workers
+        self.members = []
+        self.written = []
+        self.offset = 0
+
+    def add_file(self, path, arcname, compress_type=None):
+        """Queue a file for the archive, raising OSError if it can't be stat'ed"""
+        stat = os.stat(path)
+        if compress_type is None:
+            compress_type = choose_compress_type(path, stat.st_size, self.compression)
+        member = ZipMember(path, arcname, stat.st_size, stat.st_mtime, compress_type)
+        self.members.append(member)
+        return member
+
+    @property
+    def total_size(self):
+        """Uncompressed size of all queued members"""
+        return sum(m.size for m in self.members)
+
+    @property
+    def bytes_saved(self):
+        """Bytes saved by compression over the members written so far"""
+        return sum(m.size - m.compressed_size for m in self.written)
+
+    def summary(self):
+        stored = sum(1 for m in self.written if m.compress_type == ZIP_STORED)
+        return (f"{len(self.written)} files, {stored} stored, "
+                f"{self.bytes_saved} bytes saved by compression")
+
+    def __iter__(self):
+        return self.generate()
+
+    def generate(self):
+        """Yield the archive as a sequence of byte chunks"""
+        if self.workers > 1:
+            yield from self._generate_parallel()
+        else:
+            for member in self.members:
+                try:
+                    f = open(member.path, 'rb')
+                except OSError as e:
+                    print(f"Warning: Could not add file {member.path} to ZIP: {e}")
+                    continue
+                with f:
+                    member.header_offset = self.offset
+                    yield self._emit(member.local_header())
+                    for chunk in self._member_data(member, f):
+                        yield self._emit(chunk)
+                    yield self._emit(member.data_descriptor())
+                self.written.append(member)
+        yield from self._generate_central_directory()
+
+    def _generate_parallel(self):
+        """Write members in order while their blocks are deflated on a thread pool"""
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='zip-deflate')
+        try:
+            for member, block, future, first, last in self._pipeline(pool):
+                if first:
+                    member.header_offset = self.offset
+                    member.crc = 0
+                    member.compressed_size = 0
+                    yield self._emit(member.local_header())
+                member.crc = zlib.crc32(block, member.crc)
+                data = future.result() if future else block
+                if data:
+                    member.compressed_size += len(data)
+                    yield self._emit(data)
+                if last:
+                    yield self._emit(member.data_descriptor())
+                    self.written.append(member)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _pipeline(self, pool):
+        """Read members block by block, submitting deflate work ahead of the writer
+
+        Yields (member, block, future, first, last) in archive order, keeping
+        at most BLOCKS_IN_FLIGHT_PER_WORKER blocks per worker in flight.
+        """
+        pending = deque()
+        limit = self.workers * BLOCKS_IN_FLIGHT_PER_WORKER
+        for member in self.members:
+            try:
+                f = open(member.path, 'rb')
+            except OSError as e:
+                print(f"Warning: Could not add file {member.path} to ZIP: {e}")
+                continue
+            with f:
+                deflate = member.compress_type == ZIP_DEFLATED
+                remaining = member.size
+                zdict = b''
+                first = True
+                while True:
+                    block = f.read(min(self.chunk_size, remaining)) if remaining else b''
+                    if remaining and not block:
+                        raise IOError(f"{member.path} shrank while it was being archived")
+                    remaining -= len(block)
+                    last = remaining == 0
+                    future = None
+                    if deflate:
+                        future = pool.submit(_deflate_block, block, zdict, self.compresslevel, last)
+                        zdict = block[-DEFLATE_WINDOW:]
+                    pending.append((member, block, future, first, last))
+                    first = False
+                    while len(pending) > limit:
+                        yield pending.popleft()
+                    if last:
+                        break
+        while pending:
+            yield pending.popleft()
+
+    def _generate_central_directory(self):
+        cd_offset = self.offset
+        central_directory = b''.join(m.central_header() for m in self.written)
+        yield self._emit(central_directory)
+        # The comment reports the compression savings, which are only known now
+        comment = self.summary().encode('utf-8')
+        yield self._emit(_end_of_archive(len(self.written), cd_offset, len(central_directory), comment))
+
+    def _emit(self, data):
+        self.offset += len(data)
+        return data
+
+    def _member_data(self, member, f):
+        """Read a member's file and yield its (compressed) data"""
+        if member.compress_type == ZIP_DEFLATED:
+            compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -15)
+        else:
+            compressor = None
+
+        crc = 0
+        compressed_size = 0
+        remaining = member.size
+        while remaining > 0:
+            data = f.read(min(self.chunk_size, remaining))
+            if not data:
+                raise IOError(f"{member.path} shrank while it was being archived")
+            remaining -= len(data)
+            crc = zlib.crc32(data, crc)
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                compressed_size += len(data)
+                yield data
+        if compressor:
+            tail = compressor.flush()
+            compressed_size += len(tail)
+            if tail:
+                yield tail
+
+        member.crc = crc
+        member.compressed_size = compressed_size
+
+
+# CRC32s keyed by (path, size, mtime), shared by all manifests
+_crc_cache = OrderedDict()
+# Manifests keyed by the caller's archive key (e.g. the folder path)
+_manifest_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _remember(cache, key, value, limit):
+    with _cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+
+class ZipManifest:
+    """Precomputed layout of an archive whose members are all stored
+
+    The archive is split into segments (local headers, file data, data
+    descriptors and the trailing central directory) with known offsets, so
+    any byte range can be produced by seeking into the right member file.
+    CRC32s are only needed for descriptors and the central directory; they
+    are computed lazily, cached by path, size and mtime, and filled in for
+    free whenever a member's data is streamed in full.
+    """
+
+    def __init__(self, members, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.members = []
+        self.segments = []
+        self.starts = []
+
+        offset = 0
+        for member in members:
+            if member.compress_type != ZIP_STORED:
+                raise ValueError(f"{member.arcname} is not stored; only stored archives have a fixed layout")
+            member.compressed_size = member.size
+            member.header_offset = offset
+            self.members.append(member)
+            offset = self._add_segment(offset, len(member.local_header()), 'header', member)
+            offset = self._add_segment(offset, member.size, 'data', member)
+            offset = self._add_segment(offset, len(member.data_descriptor()), 'descriptor', member)
+
+        # CRCs don't change the length of the central directory, so it can
+        # be sized now and built only when a range actually reaches it
+        self.cd_offset = offset
+        self.cd_size = sum(len(m.central_header()) for m in self.members)
+        self.comment = (f"{len(self.members)} files, {len(self.members)} stored, "
+                        f"0 bytes saved by compression").encode('utf-8')
+        tail_size = self.cd_size + len(_end_of_archive(len(self.members), self.cd_offset, self.cd_size, self.comment))
+        self.size = self._add_segment(offset, tail_size, 'tail', None)
+
+        signature = repr([(m.arcname, m.size, m.mtime) for m in self.members])
+        self.etag = hashlib.sha1(signature.encode('utf-8')).hexdigest()[:16]
+
+    def _add_segment(self, offset, length, kind, member):
+        self.starts.append(offset)
+        self.segments.append((offset, offset + length, kind, member))
+        return offset + length
+
+    @staticmethod
+    def _crc_key(member):
+        return (member.path, member.size, member.mtime)
+
+    def _ensure_crc(self, member):
+        key = self._crc_key(member)
+        crc = _crc_cache.get(key)
+        if crc is None:
+            crc = 0
+            with open(member.path, 'rb') as f:
+                for data in self._read(member, f, 0, member.size):
+                    crc = zlib.crc32(data, crc)
+            _remember(_crc_cache, key, crc, CRC_CACHE_SIZE)
+        member.crc = crc
+
+    def _read(self, member, f, start, stop):
+        f.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            data = f.read(min(self.chunk_size, remaining))
+            if not data:
+                raise IOError(f"{member.path} shrank while it was being archived")
+            remaining -= len(data)
+            yield data
+
+    def _member_data(self, member, start, stop):
+        with open(member.path, 'rb') as f:
+            if start == 0 and stop == member.size and self._crc_key(member) not in _crc_cache:
+                # Reading the whole member anyway, so pick up its CRC on the way
+                crc = 0
+                for data in self._read(member, f, start, stop):
+                    crc = zlib.crc32(data, crc)
+                    yield data
+                _remember(_crc_cache, self._crc_key(member), crc, CRC_CACHE_SIZE)
+            else:
+                yield from self._read(member, f, start, stop)
+
+    def _tail(self):
+        for member in self.members:
+            self._ensure_crc(member)
+        central_directory = b''.join(m.central_header() for m in self.members)
+        return central_directory + _end_of_archive(len(self.members), self.cd_offset, self.cd_size, self.comment)
+
+    def iter_range(self, start=0, stop=None):
+        """Yield the archive bytes in [start, stop)"""
+        if stop is None:
+            stop = self.size
+        index = max(bisect.bisect_right(self.starts, start) - 1, 0)
+        for seg_start, seg_end, kind, member in self.segments[index:]:
+            if seg_start >= stop:
+                break
+            lo = max(start, seg_start) - seg_start
+            hi = min(stop, seg_end) - seg_start
+            if hi <= lo:
+                continue
+            if kind == 'data':
+                yield from self._member_data(member, lo, hi)
+            elif kind == 'header':
+                yield member.local_header()[lo:hi]
+            elif kind == 'descriptor':
+                self._ensure_crc(member)
+                yield member.data_descriptor()[lo:hi]
+            else:
+                yield self._tail()[lo:hi]
+
+
+def get_manifest(key, members):
+    """Return the cached manifest for an archive key, rebuilding it if any member changed"""
+    signature = [(m.path, m.arcname, m.size, m.mtime, m.compress_type) for m in members]
+    cached = _manifest_cache.get(key)
+    if cached and cached[0] == signature:
+        return cached[1]
+    manifest = ZipManifest(members)
+    _remember(_manifest_cache, key, (signature, manifest), MANIFEST_CACHE_SIZE)
+    return manifest